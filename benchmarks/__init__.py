@@ -0,0 +1 @@
+"""Benchmarks of the IceFlix services, run locally on loopback."""
@@ -0,0 +1,116 @@
+"""Announcement load test of the Main service, one event per service against
+batched announcements.
+
+Main runs in this process along with the stand-in services, which are
+announced for several rounds: first one event per service every
+`--legacy-period` seconds, as with `announce`, and then in batches of
+`--batch` services every `--period` seconds, as with `announceBatch`. Each
+round is timed, and the events and dispatch time per second of each way are
+derived from the periods. Results are printed and written as JSON to the
+file given with `--output`.
+
+Example:
+
+    python -m benchmarks.announce_bench --services 3000 --batch 100 --period 30 \\
+        --output results.json
+"""
+
+import argparse
+import platform
+import resource
+import sys
+import time
+
+import Ice
+
+from benchmarks.main_bench import cpu_seconds
+from benchmarks.stubs import LocalAnnouncer, server_init_data, start_main, write_results
+from iceflix.main import ANNOUNCE_PERIOD
+
+
+def measure(announce_round, rounds, events, period):
+    """Time the rounds of announcements. Returns the load they put on Main."""
+    announce_round()
+    cpu_before = cpu_seconds(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        announce_round()
+    round_seconds = (time.perf_counter() - started) / rounds
+    round_cpu = (cpu_seconds(resource.RUSAGE_SELF) - cpu_before) / rounds
+    return {
+        "period_seconds": period,
+        "events_per_round": events,
+        "round_seconds": round_seconds,
+        "round_cpu_seconds": round_cpu,
+        "events_per_second": events / period,
+        "busy_fraction": round_seconds / period,
+        "cpu_fraction": round_cpu / period,
+    }
+
+
+def run_benchmark(args):
+    """Run the benchmark described by the arguments. Returns the results."""
+    with Ice.initialize(server_init_data(args.server_threads)) as communicator:
+        servant, adapter, _, announcement = start_main(communicator)
+        announcer = LocalAnnouncer(adapter, announcement, args.services // 3)
+        services = len(announcer.services)
+        results = {
+            "announce": measure(announcer.announce_all, args.rounds, services,
+                args.legacy_period),
+            "announceBatch": measure(
+                lambda: announcer.announce_batches(args.batch, args.period), args.rounds,
+                -(-services // args.batch), args.period),
+        }
+        registry_sizes = {kind: len(registry) for kind, registry in servant.registries.items()}
+        servant.shutdown()
+    return {
+        "benchmark": "announce",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "ice": Ice.stringVersion(),
+        "parameters": vars(args),
+        "services": services,
+        "registry_sizes": registry_sizes,
+        "load": results,
+        "events_reduction": results["announce"]["events_per_second"]
+            / results["announceBatch"]["events_per_second"],
+        "cpu_reduction": results["announce"]["cpu_fraction"]
+            / max(results["announceBatch"]["cpu_fraction"], 1e-9),
+    }
+
+
+def parse_args(argv):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--services", type=int, default=3000,
+        help="stand-in services, split among the three kinds (default: %(default)s)")
+    parser.add_argument("--batch", type=int, default=100,
+        help="services announced in each batch (default: %(default)s)")
+    parser.add_argument("--period", type=float, default=30.0,
+        help="maximum seconds between batched announcements (default: %(default)s)")
+    parser.add_argument("--legacy-period", type=float, default=ANNOUNCE_PERIOD,
+        help="seconds between announcements of each service (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=5,
+        help="rounds of announcements timed (default: %(default)s)")
+    parser.add_argument("--server-threads", type=int, default=2,
+        help="threads dispatching requests in Main (default: %(default)s)")
+    parser.add_argument("--output", help="file where the JSON results are written")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and report its results."""
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    for operation, load in results["load"].items():
+        print(f"{operation}: {load['events_per_second']:.1f} events/s, "
+              f"{load['round_seconds'] * 1e3:.1f} ms per round, "
+              f"{100 * load['cpu_fraction']:.2f}% CPU")
+    print(f"{results['events_reduction']:.0f}x fewer events, "
+          f"{results['cpu_reduction']:.1f}x less CPU")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Query latency test of the catalog indexes, against scanning every tile.
+
+A CatalogIndex is filled in this process with random names and per-user
+tags, and then queried by name and by tags. The same queries are answered
+by a naive scan of the tiles, so both can be compared. Results are printed
+and written as JSON to the file given with `--output`.
+
+Example:
+
+    python -m benchmarks.catalog_bench --tiles 300000 --queries 1000 --output results.json
+"""
+
+import argparse
+import platform
+import random
+import sys
+import time
+
+from benchmarks.main_bench import percentile
+from benchmarks.stubs import write_results
+from iceflix.catalog_index import CatalogIndex
+
+SYLLABLES = [consonant + vowel for consonant in "bcdfghjklmnprstvz" for vowel in "aeiou"]
+
+
+def random_vocabulary(rng, size):
+    """Return a list of random words made of two to four syllables."""
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(size)]
+
+
+def random_name(rng, vocabulary):
+    """Return a random name of two or three words."""
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 3))).title()
+
+
+def build(args, rng):
+    """Return an index filled with random tiles and tags, along with the
+    tiles as (media ID, name, tags per user) for the naive scan."""
+    index = CatalogIndex()
+    tiles = []
+    tags = [f"tag{number}" for number in range(args.tags)]
+    vocabulary = random_vocabulary(rng, args.words)
+    for number in range(args.tiles):
+        media_id = f"{number:064x}"
+        name = random_name(rng, vocabulary)
+        user_tags = {f"user{rng.randrange(args.users)}": rng.sample(tags, 3)
+            for _ in range(args.tagged_by)}
+        index.add_media(media_id, "service")
+        index.rename(media_id, name)
+        for user, own in user_tags.items():
+            index.add_tags(user, media_id, own)
+        tiles.append((media_id, name, user_tags))
+    return index, tiles, tags
+
+
+def naive_query(tiles, query):
+    """Answer a query by checking every tile."""
+    kind, *arguments = query
+    if kind == "name":
+        name, exact = arguments
+        name = name.casefold()
+        if exact:
+            return [media_id for media_id, tile_name, _ in tiles if tile_name.casefold() == name]
+        return [media_id for media_id, tile_name, _ in tiles if name in tile_name.casefold()]
+    user, tags, include_all = arguments
+    check = all if include_all else any
+    return [media_id for media_id, _, user_tags in tiles
+        if user in user_tags and check(tag in user_tags[user] for tag in tags)]
+
+
+def indexed_query(index, query):
+    """Answer a query with the indexes."""
+    kind, *arguments = query
+    if kind == "name":
+        return index.by_name(*arguments)
+    return index.by_tags(*arguments)
+
+
+def random_queries(args, rng, tiles, tags):
+    """Return random queries of every kind, grouped by kind."""
+    def name_part(length):
+        name = rng.choice(tiles)[1]
+        start = rng.randrange(max(1, len(name) - length))
+        return name[start:start + length]
+    return {
+        "name_exact": [("name", rng.choice(tiles)[1].lower(), True)
+            for _ in range(args.queries)],
+        "name_substring": [("name", name_part(6), False) for _ in range(args.queries)],
+        "name_trigram": [("name", name_part(3), False) for _ in range(args.queries)],
+        "name_short": [("name", name_part(2), False) for _ in range(args.queries // 10 or 1)],
+        "tags_any": [("tags", f"user{rng.randrange(args.users)}", rng.sample(tags, 2), False)
+            for _ in range(args.queries)],
+        "tags_all": [("tags", f"user{rng.randrange(args.users)}", rng.sample(tags, 2), True)
+            for _ in range(args.queries)],
+    }
+
+
+def measure(answer, queries):
+    """Return the latency percentiles and mean results of the queries."""
+    latencies, results = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        results += len(answer(query))
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "queries": len(queries),
+        "mean_results": results / len(queries),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+    }
+
+
+def run_benchmark(args):
+    """Run the benchmark described by the arguments. Returns the results."""
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    index, tiles, tags = build(args, rng)
+    build_seconds = time.perf_counter() - started
+    queries = random_queries(args, rng, tiles, tags)
+    results = {"indexed": {kind: measure(lambda query: indexed_query(index, query), batch)
+        for kind, batch in queries.items()}}
+    if args.naive:
+        results["naive"] = {kind: measure(lambda query: naive_query(tiles, query),
+            batch[:args.naive_queries]) for kind, batch in queries.items()}
+    return {
+        "benchmark": "catalog",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+        "build_seconds": build_seconds,
+        "latency_seconds": results,
+    }
+
+
+def parse_args(argv):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--tiles", type=int, default=100000,
+        help="media in the catalog (default: %(default)s)")
+    parser.add_argument("--words", type=int, default=20000,
+        help="distinct words in the names (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=1000,
+        help="users tagging media (default: %(default)s)")
+    parser.add_argument("--tags", type=int, default=50,
+        help="distinct tags (default: %(default)s)")
+    parser.add_argument("--tagged-by", type=int, default=2,
+        help="users tagging each media (default: %(default)s)")
+    parser.add_argument("--queries", type=int, default=1000,
+        help="queries of each kind (default: %(default)s)")
+    parser.add_argument("--naive", action=argparse.BooleanOptionalAction, default=True,
+        help="also answer the queries by scanning every tile (default: %(default)s)")
+    parser.add_argument("--naive-queries", type=int, default=20,
+        help="queries of each kind answered by scanning (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+        help="seed of the random catalog and queries (default: %(default)s)")
+    parser.add_argument("--output", help="file where the JSON results are written")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and report its results."""
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    print(f"{args.tiles} tiles indexed in {results['build_seconds']:.1f} s")
+    for method, kinds in results["latency_seconds"].items():
+        for kind, latency in kinds.items():
+            print(f"{method} {kind}: p50 {latency['p50'] * 1e3:.3f} ms, "
+                  f"p99 {latency['p99'] * 1e3:.3f} ms, "
+                  f"{latency['mean_results']:.1f} results")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
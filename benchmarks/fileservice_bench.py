@@ -0,0 +1,189 @@
+"""Throughput test of the FileService, memory-mapped against read-per-chunk.
+
+The FileService and a stand-in Authenticator run in this process on
+loopback. Clients run in separate processes, each of them streaming the same
+file over and over until the duration is over. Two handlers are measured in
+turn: the memory-mapped FileHandler with its token cache, and a naive
+handler which reads each chunk from the file and asks the Authenticator
+for every chunk. Results are printed and written as JSON to
+the file given with `--output`.
+
+Example:
+
+    python -m benchmarks.fileservice_bench --size 256 --chunk 262144 \\
+        --processes 4 --duration 10 --output results.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import Ice
+
+import iceflix  # pylint:disable=unused-import
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+from benchmarks.stubs import StubAuthenticator, server_init_data, write_results
+from iceflix.fileservice import FileHandler, FileService
+from iceflix.tokens import TokenCache
+
+HANDLERS = ("mmap", "naive")
+
+
+class NaiveFileHandler(IceFlix.FileHandler):
+    """FileHandler which reads every chunk from the file into a new buffer."""
+
+    def __init__(self, path, tokens, **options):  # pylint:disable=unused-argument
+        self.tokens = tokens
+        self._file = open(path, "rb")  # pylint:disable=consider-using-with
+        self._lock = threading.Lock()
+
+    def receive(self, size, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Read the next chunk of the file."
+        self.tokens.check_user(userToken)
+        with self._lock:
+            return self._file.read(size)
+
+    def close(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Close the file and remove the handler from the adapter."
+        self._file.close()
+        current.adapter.remove(current.id)
+
+
+def client_process(service_proxy, media_id, chunk, duration, results):
+    """Stream the file until the duration is over, and put the bytes, files
+    and elapsed time into the results queue."""
+    properties = Ice.createProperties()
+    properties.setProperty("Ice.MessageSizeMax", "0")
+    init_data = Ice.InitializationData()
+    init_data.properties = properties
+    with Ice.initialize(init_data) as communicator:
+        service = IceFlix.FileServicePrx.uncheckedCast(
+            communicator.stringToProxy(service_proxy))
+        received, files = 0, 0
+        started = time.monotonic()
+        deadline = started + duration
+        while time.monotonic() < deadline:
+            handler = service.openFile(media_id, "token")
+            while data := handler.receive(chunk, "token"):
+                received += len(data)
+            handler.close("token")
+            files += 1
+        results.put((received, files, time.monotonic() - started))
+
+
+def cpu_seconds():
+    """Return the user and system CPU seconds spent by this process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(args, communicator, service, handler):  # pylint:disable=too-many-locals
+    """Stream the file from every client with the given handler. Returns the
+    throughput of the clients and the CPU spent by the FileService."""
+    adapter = communicator.createObjectAdapterWithEndpoints(
+        f"Bench{handler.capitalize()}Adapter", "tcp -h 127.0.0.1")
+    authenticator = IceFlix.AuthenticatorPrx.uncheckedCast(
+        adapter.addWithUUID(StubAuthenticator()))
+    service.handler_class = FileHandler if handler == "mmap" else NaiveFileHandler
+    service.tokens = TokenCache(lambda: authenticator,
+        ttl=args.token_ttl if handler == "mmap" else 0.0)
+    proxy = adapter.addWithUUID(service)
+    adapter.activate()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    clients = [context.Process(target=client_process, args=(
+        communicator.proxyToString(proxy), args.media_id, args.chunk, args.duration,
+        results)) for _ in range(args.processes)]
+    cpu_before = cpu_seconds()
+    for client in clients:
+        client.start()
+    received, files, throughput = 0, 0, 0.0
+    for _ in clients:
+        client_received, client_files, client_elapsed = results.get()
+        received += client_received
+        files += client_files
+        throughput += client_received / client_elapsed
+    for client in clients:
+        client.join()
+    cpu = cpu_seconds() - cpu_before
+    adapter.destroy()
+    return {
+        "bytes": received,
+        "files": files,
+        "mib_per_second": throughput / (1 << 20),
+        "service_cpu_seconds": cpu,
+        "token_checks": service.tokens.misses,
+    }
+
+
+def run_benchmark(args):
+    """Run the benchmark described by the arguments. Returns the results."""
+    init_data = server_init_data(args.server_threads)
+    with tempfile.TemporaryDirectory() as root, Ice.initialize(init_data) as communicator:
+        with open(os.path.join(root, "media"), "wb") as media:
+            for _ in range(args.size):
+                media.write(os.urandom(1 << 20))
+        service = FileService(root, None)
+        service.handler_options = {"read_ahead": args.read_ahead, "chunk_limit": args.chunk}
+        service.scan()
+        args.media_id = next(iter(service.files))
+        handlers = {handler: measure(args, communicator, service, handler)
+            for handler in args.handlers}
+
+    return {
+        "benchmark": "fileservice",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "ice": Ice.stringVersion(),
+        "parameters": vars(args),
+        "handlers": handlers,
+        "service_max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def parse_args(argv):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--size", type=int, default=64,
+        help="size of the streamed file in MiB (default: %(default)s)")
+    parser.add_argument("--chunk", type=int, default=256 << 10,
+        help="bytes asked on each receive (default: %(default)s)")
+    parser.add_argument("--read-ahead", type=int, default=8 << 20,
+        help="bytes prefetched by the mmap handler (default: %(default)s)")
+    parser.add_argument("--token-ttl", type=float, default=5.0,
+        help="seconds a token is cached by the mmap handler (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=2,
+        help="client processes (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+        help="seconds each client streams the file (default: %(default)s)")
+    parser.add_argument("--server-threads", type=int, default=4,
+        help="size of the server thread pool of the FileService (default: %(default)s)")
+    parser.add_argument("--handlers", nargs="+", choices=HANDLERS, default=list(HANDLERS),
+        help="handlers to measure (default: all)")
+    parser.add_argument("--output", help="file where the JSON results are written")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and report its results."""
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    for handler, result in results["handlers"].items():
+        print(f"{handler}: {result['mib_per_second']:.1f} MiB/s, "
+              f"{result['files']} files, FileService CPU {result['service_cpu_seconds']:.2f} s, "
+              f"{result['token_checks']} token checks")
+    print(f"FileService max RSS {results['service_max_rss_kib'] / 1024:.1f} MiB")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Load test of the Main service with local stand-in services.
+
+Main runs in this process on loopback, along with the stand-in services and
+the local announcer. Clients run in separate processes, each of them with
+several threads doing lookups as fast as possible. Results are printed and
+written as JSON to the file given with `--output`.
+
+The logging of Main is off unless `--log-level` is given, in which case it is
+written to `--log-file` through the background queue of the services, or
+directly by the threads logging with `--log-mode direct`.
+
+Example:
+
+    python -m benchmarks.main_bench --services 100 --processes 4 --threads 8 \\
+        --duration 10 --churn 0.1 --output results.json
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+
+import Ice
+
+import iceflix  # pylint:disable=unused-import
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+from benchmarks.stubs import LocalAnnouncer, server_init_data, start_main, write_results
+from iceflix.logs import LOG_FORMAT, parse_level, setup_logging
+
+OPERATIONS = ("getAuthenticator", "getCatalog", "getFileService", "getServices")
+
+
+def percentile(values, fraction):
+    """Return the given percentile of a sorted list of values."""
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def lookup(main_prx, operation):
+    """Make one lookup of the given operation, or of a random one if mixed."""
+    if operation == "mixed":
+        operation = OPERATIONS[int(time.perf_counter_ns()) % len(OPERATIONS)]
+    getattr(main_prx, operation)()
+
+
+def client_process(main_proxy, operation, threads, duration, results):
+    """Do lookups from several threads until the duration is over, and put
+    the latencies, errors and elapsed time into the results queue."""
+    with Ice.initialize() as communicator:
+        main_prx = IceFlix.MainPrx.uncheckedCast(communicator.stringToProxy(main_proxy))
+        main_prx.ice_ping()
+        latencies = []
+        errors = []
+        started = time.monotonic()
+        deadline = started + duration
+
+        def run():
+            own_latencies, own_errors = [], 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    lookup(main_prx, operation)
+                except IceFlix.TemporaryUnavailable:
+                    own_errors += 1
+                own_latencies.append(time.perf_counter() - started)
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results.put((latencies, sum(errors), time.monotonic() - started))
+
+
+def cpu_seconds(who):
+    """Return the user and system CPU seconds spent by `who`."""
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def configure_logging(args):
+    """Configure the logging of Main as given by the arguments."""
+    root = logging.getLogger()
+    if args.log_level is None:
+        root.setLevel(logging.CRITICAL + 1)
+        return
+    handler = logging.FileHandler(args.log_file)
+    if args.log_mode == "queue":
+        setup_logging(args.log_level, handler)
+        return
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(parse_level(args.log_level))
+
+
+def run_benchmark(args):  # pylint:disable=too-many-locals
+    """Run the benchmark described by the arguments. Returns the results."""
+    configure_logging(args)
+    init_data = server_init_data(args.server_threads)
+    init_data.properties.setProperty("Main.Balancing", args.balancing)
+    with Ice.initialize(init_data) as communicator:
+        servant, adapter, main_proxy, announcement = start_main(communicator)
+        announcer = LocalAnnouncer(adapter, announcement, args.services, args.churn)
+        announcer.announce_all()
+        announcer.start(args.announce_period)
+        servant.health_prober.probe()
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        clients = [context.Process(target=client_process, args=(
+            communicator.proxyToString(main_proxy), args.operation, args.threads,
+            args.duration, results)) for _ in range(args.processes)]
+        cpu_before = cpu_seconds(resource.RUSAGE_SELF)
+        started = time.monotonic()
+        for client in clients:
+            client.start()
+        latencies, errors, throughput = [], 0, 0.0
+        for _ in clients:
+            client_latencies, client_errors, client_elapsed = results.get()
+            latencies.extend(client_latencies)
+            errors += client_errors
+            throughput += len(client_latencies) / client_elapsed
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started
+        cpu_main = cpu_seconds(resource.RUSAGE_SELF) - cpu_before
+
+        announcer.stop()
+        registry_sizes = {kind: len(registry) for kind, registry in servant.registries.items()}
+        servant.shutdown()
+
+    latencies.sort()
+    return {
+        "benchmark": "main",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "ice": Ice.stringVersion(),
+        "parameters": vars(args),
+        "lookups": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "lookups_per_second": throughput,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "announcements": announcer.announced,
+        "registry_sizes": registry_sizes,
+        "main_cpu_seconds": cpu_main,
+        "main_cpu_percent": 100 * cpu_main / elapsed if elapsed else 0.0,
+        "clients_cpu_seconds": cpu_seconds(resource.RUSAGE_CHILDREN),
+        "main_max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def parse_args(argv):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--services", type=int, default=10,
+        help="stand-in services of each kind (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=2,
+        help="client processes (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=4,
+        help="lookup threads per client process (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+        help="seconds each client does lookups (default: %(default)s)")
+    parser.add_argument("--operation", choices=OPERATIONS + ("mixed",),
+        default="getAuthenticator", help="lookup operation (default: %(default)s)")
+    parser.add_argument("--churn", type=float, default=0.0,
+        help="fraction of services replaced on each announce period (default: %(default)s)")
+    parser.add_argument("--announce-period", type=float, default=8.0,
+        help="seconds between announcements of each service (default: %(default)s)")
+    parser.add_argument("--balancing", default="round-robin",
+        help="balancing policy of Main (default: %(default)s)")
+    parser.add_argument("--server-threads", type=int, default=2,
+        help="size of the server thread pool of Main (default: %(default)s)")
+    parser.add_argument("--log-level",
+        help="logging level of Main, such as DEBUG or INFO (default: off)")
+    parser.add_argument("--log-file", default=os.devnull,
+        help="file where Main logs (default: %(default)s)")
+    parser.add_argument("--log-mode", choices=("queue", "direct"), default="queue",
+        help="whether records are written by a background thread or by the "
+             "threads logging (default: %(default)s)")
+    parser.add_argument("--output", help="file where the JSON results are written")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and report its results."""
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    latency = results["latency_seconds"]
+    print(f"{results['lookups']} lookups in {results['elapsed_seconds']:.2f} s: "
+          f"{results['lookups_per_second']:.0f} lookups/s, "
+          f"p50 {latency['p50'] * 1e3:.3f} ms, p99 {latency['p99'] * 1e3:.3f} ms, "
+          f"{results['errors']} unavailable")
+    print(f"Main CPU {results['main_cpu_percent']:.0f}%, "
+          f"max RSS {results['main_max_rss_kib'] / 1024:.1f} MiB")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Startup test of the Main service: time from process start to the first
+answered lookup, with each way of loading the Slice bindings.
+
+Main is started in a new process for every run, and Main is asked for an
+Authenticator, as soon as its proxy is logged, until it answers (an
+unavailable service is an answer too). The bindings are loaded with
+`Ice.loadSlice`, generated into an empty cache, loaded from the cache, and
+installed along with the package. Results are printed and written as JSON to
+the file given with `--output`.
+
+By default, Main is started with its stand-in setup, since `iceflix-main`
+needs IceStorm. With IceStorm running, the real command can be measured:
+
+    python -m benchmarks.startup_bench --runs 10 \\
+        --command "iceflix-main --Ice.Config=configs/main.config"
+"""
+
+import argparse
+import logging
+import os
+import platform
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import Ice
+
+import iceflix  # pylint:disable=unused-import
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+from benchmarks.main_bench import percentile
+from benchmarks.stubs import write_results
+from iceflix.bindings import CACHE_VARIABLE, generate
+
+PROXY_LINE = re.compile(r"Main proxy is '(.+)'")
+LOAD_BINDINGS = ("import time; import Ice; started = time.perf_counter(); "
+                 "import iceflix, IceFlix; print(time.perf_counter() - started)")
+
+
+def serve():
+    """Start a stand-in Main and log its proxy, until the standard input is
+    closed."""
+    from iceflix import cli  # pylint:disable=import-outside-toplevel,unused-import
+    from benchmarks.stubs import start_main  # pylint:disable=import-outside-toplevel
+    logging.basicConfig(level=logging.INFO)
+    with Ice.initialize(["--Ice.Default.Host=127.0.0.1"]) as communicator:
+        servant, _, main_proxy, _ = start_main(communicator)
+        logging.info("Main proxy is '%s'", main_proxy)
+        sys.stdin.read()
+        servant.shutdown()
+    return 0
+
+
+def first_lookup(communicator, command, environment, timeout):
+    """Start Main and ask it for an Authenticator until it answers. Returns
+    the seconds until its proxy was logged and until the first answer."""
+    started = time.perf_counter()
+    with subprocess.Popen(command, env=environment, stdin=subprocess.PIPE,  # nosec
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True) as process:
+        try:
+            for line in process.stderr:
+                if match := PROXY_LINE.search(line):
+                    break
+            else:
+                raise RuntimeError("Main exited without logging its proxy")
+            logged = time.perf_counter() - started
+            main_prx = IceFlix.MainPrx.uncheckedCast(communicator.stringToProxy(match.group(1)))
+            while time.perf_counter() - started < timeout:
+                try:
+                    main_prx.getAuthenticator()
+                except IceFlix.TemporaryUnavailable:
+                    pass
+                except Ice.ConnectionRefusedException:  # pylint:disable=no-member
+                    continue
+                return logged, time.perf_counter() - started
+            raise RuntimeError("Main did not answer in time")
+        finally:
+            process.stdin.close()
+            process.terminate()
+
+
+def bindings_load(environment):
+    """Return the seconds taken to load the bindings in a new process."""
+    return float(subprocess.check_output([sys.executable, "-c", LOAD_BINDINGS],  # nosec
+        env=environment))
+
+
+def environments(directory):
+    """Return the environment of Main for each way of loading the bindings."""
+    installed = os.path.join(directory, "installed")
+    os.mkdir(installed)
+    generate(installed)
+    base = dict(os.environ)
+    path = base.get("PYTHONPATH", "")
+    return {
+        "load_slice": {**base, CACHE_VARIABLE: "off"},
+        "cold_cache": {**base, CACHE_VARIABLE: os.path.join(directory, "cold")},
+        "warm_cache": {**base, CACHE_VARIABLE: os.path.join(directory, "warm")},
+        "installed": {**base, CACHE_VARIABLE: "off",
+                      "PYTHONPATH": os.pathsep.join(filter(None, (installed, path)))},
+    }
+
+
+def run_benchmark(args):
+    """Run the benchmark described by the arguments. Returns the results."""
+    command = shlex.split(args.command) if args.command else \
+        [sys.executable, "-m", "benchmarks.startup_bench", "--serve"]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, Ice.initialize() as communicator:
+        for name, environment in environments(directory).items():
+            times, loads = [], []
+            for run in range(args.runs):
+                if name == "cold_cache":
+                    environment[CACHE_VARIABLE] = os.path.join(directory, f"cold{run}")
+                    loads.append(bindings_load(environment))
+                    environment[CACHE_VARIABLE] = os.path.join(directory, f"cold{run}-main")
+                else:
+                    loads.append(bindings_load(environment))
+                times.append(first_lookup(communicator, command, environment, args.timeout))
+            logged = sorted(seconds for seconds, _ in times)
+            answered = sorted(seconds for _, seconds in times)
+            results[name] = {
+                "bindings_load_p50": percentile(sorted(loads), 0.5),
+                "proxy_logged_p50": percentile(logged, 0.5),
+                "first_lookup_p50": percentile(answered, 0.5),
+                "first_lookup_min": answered[0],
+                "first_lookup_max": answered[-1],
+            }
+    return {
+        "benchmark": "startup",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "ice": Ice.stringVersion(),
+        "parameters": vars(args),
+        "seconds": results,
+    }
+
+
+def parse_args(argv):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=5,
+        help="starts of Main measured for each way (default: %(default)s)")
+    parser.add_argument("--command",
+        help="command starting Main, which must log its proxy (default: stand-in Main)")
+    parser.add_argument("--timeout", type=float, default=30.0,
+        help="seconds to wait for the first answer (default: %(default)s)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="file where the JSON results are written")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark and report its results."""
+    args = parse_args(argv)
+    if args.serve:
+        return serve()
+    results = run_benchmark(args)
+    for name, seconds in results["seconds"].items():
+        print(f"{name}: first lookup after {seconds['first_lookup_p50'] * 1e3:.0f} ms "
+              f"(proxy logged after {seconds['proxy_logged_p50'] * 1e3:.0f} ms, "
+              f"bindings loaded in {seconds['bindings_load_p50'] * 1e3:.1f} ms)")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Module containing lightweight stand-in services and a local announcement
+publisher, so benchmarks do not need real services nor IceStorm, along with
+helpers shared by the benchmarks."""
+
+import itertools
+import json
+import threading
+import uuid
+
+import Ice
+
+import iceflix  # pylint:disable=unused-import
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+from iceflix.main import Announcement, Main
+
+
+class StubAuthenticator(IceFlix.Authenticator):
+    """Authenticator which accepts every user and token."""
+
+    def refreshAuthorization(self, user, passwordHash, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return a new token."
+        return uuid.uuid4().hex
+
+    def isAuthorized(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Every token is valid."
+        return True
+
+    def whois(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Every token belongs to the same user."
+        return "user"
+
+    def isAdmin(self, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No token is an admin token."
+        return False
+
+    def addUser(self, user, passwordHash, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Users cannot be added."
+        raise IceFlix.Unauthorized()
+
+    def removeUser(self, user, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Users cannot be removed."
+        raise IceFlix.Unauthorized()
+
+    def bulkUpdate(self, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return empty data."
+        return IceFlix.AuthenticatorData("", {}, {})
+
+    def getChanges(self, knownVersion, current=None):  # pylint:disable=invalid-name, unused-argument
+        "There are no changes."
+        return IceFlix.AuthenticatorChanges(0, 0, None, [])
+
+
+class StubCatalog(IceFlix.MediaCatalog):
+    """MediaCatalog without any media."""
+
+    def getTile(self, mediaId, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+    def getTilesByName(self, name, exact, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        return []
+
+    def getTilesByTags(self, tags, includeAllTags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        return []
+
+    def renameTile(self, mediaId, name, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+    def addTags(self, mediaId, tags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+    def removeTags(self, mediaId, tags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No media is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+    def getAllDeltas(self, current=None):  # pylint:disable=invalid-name, unused-argument
+        "There are no deltas."
+
+
+class StubFileService(IceFlix.FileService):
+    """FileService without any file."""
+
+    def openFile(self, mediaId, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No file is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+    def uploadFile(self, uploader, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Files cannot be uploaded."
+        raise IceFlix.Unauthorized()
+
+    def removeFile(self, mediaId, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "No file is known."
+        raise IceFlix.WrongMediaId(mediaId)
+
+
+STUBS = (StubAuthenticator, StubCatalog, StubFileService)
+
+
+class LocalAnnouncer:  # pylint:disable=too-many-instance-attributes
+    """Announces stand-in services directly to a Main, as IceStorm would.
+
+    Every period all the live services are announced. With churn, a fraction
+    of them is replaced by new services on each period, so the old ones stop
+    being announced and expire in Main."""
+
+    def __init__(self, adapter, announcement, services_per_kind, churn=0.0):
+        self.adapter = adapter
+        self.announcement = announcement
+        self.churn = churn
+        self.services = []
+        self.announced = 0
+        self._ids = itertools.count()
+        self._stopped = threading.Event()
+        self._thread = None
+        for stub in STUBS:
+            for _ in range(services_per_kind):
+                self.services.append(self._create(stub))
+
+    def _create(self, stub):
+        "Add a new stand-in service to the adapter."
+        service_id = f"{stub.__name__}-{next(self._ids)}"
+        proxy = self.adapter.add(stub(), self.adapter.getCommunicator().stringToIdentity(
+            service_id))
+        return stub, service_id, proxy
+
+    def _replace(self):
+        "Replace a fraction of the services by new ones."
+        replaced = int(len(self.services) * self.churn)
+        for position in range(replaced):
+            stub, service_id, _ = self.services[position]
+            self.adapter.remove(self.adapter.getCommunicator().stringToIdentity(service_id))
+            self.services[position] = self._create(stub)
+        self.services = self.services[replaced:] + self.services[:replaced]
+
+    def announce_all(self):
+        """Announce every live service once, in parallel."""
+        futures = [self.announcement.announceAsync(proxy, service_id)
+            for _, service_id, proxy in self.services]
+        for future in futures:
+            future.result()
+        self.announced += len(futures)
+
+    def announce_batches(self, batch_size, period):
+        """Announce every live service once, in batches of the given size
+        announced in parallel."""
+        services = [IceFlix.ServiceAnnouncement(proxy, service_id)
+            for _, service_id, proxy in self.services]
+        futures = [self.announcement.announceBatchAsync(services[start:start + batch_size],
+            period) for start in range(0, len(services), batch_size)]
+        for future in futures:
+            future.result()
+        self.announced += len(services)
+
+    def start(self, period):
+        """Announce the services every period seconds in a background thread."""
+        def run():
+            while not self._stopped.wait(period):
+                if self.churn:
+                    self._replace()
+                self.announce_all()
+        self._thread = threading.Thread(target=run, name="LocalAnnouncer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop announcing."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_main(communicator, endpoints="tcp -h 127.0.0.1", properties=None):
+    """Start a Main servant and its Announcement servant on a new adapter.
+    Returns the servant, the adapter, the Main proxy and the Announcement
+    proxy."""
+    adapter = communicator.createObjectAdapterWithEndpoints("BenchMainAdapter", endpoints)
+    servant = Main()
+    servant.configure(properties or communicator.getProperties())
+    main_proxy = IceFlix.MainPrx.uncheckedCast(adapter.addWithUUID(servant))
+    announcement_proxy = IceFlix.AnnouncementPrx.uncheckedCast(
+        adapter.addWithUUID(Announcement(servant)))
+    adapter.activate()
+    return servant, adapter, main_proxy, announcement_proxy
+
+
+def server_init_data(server_threads):
+    """Return the initialization data of a communicator serving the benchmark
+    with the given number of threads, without any message size limit."""
+    properties = Ice.createProperties()
+    properties.setProperty("Ice.ThreadPool.Server.Size", str(server_threads))
+    properties.setProperty("Ice.ThreadPool.Server.SizeMax", str(server_threads))
+    properties.setProperty("Ice.MessageSizeMax", "0")
+    init_data = Ice.InitializationData()
+    init_data.properties = properties
+    return init_data
+
+
+def write_results(results, path):
+    """Write the results of a benchmark as JSON, if a path is given."""
+    if path:
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
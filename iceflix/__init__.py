@@ -1,10 +1,5 @@
 """iceflix package definition."""
 
-try:
-    import IceFlix
+from iceflix.bindings import load_bindings
 
-except ImportError:
-    import os
-    import Ice
-
-    Ice.loadSlice(os.path.join(os.path.dirname(__file__), "iceflix.ice"))
+load_bindings()
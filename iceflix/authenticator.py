@@ -0,0 +1,385 @@
+"""Module containing an Authenticator with indexed tokens and a change log."""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.client import DiscoveryClient, proxy_key
+from iceflix.main import announce_legacy, announce_period, get_topic, start_announcements
+from iceflix.scheduler import ExpiryScheduler
+
+TOKEN_LIFETIME = 120.0
+COMPACT_EVERY = 1024
+
+
+def load_users(path):
+    """Return the users and password hashes stored in a JSON file, or none if
+    the file does not exist."""
+    try:
+        with open(path, encoding="utf-8") as users_file:
+            return json.load(users_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_users(path, users):
+    """Store the users and password hashes in a JSON file, replacing it at once."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as users_file:
+        json.dump(users, users_file)
+    os.replace(temporary, path)
+
+
+class ChangeLog:
+    """Versioned log of the changes of an Authenticator.
+
+    Every change gets the next version. The last changes are kept, and a
+    snapshot of the state is taken every `compact_every` changes, so a
+    replica catches up with the changes after its version, or with the last
+    snapshot and the changes after it when those are gone. The state is
+    never copied on request."""
+
+    def __init__(self, snapshot, compact_every=COMPACT_EVERY):
+        self.compact_every = compact_every
+        self.version = 0
+        self.snapshot = snapshot
+        self.snapshot_version = 0
+        self._changes = collections.deque(maxlen=2 * compact_every)
+
+    def __len__(self):
+        return len(self._changes)
+
+    @property
+    def due(self):
+        "Whether a snapshot should be taken."
+        return self.version - self.snapshot_version >= self.compact_every
+
+    def append(self, kind, user, value):
+        """Log a change. Returns it."""
+        self.version += 1
+        change = IceFlix.UserChange(self.version, kind, user, value)
+        self._changes.append(change)
+        return change
+
+    def compact(self, snapshot):
+        """Take the given state as the snapshot of the current version."""
+        self.snapshot = snapshot
+        self.snapshot_version = self.version
+
+    def reset(self, snapshot):
+        """Replace the whole log by a snapshot in a new version, so every
+        replica catches up from it."""
+        self.version += 1
+        self._changes.clear()
+        self.compact(snapshot)
+
+    def _after(self, version):
+        "Return the logged changes after the given version."
+        oldest = self.version - len(self._changes)
+        return list(itertools.islice(self._changes, version - oldest, None))
+
+    def changes_since(self, known):
+        """Return the changes a replica which knows the given version lacks."""
+        if self.version - len(self._changes) <= known <= self.version:
+            return IceFlix.AuthenticatorChanges(self.version, known, None, self._after(known))
+        return IceFlix.AuthenticatorChanges(self.version, self.snapshot_version, self.snapshot,
+            self._after(self.snapshot_version))
+
+
+class Authenticator(IceFlix.Authenticator):  # pylint:disable=too-many-instance-attributes
+    """Servant for the IceFlix.Authenticator interface.
+
+    Tokens are indexed by value, so validating one is a dictionary lookup
+    whatever the number of users. Each token expires `lifetime` seconds
+    after it is issued, through a deadline queue. Every change is logged,
+    published on the UserUpdates topic, and offered to other replicas
+    through `getChanges`."""
+
+    def __init__(self, admin_token, users=None, lifetime=TOKEN_LIFETIME,
+            compact_every=COMPACT_EVERY):
+        self.admin_token = admin_token
+        self.lifetime = lifetime
+        self.service_id = ""
+        self.users_file = None
+        self.updates = None
+        self.users = dict(users or {})
+        self.tokens = {}
+        self.user_tokens = {}
+        self._lock = threading.RLock()
+        self._peer_versions = {}
+        self.log = ChangeLog(self.data(), compact_every)
+        self.expiry_scheduler = ExpiryScheduler(self.revoke)
+        self.expiry_scheduler.start()
+
+    def shutdown(self):
+        """Stop expiring tokens."""
+        self.expiry_scheduler.stop()
+
+    def data(self):
+        """Return the whole state as AuthenticatorData."""
+        with self._lock:
+            return IceFlix.AuthenticatorData(self.admin_token, dict(self.users),
+                dict(self.user_tokens))
+
+    def _log(self, kind, user, value):
+        "Log a change, taking a snapshot when due."
+        self.log.append(kind, user, value)
+        if self.log.due:
+            self.log.compact(self.data())
+
+    def _save(self):
+        "Store the users in the users file, if any."
+        if self.users_file is not None:
+            save_users(self.users_file, self.users)
+
+    def _drop_token(self, token):
+        "Remove a token from the indexes. Returns its user, or None if unknown."
+        if (entry := self.tokens.pop(token, None)) is None:
+            return None
+        user = entry[0]
+        if self.user_tokens.get(user) == token:
+            del self.user_tokens[user]
+        self.expiry_scheduler.cancel(token)
+        return user
+
+    def store_token(self, user, token):
+        """Issue a token to a user, replacing the previous one."""
+        with self._lock:
+            if (previous := self.user_tokens.get(user)) is not None:
+                self._drop_token(previous)
+            deadline = time.monotonic() + self.lifetime
+            self.tokens[token] = (user, deadline)
+            self.user_tokens[user] = token
+            self.expiry_scheduler.schedule(token, deadline)
+            self._log(IceFlix.UserChangeKind.NewTokenChange, user, token)
+
+    def revoke(self, token):
+        """Revoke a token, either expired or revoked by another replica."""
+        with self._lock:
+            if (user := self._drop_token(token)) is not None:
+                self._log(IceFlix.UserChangeKind.RevokeTokenChange, user, token)
+
+    def store_user(self, user, password_hash):
+        """Add a user or change its password hash."""
+        with self._lock:
+            self.users[user] = password_hash
+            self._log(IceFlix.UserChangeKind.NewUserChange, user, password_hash)
+            self._save()
+
+    def drop_user(self, user):
+        """Remove a user along with its token."""
+        with self._lock:
+            if (token := self.user_tokens.get(user)) is not None:
+                self.revoke(token)
+            if self.users.pop(user, None) is not None:
+                self._log(IceFlix.UserChangeKind.RemoveUserChange, user, "")
+                self._save()
+
+    def apply(self, change):
+        """Apply a change logged by another replica."""
+        if change.kind == IceFlix.UserChangeKind.NewTokenChange:
+            self.store_token(change.user, change.value)
+        elif change.kind == IceFlix.UserChangeKind.RevokeTokenChange:
+            self.revoke(change.value)
+        elif change.kind == IceFlix.UserChangeKind.NewUserChange:
+            self.store_user(change.user, change.value)
+        elif change.kind == IceFlix.UserChangeKind.RemoveUserChange:
+            self.drop_user(change.user)
+
+    def load(self, data):
+        """Replace the users and tokens by those of a snapshot of another
+        replica. The admin token is kept."""
+        with self._lock:
+            for token in list(self.tokens):
+                self._drop_token(token)
+            self.users = dict(data.currentUsers)
+            deadline = time.monotonic() + self.lifetime
+            for user, token in data.activeTokens.items():
+                self.tokens[token] = (user, deadline)
+                self.user_tokens[user] = token
+                self.expiry_scheduler.schedule(token, deadline)
+            self.log.reset(self.data())
+            self._save()
+
+    def catch_up(self, peer):
+        """Apply the changes of another replica since the last catch-up with
+        it, loading its snapshot first if needed. Returns the number of
+        changes applied."""
+        key = proxy_key(peer)
+        changes = peer.getChanges(self._peer_versions.get(key, -1))
+        with self._lock:
+            if changes.snapshot is not None:
+                self.load(changes.snapshot)
+            for change in changes.changes:
+                self.apply(change)
+            self._peer_versions[key] = changes.version
+        return len(changes.changes)
+
+    def user_of(self, token):
+        """Return the user of a valid token, or None."""
+        entry = self.tokens.get(token)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def refreshAuthorization(self, user, passwordHash, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Issue a new token to the user if the password hash is right."
+        if self.users.get(user) != passwordHash:
+            raise IceFlix.Unauthorized()
+        token = secrets.token_hex(16)
+        self.store_token(user, token)
+        if self.updates is not None:
+            self.updates.newToken(user, token, self.service_id)
+        return token
+
+    def isAuthorized(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return whether the token is valid."
+        return self.user_of(userToken) is not None
+
+    def whois(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the user of the token."
+        if (user := self.user_of(userToken)) is None:
+            raise IceFlix.Unauthorized()
+        return user
+
+    def isAdmin(self, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return whether the token is the admin token."
+        return bool(self.admin_token) and secrets.compare_digest(adminToken.encode(),
+            self.admin_token.encode())
+
+    def addUser(self, user, passwordHash, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Add a user, or change its password hash."
+        if not self.isAdmin(adminToken):
+            raise IceFlix.Unauthorized()
+        self.store_user(user, passwordHash)
+        if self.updates is not None:
+            self.updates.newUser(user, passwordHash, self.service_id)
+
+    def removeUser(self, user, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Remove a user along with its token."
+        if not self.isAdmin(adminToken):
+            raise IceFlix.Unauthorized()
+        self.drop_user(user)
+        if self.updates is not None:
+            self.updates.removeUser(user, self.service_id)
+
+    def bulkUpdate(self, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the whole state."
+        return self.data()
+
+    def getChanges(self, knownVersion, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the changes after the given version."
+        with self._lock:
+            return self.log.changes_since(knownVersion)
+
+
+class UserUpdates(IceFlix.UserUpdate):
+    """Servant for the IceFlix.UserUpdate interface, which applies the
+    changes published by the other replicas."""
+
+    def __init__(self, authenticator):
+        self.authenticator = authenticator
+
+    def newToken(self, user, token, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Store a token issued by another replica."
+        if serviceId != self.authenticator.service_id:
+            self.authenticator.store_token(user, token)
+
+    def revokeToken(self, token, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Revoke a token."
+        if serviceId != self.authenticator.service_id:
+            self.authenticator.revoke(token)
+
+    def newUser(self, user, passwordHash, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Store a user added by another replica."
+        if serviceId != self.authenticator.service_id:
+            self.authenticator.store_user(user, passwordHash)
+
+    def removeUser(self, user, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Remove a user."
+        if serviceId != self.authenticator.service_id:
+            self.authenticator.drop_user(user)
+
+
+class AuthenticatorApp(Ice.Application):  # pylint:disable=too-many-instance-attributes
+    """Ice.Application for an Authenticator.
+
+    On startup it catches up with another replica found through Main, if
+    `Authenticator.Main` is set, and then follows the UserUpdates topic."""
+
+    def __init__(self):
+        super().__init__()
+        self.servant = None
+        self.adapter = None
+        self.topic = None
+        self.subscriber = None
+        self.announcements_timer = None
+
+    def create_servant(self, properties):
+        """Create the servant from the `Authenticator.*` properties."""
+        users_file = properties.getPropertyWithDefault("Authenticator.UsersFile", "users.json")
+        self.servant = Authenticator(properties.getProperty("AdminToken"),
+            load_users(users_file), float(properties.getPropertyWithDefault(
+                "Authenticator.TokenLifetime", str(TOKEN_LIFETIME))))
+        self.servant.users_file = users_file
+
+    def catch_up(self, proxy):
+        """Catch up with another replica known by Main, if any."""
+        main = IceFlix.MainPrx.uncheckedCast(
+            self.communicator().propertyToProxy("Authenticator.Main"))
+        if main is None:
+            return
+        discovery = DiscoveryClient(main)
+        try:
+            discovery.refresh("Authenticator")
+        except (IceFlix.TemporaryUnavailable, Ice.LocalException) as exc:
+            logging.warning("No replica to catch up with: %s", exc)
+            return
+        for entry in discovery.registries["Authenticator"].snapshot():
+            if entry.service_id == proxy_key(proxy):
+                continue
+            try:
+                changes = self.servant.catch_up(entry.proxy)
+            except Ice.LocalException as exc:
+                logging.warning("Replica '%s' unreachable: %s", entry.service_id, exc)
+                continue
+            logging.info("Caught up with '%s': %d users, %d changes", entry.service_id,
+                len(self.servant.users), changes)
+            return
+
+    def run(self, args):
+        """Run the application, adding the servant to the adapter."""
+        logging.info("Running Authenticator application")
+        comm = self.communicator()
+        self.create_servant(comm.getProperties())
+        self.adapter = comm.createObjectAdapter("AuthenticatorAdapter")
+        self.adapter.activate()
+        proxy = self.adapter.addWithUUID(self.servant)
+        self.servant.service_id = proxy.ice_getIdentity().name
+        logging.info("Authenticator proxy is '%s'", proxy)
+
+        self.topic = get_topic(comm, "UserUpdates")
+        self.subscriber = self.adapter.addWithUUID(UserUpdates(self.servant))
+        self.topic.subscribeAndGetPublisher({}, self.subscriber)
+        self.servant.updates = IceFlix.UserUpdatePrx.uncheckedCast(self.topic.getPublisher())
+        self.catch_up(proxy)
+        self.announcements_timer = start_announcements(get_topic(comm, "Announcements"), proxy,
+            announce_period(comm.getProperties(), "Authenticator"),
+            legacy=announce_legacy(comm.getProperties(), "Authenticator"))
+
+        self.shutdownOnInterrupt()
+        comm.waitForShutdown()
+
+        self.announcements_timer.cancel()
+        self.topic.unsubscribe(self.subscriber)
+        self.servant.shutdown()
+        return 0
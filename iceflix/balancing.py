@@ -0,0 +1,131 @@
+"""Module containing the policies used to choose among the services of a
+registry."""
+
+import bisect
+import itertools
+import random
+import time
+
+DEFAULT_RTT = 0.05
+MIN_RTT = 0.001
+RANDOM_ATTEMPTS = 3
+WEIGHTS_REFRESH = 1.0
+
+
+def random_healthy(entries, rng):
+    """Return a random healthy entry, or None if there is none. A few random
+    picks are tried before filtering the whole sequence."""
+    if not entries:
+        return None
+    for _ in range(RANDOM_ATTEMPTS):
+        entry = entries[rng.randrange(len(entries))]
+        if entry.healthy:
+            return entry
+    healthy = [entry for entry in entries if entry.healthy]
+    return rng.choice(healthy) if healthy else None
+
+
+def cost(entry):
+    """Expected latency of a service, as measured by the health checks."""
+    return entry.rtt if entry.rtt is not None else DEFAULT_RTT
+
+
+class RoundRobinPolicy:  # pylint:disable=too-few-public-methods
+    """Returns the healthy services one after the other."""
+
+    name = "round-robin"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, entries):
+        """Return the next healthy entry, or None if there is none."""
+        for _ in range(len(entries)):
+            entry = entries[next(self._counter) % len(entries)]
+            if entry.healthy:
+                return entry
+        return None
+
+
+class RandomPolicy:  # pylint:disable=too-few-public-methods
+    """Returns a healthy service chosen uniformly at random."""
+
+    name = "random"
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+
+    def choose(self, entries):
+        """Return a random healthy entry, or None if there is none."""
+        return random_healthy(entries, self._rng)
+
+
+class PowerOfTwoPolicy:  # pylint:disable=too-few-public-methods
+    """Picks two healthy services at random and returns the one with the
+    lowest latency, so slow services get less traffic without every lookup
+    going to the fastest one."""
+
+    name = "p2c"
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+
+    def choose(self, entries):
+        """Return the fastest of two random healthy entries, or None if there
+        is none."""
+        first = random_healthy(entries, self._rng)
+        second = random_healthy(entries, self._rng)
+        if first is None or second is None:
+            return first or second
+        return first if cost(first) <= cost(second) else second
+
+
+class WeightedPolicy:  # pylint:disable=too-few-public-methods
+    """Returns a healthy service at random, with a probability inversely
+    proportional to its latency.
+
+    The cumulative weights are rebuilt when the services change or every
+    `refresh` seconds, so each lookup is a binary search."""
+
+    name = "weighted"
+
+    def __init__(self, rng=None, refresh=WEIGHTS_REFRESH):
+        self._rng = rng or random.Random()
+        self._refresh = refresh
+        self._table = (None, 0.0, (), ())
+
+    def _weights(self, entries):
+        "Return the healthy entries and their cumulative weights."
+        snapshot, built_at, healthy, cumulative = self._table
+        now = time.monotonic()
+        if snapshot is not entries or now - built_at > self._refresh:
+            healthy = tuple(entry for entry in entries if entry.healthy)
+            cumulative = tuple(itertools.accumulate(
+                1.0 / max(cost(entry), MIN_RTT) for entry in healthy))
+            self._table = (entries, now, healthy, cumulative)
+        return healthy, cumulative
+
+    def choose(self, entries):
+        """Return a weighted random healthy entry, or None if there is none."""
+        healthy, cumulative = self._weights(entries)
+        for _ in range(RANDOM_ATTEMPTS):
+            if not healthy:
+                break
+            point = self._rng.random() * cumulative[-1]
+            entry = healthy[min(bisect.bisect_right(cumulative, point), len(healthy) - 1)]
+            if entry.healthy:
+                return entry
+        return random_healthy(entries, self._rng)
+
+
+POLICIES = {policy.name: policy for policy in (RoundRobinPolicy, RandomPolicy,
+    PowerOfTwoPolicy, WeightedPolicy)}
+
+
+def create_policy(name):
+    """Return a new instance of the policy with the given name."""
+    try:
+        return POLICIES[name]()
+    except KeyError as exc:
+        raise ValueError(f"Unknown balancing policy '{name}', expected one of: "
+            f"{', '.join(POLICIES)}") from exc
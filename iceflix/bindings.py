@@ -0,0 +1,112 @@
+"""Module containing the generation and loading of the Python bindings of the
+IceFlix Slice definitions.
+
+The bindings are generated at build time and installed along with the
+package. When they are missing or outdated, as in a source checkout, they
+are generated once into a cache directory, and only loaded at runtime with
+`Ice.loadSlice` if the cache cannot be written.
+
+This module must not import the rest of the package, since it is also
+loaded by the build script."""
+
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import Ice
+import IcePy
+
+SLICE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "iceflix.ice")
+DIGEST_PREFIX = "# IceFlix Slice digest: "
+CACHE_VARIABLE = "ICEFLIX_SLICE_CACHE"
+
+
+def slice_digest(slice_file=SLICE_FILE):
+    """Return the digest of the Slice definitions and the Ice version, which
+    identifies the bindings generated from them."""
+    with open(slice_file, "rb") as definitions:
+        digest = hashlib.sha256(definitions.read())
+    digest.update(Ice.stringVersion().encode())
+    return digest.hexdigest()[:16]
+
+
+def cache_directory():
+    """Return the directory where the bindings are cached, or None if the
+    cache is disabled by setting `ICEFLIX_SLICE_CACHE` to `off`."""
+    directory = os.environ.get(CACHE_VARIABLE)
+    if directory == "off":
+        return None
+    if not directory:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        directory = os.path.join(base, "iceflix")
+    return directory
+
+
+def generate(output_dir, slice_file=SLICE_FILE):
+    """Generate the bindings into a directory, tagging the IceFlix package with
+    the digest of the definitions."""
+    arguments = ["slice2py", "--output-dir", output_dir, slice_file]
+    if (slice_dir := Ice.getSliceDir()) is not None:
+        arguments.append("-I" + slice_dir)
+    if IcePy.compile(arguments) != 0:
+        raise RuntimeError(f"Cannot generate the bindings of '{slice_file}'")
+    package = os.path.join(output_dir, "IceFlix", "__init__.py")
+    with open(package, encoding="utf-8") as generated:
+        code = generated.read()
+    with open(package, "w", encoding="utf-8") as generated:
+        generated.write(f"{DIGEST_PREFIX}{slice_digest(slice_file)}\n{code}")
+
+
+def generated_digest(module_name="IceFlix"):
+    """Return the digest of the bindings importable as the given module,
+    without importing them, or None if there are none."""
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        return None
+    with open(spec.origin, encoding="utf-8") as generated:
+        first_line = generated.readline()
+    if not first_line.startswith(DIGEST_PREFIX):
+        return None
+    return first_line[len(DIGEST_PREFIX):].strip()
+
+
+def cached_bindings(directory, digest):
+    """Return the directory of the cached bindings with the given digest,
+    generating them first if needed."""
+    target = os.path.join(directory, digest)
+    if os.path.isdir(target):
+        return target
+    os.makedirs(directory, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".generating-", dir=directory)
+    try:
+        generate(staging)
+        os.replace(staging, target)
+    except OSError:
+        # Generated by another process in the meantime
+        if not os.path.isdir(target):
+            raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return target
+
+
+def load_bindings():
+    """Make the IceFlix module importable, from the installed bindings if they
+    match the Slice definitions, or else from the cache."""
+    digest = slice_digest()
+    if generated_digest() == digest:
+        return
+    if (directory := cache_directory()) is not None:
+        try:
+            sys.path.insert(0, cached_bindings(directory, digest))
+            return
+        except (OSError, RuntimeError) as exc:
+            logging.warning("Slice bindings not cached: %s", exc)
+    Ice.loadSlice(SLICE_FILE)
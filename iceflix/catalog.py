@@ -0,0 +1,187 @@
+"""Module containing a MediaCatalog backed by incremental indexes."""
+
+import logging
+import time
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.catalog_index import CatalogIndex
+from iceflix.client import DiscoveryClient
+from iceflix.main import announce_legacy, announce_period, get_topic, start_announcements
+from iceflix.tokens import TOKEN_TTL, TokenCache
+
+
+class MediaCatalog(IceFlix.MediaCatalog):
+    """Servant for the IceFlix.MediaCatalog interface.
+
+    Queries are answered from a CatalogIndex. Changes are applied to the
+    index and published on the CatalogUpdates topic, so the other catalogs
+    apply them too."""
+
+    def __init__(self, index, tokens, providers, service_id=""):
+        self.index = index
+        self.tokens = tokens
+        self.providers = providers
+        self.service_id = service_id
+        self.updates = None
+
+    def provider(self, service_id):
+        """Return the proxy of the FileService with the given ID, or None if
+        it is not online."""
+        registry = self.providers.registries["FileService"]
+        entry = registry.get(service_id)
+        if entry is None or entry.deadline <= time.monotonic():
+            return None
+        return entry.proxy
+
+    def getTile(self, mediaId, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the media with the given ID, with the tags of the user."
+        user = self.tokens.whois(userToken)
+        if (tile := self.index.get(mediaId)) is None:
+            raise IceFlix.WrongMediaId(mediaId)
+        name, provider = tile
+        if provider is None or (proxy := self.provider(provider)) is None:
+            raise IceFlix.TemporaryUnavailable()
+        tags = self.index.tags_of(user, mediaId)
+        return IceFlix.Media(mediaId, proxy, IceFlix.MediaInfo(name, tags))
+
+    def getTilesByName(self, name, exact, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the IDs of the media with the name, or containing it if not exact."
+        return self.index.by_name(name, exact)
+
+    def getTilesByTags(self, tags, includeAllTags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the IDs of the media with all or any of the tags of the user."
+        user = self.tokens.whois(userToken)
+        return self.index.by_tags(user, tags, includeAllTags)
+
+    def renameTile(self, mediaId, name, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Rename a media and publish the change."
+        self.tokens.check_admin(adminToken)
+        if mediaId not in self.index:
+            raise IceFlix.WrongMediaId(mediaId)
+        self.index.rename(mediaId, name)
+        if self.updates is not None:
+            self.updates.renameTile(mediaId, name, self.service_id)
+
+    def addTags(self, mediaId, tags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Add tags of the user to a media and publish the change."
+        user = self.tokens.whois(userToken)
+        if mediaId not in self.index:
+            raise IceFlix.WrongMediaId(mediaId)
+        self.index.add_tags(user, mediaId, tags)
+        if self.updates is not None:
+            self.updates.addTags(mediaId, user, tags, self.service_id)
+
+    def removeTags(self, mediaId, tags, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Remove tags of the user from a media and publish the change."
+        user = self.tokens.whois(userToken)
+        if mediaId not in self.index:
+            raise IceFlix.WrongMediaId(mediaId)
+        self.index.remove_tags(user, mediaId, tags)
+        if self.updates is not None:
+            self.updates.removeTags(mediaId, user, tags, self.service_id)
+
+    def getAllDeltas(self, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Publish the whole catalog as changes, so a new catalog catches up."
+        if self.updates is None:
+            return
+        for media_id, name in self.index.names_items():
+            if name != media_id:
+                self.updates.renameTile(media_id, name, self.service_id)
+        for user, media_id, tags in self.index.tags_items():
+            self.updates.addTags(media_id, user, tags, self.service_id)
+
+
+class CatalogUpdates(IceFlix.CatalogUpdate):
+    """Servant for the IceFlix.CatalogUpdate interface, which applies the
+    changes published by the other catalogs to the index."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def renameTile(self, mediaId, newName, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Rename a media."
+        if serviceId != self.catalog.service_id:
+            self.catalog.index.rename(mediaId, newName)
+
+    def addTags(self, mediaId, user, tags, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Add tags of a user to a media."
+        if serviceId != self.catalog.service_id:
+            self.catalog.index.add_tags(user, mediaId, tags)
+
+    def removeTags(self, mediaId, user, tags, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Remove tags of a user from a media."
+        if serviceId != self.catalog.service_id:
+            self.catalog.index.remove_tags(user, mediaId, tags)
+
+
+class FileAvailability(IceFlix.FileAvailabilityAnnounce):  # pylint:disable=too-few-public-methods
+    """Servant for the IceFlix.FileAvailabilityAnnounce interface, which sets
+    the announced files as the ones provided by their FileService."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def announceFiles(self, mediaIds, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Set the media provided by a FileService."
+        self.catalog.index.set_provided(serviceId, mediaIds)
+        logging.debug("%d files announced by '%s'", len(mediaIds), serviceId)
+
+
+class CatalogApp(Ice.Application):  # pylint:disable=too-many-instance-attributes
+    """Ice.Application for a MediaCatalog.
+
+    The Authenticator and the FileServices are found through the
+    Announcements topic, and through Main on misses if `Catalog.Main` is
+    set."""
+
+    def __init__(self):
+        super().__init__()
+        self.servant = None
+        self.discovery = None
+        self.adapter = None
+        self.subscriptions = []
+        self.announcements_timer = None
+
+    def subscribe(self, topic_name, servant):
+        """Subscribe a servant to a topic. Returns the publisher of the topic."""
+        topic = get_topic(self.communicator(), topic_name)
+        proxy = self.adapter.addWithUUID(servant)
+        topic.subscribeAndGetPublisher({}, proxy)
+        self.subscriptions.append((topic, proxy))
+        return topic.getPublisher()
+
+    def run(self, args):
+        """Run the application, adding the servants to the adapter."""
+        logging.info("Running MediaCatalog application")
+        comm = self.communicator()
+        properties = comm.getProperties()
+        main = IceFlix.MainPrx.uncheckedCast(comm.propertyToProxy("Catalog.Main"))
+        self.discovery = DiscoveryClient(main)
+        tokens = TokenCache(self.discovery.get_authenticator, float(
+            properties.getPropertyWithDefault("Catalog.TokenTTL", str(TOKEN_TTL))))
+        self.servant = MediaCatalog(CatalogIndex(), tokens, self.discovery)
+        self.adapter = comm.createObjectAdapter("CatalogAdapter")
+        self.adapter.activate()
+        proxy = self.adapter.addWithUUID(self.servant)
+        self.servant.service_id = proxy.ice_getIdentity().name
+        logging.info("MediaCatalog proxy is '%s'", proxy)
+
+        announcements = get_topic(comm, "Announcements")
+        self.discovery.subscribe(self.adapter, announcements)
+        self.subscribe("FileAvailabilityAnnounces", FileAvailability(self.servant))
+        self.servant.updates = IceFlix.CatalogUpdatePrx.uncheckedCast(
+            self.subscribe("CatalogUpdates", CatalogUpdates(self.servant)))
+        self.announcements_timer = start_announcements(announcements, proxy,
+            announce_period(properties, "Catalog"), legacy=announce_legacy(properties, "Catalog"))
+
+        self.shutdownOnInterrupt()
+        comm.waitForShutdown()
+
+        self.announcements_timer.cancel()
+        for topic, subscriber in self.subscriptions:
+            topic.unsubscribe(subscriber)
+        self.discovery.unsubscribe()
+        return 0
@@ -0,0 +1,266 @@
+"""Module containing the indexes of the media catalog."""
+
+import threading
+
+GRAM = 3
+EMPTY = frozenset()
+
+
+def grams(text):
+    """Return the set of n-grams of a text."""
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def intersection(sets):
+    """Return the intersection of the sets, starting from the smallest one so
+    each step checks as few elements as possible."""
+    sets = sorted(sets, key=len)
+    if len(sets) < 2:
+        return set(sets[0]) if sets else set()
+    result = sets[0] & sets[1]
+    for other in sets[2:]:
+        if not result:
+            break
+        result &= other
+    return result
+
+
+def union(sets):
+    """Return the union of the sets, copying the largest one and adding the
+    others to it."""
+    sets = sorted(sets, key=len, reverse=True)
+    if not sets:
+        return set()
+    result = set(sets[0])
+    for other in sets[1:]:
+        result |= other
+    return result
+
+
+def discard(index, key, media_id):
+    """Remove a media ID from the postings of a key, dropping empty postings."""
+    postings = index.get(key)
+    if postings is not None:
+        postings.discard(media_id)
+        if not postings:
+            del index[key]
+
+
+class NameIndex:
+    """Index of media names, for exact and case-insensitive substring search.
+
+    Names are split into trigrams. A substring query intersects the postings
+    of its trigrams and only checks the names of the remaining candidates.
+    Queries up to a trigram long join the postings of the trigrams which
+    contain them, plus the names shorter than a trigram which do."""
+
+    def __init__(self):
+        self._names = {}
+        self._folded = {}
+        self._exact = {}
+        self._grams = {}
+        self._short = set()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, media_id, name):
+        """Index the name of a media, replacing its previous name."""
+        self.remove(media_id)
+        folded = name.casefold()
+        self._names[media_id] = name
+        self._folded[media_id] = folded
+        self._exact.setdefault(name, set()).add(media_id)
+        if len(folded) < GRAM:
+            self._short.add(media_id)
+        for gram in grams(folded):
+            self._grams.setdefault(gram, set()).add(media_id)
+
+    def remove(self, media_id):
+        """Remove the name of a media from the index."""
+        name = self._names.pop(media_id, None)
+        if name is None:
+            return
+        folded = self._folded.pop(media_id)
+        discard(self._exact, name, media_id)
+        self._short.discard(media_id)
+        for gram in grams(folded):
+            discard(self._grams, gram, media_id)
+
+    def exact(self, name):
+        """Return the media IDs whose name is exactly the given one."""
+        return set(self._exact.get(name, EMPTY))
+
+    def search(self, name):
+        """Return the media IDs whose name contains the given one, ignoring case."""
+        query = name.casefold()
+        if len(query) == GRAM:
+            return set(self._grams.get(query, EMPTY))
+        if len(query) > GRAM:
+            candidates = intersection([self._grams.get(gram, EMPTY) for gram in grams(query)])
+            return {media_id for media_id in candidates if query in self._folded[media_id]}
+        # Every name with a trigram containing the query contains it too
+        found = union([postings for gram, postings in self._grams.items() if query in gram])
+        found.update(media_id for media_id in self._short if query in self._folded[media_id])
+        return found
+
+
+class TagIndex:
+    """Inverted index of the tags each user put on media.
+
+    Queries for any of the tags join their postings, and queries for all of
+    them intersect the postings, smallest first."""
+
+    def __init__(self):
+        self._postings = {}
+        self._tags = {}
+
+    def add(self, user, media_id, tags):
+        """Add tags of a user to a media."""
+        if not tags:
+            return
+        own = self._tags.setdefault((user, media_id), {})
+        postings = self._postings.setdefault(user, {})
+        for tag in tags:
+            own[tag] = None
+            postings.setdefault(tag, set()).add(media_id)
+
+    def remove(self, user, media_id, tags):
+        """Remove tags of a user from a media."""
+        own = self._tags.get((user, media_id))
+        if own is None:
+            return
+        postings = self._postings[user]
+        for tag in tags:
+            if tag in own:
+                del own[tag]
+                discard(postings, tag, media_id)
+        if not own:
+            del self._tags[(user, media_id)]
+        if not postings:
+            del self._postings[user]
+
+    def tags_of(self, user, media_id):
+        """Return the tags of a user on a media, in the order they were added."""
+        return list(self._tags.get((user, media_id), EMPTY))
+
+    def search(self, user, tags, include_all):
+        """Return the media IDs with all or any of the tags of a user."""
+        postings = self._postings.get(user, {})
+        sets = [postings.get(tag, EMPTY) for tag in set(tags)]
+        return intersection(sets) if include_all else union(sets)
+
+    def items(self):
+        """Return the (user, media ID, tags) triples of the index."""
+        return [(user, media_id, list(tags)) for (user, media_id), tags in self._tags.items()]
+
+
+class Tile:  # pylint:disable=too-few-public-methods
+    """Name and provider of a media of the catalog."""
+
+    __slots__ = ("name", "provider")
+
+    def __init__(self, name, provider=None):
+        self.name = name
+        self.provider = provider
+
+
+class CatalogIndex:
+    """Media of the catalog along with their name and tag indexes.
+
+    Every change updates the indexes incrementally, so queries never scan
+    the catalog. Media are named after their ID until renamed. Thread safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiles = {}
+        self._provided = {}
+        self.names = NameIndex()
+        self.tags = TagIndex()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, media_id):
+        return media_id in self._tiles
+
+    def get(self, media_id):
+        """Return the (name, provider) pair of a media, or None if unknown."""
+        tile = self._tiles.get(media_id)
+        return None if tile is None else (tile.name, tile.provider)
+
+    def _tile(self, media_id):
+        "Return the tile of a media, adding it if it is unknown."
+        if (tile := self._tiles.get(media_id)) is None:
+            tile = self._tiles[media_id] = Tile(media_id)
+            self.names.add(media_id, tile.name)
+        return tile
+
+    def add_media(self, media_id, provider):
+        """Add a media, or change its provider if it is known."""
+        with self._lock:
+            self._tile(media_id).provider = provider
+
+    def set_provided(self, provider, media_ids):
+        """Set the media provided by a FileService, adding the unknown ones.
+        The media it no longer provides are taken over by another provider
+        holding them, if any."""
+        media_ids = set(media_ids)
+        with self._lock:
+            previous = self._provided.pop(provider, EMPTY)
+            if media_ids:
+                self._provided[provider] = media_ids
+            for media_id in previous - media_ids:
+                tile = self._tiles[media_id]
+                if tile.provider == provider:
+                    tile.provider = next((other for other, held in self._provided.items()
+                        if media_id in held), None)
+            for media_id in media_ids:
+                self._tile(media_id).provider = provider
+
+    def rename(self, media_id, name):
+        """Rename a media. Unknown media are added without provider, so they
+        keep the name when they are announced."""
+        with self._lock:
+            tile = self._tile(media_id)
+            if tile.name != name:
+                tile.name = name
+                self.names.add(media_id, name)
+
+    def add_tags(self, user, media_id, tags):
+        """Add tags of a user to a media."""
+        with self._lock:
+            self._tile(media_id)
+            self.tags.add(user, media_id, tags)
+
+    def remove_tags(self, user, media_id, tags):
+        """Remove tags of a user from a media."""
+        with self._lock:
+            self.tags.remove(user, media_id, tags)
+
+    def tags_of(self, user, media_id):
+        """Return the tags of a user on a media."""
+        with self._lock:
+            return self.tags.tags_of(user, media_id)
+
+    def by_name(self, name, exact):
+        """Return the IDs of the media with the given name, or containing it
+        if not exact. Case is only ignored when not exact."""
+        with self._lock:
+            found = self.names.exact(name) if exact else self.names.search(name)
+        return list(found)
+
+    def by_tags(self, user, tags, include_all):
+        """Return the IDs of the media with all or any of the tags of a user."""
+        with self._lock:
+            return list(self.tags.search(user, tags, include_all))
+
+    def names_items(self):
+        """Return the (media ID, name) pairs of the catalog."""
+        with self._lock:
+            return [(media_id, tile.name) for media_id, tile in self._tiles.items()]
+
+    def tags_items(self):
+        """Return the (user, media ID, tags) triples of the catalog."""
+        with self._lock:
+            return self.tags.items()
@@ -3,22 +3,47 @@
 import logging
 import sys
 
+from iceflix import logs
+from iceflix.authenticator import AuthenticatorApp
+from iceflix.catalog import CatalogApp
+from iceflix.fileservice import FileServiceApp
 from iceflix.main import MainApp
 
 
-LOG_FORMAT = '%(asctime)s - %(levelname)-7s - %(module)s:%(funcName)s:%(lineno)d - %(message)s'
-
-
-def setup_logging():
-    """Configure the logging."""
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format=LOG_FORMAT,
-    )
+def setup_logging(prefix):
+    """Configure the logging at the level set by the `<prefix>.LogLevel`
+    property, so records are written by a background thread."""
+    level = logs.log_level(sys.argv, prefix)
+    try:
+        logs.setup_logging(level)
+    except ValueError as exc:
+        logs.setup_logging()
+        logging.warning("%s, using %s", exc, logs.LOG_LEVEL)
 
 
 def main_service():
     """Handles the `mainservice` CLI command."""
-    setup_logging()
+    setup_logging("Main")
     logging.info("Main service starting...")
-    sys.exit(MainApp().main(sys.argv))
+    sys.exit(MainApp().main(sys.argv, initData=MainApp.initialization_data(sys.argv)))
+
+
+def file_service():
+    """Handles the `fileservice` CLI command."""
+    setup_logging("FileService")
+    logging.info("File service starting...")
+    sys.exit(FileServiceApp().main(sys.argv))
+
+
+def catalog_service():
+    """Handles the `catalogservice` CLI command."""
+    setup_logging("Catalog")
+    logging.info("Catalog service starting...")
+    sys.exit(CatalogApp().main(sys.argv))
+
+
+def authenticator_service():
+    """Handles the `authenticatorservice` CLI command."""
+    setup_logging("Authenticator")
+    logging.info("Authenticator service starting...")
+    sys.exit(AuthenticatorApp().main(sys.argv))
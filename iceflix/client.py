@@ -0,0 +1,186 @@
+"""Module containing a discovery cache for IceFlix clients.
+
+Clients keep the proxies returned by Main for a while, and may subscribe to
+the Announcements topic to learn about new services directly, so Main is
+only asked when the cache misses or its contents are too old."""
+
+import logging
+import threading
+import time
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.main import EXPIRY_MARGIN
+from iceflix.registry import ServiceRegistry
+from iceflix.resolver import ServiceResolver
+
+DEFAULT_TTL = 10.0
+MAX_CANDIDATES = 8
+SERVICE_KINDS = {
+    "Authenticator": IceFlix.ServiceKind.AuthenticatorKind,
+    "MediaCatalog": IceFlix.ServiceKind.MediaCatalogKind,
+    "FileService": IceFlix.ServiceKind.FileServiceKind,
+}
+
+
+def proxy_key(proxy):
+    """Return the key of a proxy in the cache: its stringified identity."""
+    return Ice.identityToString(proxy.ice_getIdentity())
+
+
+class DiscoveryAnnouncement(IceFlix.Announcement):
+    """Servant for the IceFlix.Announcement interface which feeds the cache of
+    a DiscoveryClient."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def announce(self, proxy, service_id, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Store or renew the announced service in the cache."
+        self.store(proxy, service_id)
+
+    def announceBatch(self, services, period, current=None):  # pylint:disable=invalid-name, unused-argument
+        """Store or renew every announced service in the cache, until the
+        next batch is due."""
+        ttl = max(period, 0.0) + EXPIRY_MARGIN
+        for announced in services:
+            self.store(announced.service, announced.serviceId, ttl)
+
+    def store(self, proxy, service_id, ttl=None):
+        """Store or renew a service for `ttl` seconds, or the default time
+        of the cache, resolving its kind first if needed."""
+        resolver = self.client.resolver
+        if (resolved := resolver.lookup(proxy, service_id)) is not None:
+            self.client.store(*resolved, ttl=ttl)
+            return
+        resolver.resolve(proxy, service_id).add_done_callback(
+            lambda future: self.on_resolved(service_id, future, ttl))
+
+    def on_resolved(self, service_id, future, ttl=None):
+        "Store a service once its kind has been resolved."
+        try:
+            self.client.store(*future.result(), ttl=ttl)
+        except Exception as exc:  # pylint:disable=broad-except
+            logging.debug("Service '%s' ignored: unreachable (%s)", service_id, exc)
+
+
+class DiscoveryClient:  # pylint:disable=too-many-instance-attributes
+    """Cache of service proxies for IceFlix clients.
+
+    Proxies are fetched in batches from Main with `getCandidates`, and kept
+    for `ttl` seconds. After that, Main is asked again with the registry
+    version the cache comes from, so an unchanged registry costs an empty
+    answer. When subscribed to the Announcements topic, the cache is kept up
+    to date by the announcements instead, and Main is only asked on misses.
+
+    Callers should report the proxies which fail with `invalidate`."""
+
+    def __init__(self, main, ttl=DEFAULT_TTL, max_candidates=MAX_CANDIDATES):
+        self.main = main
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+        self.resolver = ServiceResolver()
+        self.registries = {kind: ServiceRegistry(kind) for kind in SERVICE_KINDS}
+        self.hits = 0
+        self.misses = 0
+        self._versions = dict.fromkeys(SERVICE_KINDS, -1)
+        self._fresh_until = dict.fromkeys(SERVICE_KINDS, 0.0)
+        self._lock = threading.Lock()
+        self._subscription = None
+
+    @property
+    def subscribed(self):
+        "Whether the cache is fed by the Announcements topic."
+        return self._subscription is not None
+
+    def subscribe(self, adapter, topic):
+        """Subscribe the cache to the Announcements topic, adding its servant
+        to the given adapter."""
+        proxy = adapter.addWithUUID(DiscoveryAnnouncement(self))
+        topic.subscribeAndGetPublisher({}, proxy)
+        self._subscription = (adapter, topic, proxy)
+
+    def unsubscribe(self):
+        """Stop receiving announcements."""
+        if self._subscription is None:
+            return
+        adapter, topic, proxy = self._subscription
+        topic.unsubscribe(proxy)
+        adapter.remove(proxy.ice_getIdentity())
+        self._subscription = None
+
+    def store(self, kind, proxy, ttl=None):
+        """Store or renew a proxy of the given kind. Proxies of other kinds,
+        such as Main services, are ignored."""
+        if kind not in self.registries:
+            return
+        deadline = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self.registries[kind].add(proxy_key(proxy), proxy, deadline)
+
+    def invalidate(self, proxy):
+        """Drop a proxy which failed from the cache."""
+        key = proxy_key(proxy)
+        for registry in self.registries.values():
+            if registry.remove(key) is not None:
+                self._versions[registry.kind] = -1
+
+    def refresh(self, kind):
+        """Ask Main for the services of a kind, renewing the cached ones if
+        the registry of Main did not change. Without Main, only the
+        announced services are known."""
+        if self.main is None:
+            raise IceFlix.TemporaryUnavailable()
+        with self._lock:
+            registry = self.registries[kind]
+            known = self._versions[kind] if registry else -1
+            candidates = self.main.getCandidates(SERVICE_KINDS[kind], self.max_candidates,
+                known)
+            now = time.monotonic()
+            if not candidates.services and candidates.version == known:
+                for entry in registry.snapshot():
+                    entry.deadline = max(entry.deadline, now + self.ttl)
+            for proxy in candidates.services:
+                self.store(kind, self.resolver.cast(kind, proxy))
+            self._versions[kind] = candidates.version
+            self._fresh_until[kind] = now + self.ttl
+
+    def _next_fresh(self, registry, now):
+        "Return the next cached entry which has not expired, removing the others."
+        while (entry := registry.next()) is not None:
+            if entry.deadline > now:
+                return entry
+            registry.remove(entry.service_id)
+        return None
+
+    def lookup(self, kind):
+        """Return a proxy of the given kind, from the cache if possible."""
+        registry = self.registries[kind]
+        now = time.monotonic()
+        if not self.subscribed and now >= self._fresh_until[kind]:
+            try:
+                self.refresh(kind)
+            except (IceFlix.TemporaryUnavailable, Ice.LocalException) as exc:
+                # Keep using the cached proxies while Main does not answer
+                logging.debug("Refresh of %s services failed: %s", kind, exc)
+        if (entry := self._next_fresh(registry, now)) is not None:
+            self.hits += 1
+            return entry.proxy
+        self.misses += 1
+        self.refresh(kind)
+        if (entry := self._next_fresh(registry, time.monotonic())) is None:
+            raise IceFlix.TemporaryUnavailable()
+        return entry.proxy
+
+    def get_authenticator(self):
+        """Return an Authenticator proxy."""
+        return self.lookup("Authenticator")
+
+    def get_catalog(self):
+        """Return a MediaCatalog proxy."""
+        return self.lookup("MediaCatalog")
+
+    def get_file_service(self):
+        """Return a FileService proxy."""
+        return self.lookup("FileService")
@@ -0,0 +1,75 @@
+"""Module containing the asynchronous dispatch of lookups which cannot be
+answered right away by the Main service."""
+
+import collections
+import logging
+import threading
+import time
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.scheduler import ExpiryScheduler
+
+
+class PendingLookups:
+    """Lookups waiting for an online service of a given kind.
+
+    Each lookup is a future returned to the Ice runtime, so no dispatch
+    thread is held while waiting. Lookups are answered in arrival order as
+    soon as a service becomes available, or fail with TemporaryUnavailable
+    once their waiting time is over."""
+
+    def __init__(self, wait):
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._pending = collections.defaultdict(collections.OrderedDict)
+        self._scheduler = ExpiryScheduler(self._expire)
+        self._scheduler.start()
+
+    def __len__(self):
+        return sum(len(pending) for pending in self._pending.values())
+
+    def park(self, registry, operation):
+        """Return a future which is completed by a later call to `wake`."""
+        future = Ice.Future()
+        with self._lock:
+            self._pending[registry][future] = operation
+        self._scheduler.schedule((registry, future), time.monotonic() + self.wait)
+        # A service may have become available before the lookup was stored
+        self.wake(registry)
+        return future
+
+    def wake(self, registry):
+        """Answer the lookups waiting for the registry while it has online
+        services."""
+        while True:
+            with self._lock:
+                pending = self._pending.get(registry)
+                if not pending:
+                    return
+                if (entry := registry.next()) is None:
+                    return
+                future, operation = pending.popitem(last=False)
+            self._scheduler.cancel((registry, future))
+            logging.info("%s: service '%s' returned after waiting", operation,
+                entry.service_id)
+            future.set_result(entry.proxy)
+
+    def _expire(self, key):
+        "Fail a lookup whose waiting time is over."
+        registry, future = key
+        with self._lock:
+            if self._pending[registry].pop(future, None) is None:
+                return
+        future.set_exception(IceFlix.TemporaryUnavailable())
+
+    def cancel_all(self):
+        """Fail every waiting lookup and stop the timeout thread."""
+        self._scheduler.stop()
+        with self._lock:
+            futures = [future for pending in self._pending.values() for future in pending]
+            self._pending.clear()
+        for future in futures:
+            future.set_exception(IceFlix.TemporaryUnavailable())
@@ -0,0 +1,266 @@
+"""Module containing a FileService which serves files from memory maps."""
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.client import DiscoveryClient
+from iceflix.main import announce_legacy, announce_period, get_topic, start_announcements
+from iceflix.tokens import TOKEN_TTL, TokenCache
+
+CHUNK_LIMIT = 4 << 20
+READ_AHEAD = 8 << 20
+UPLOAD_CHUNK = 1 << 20
+UPLOAD_PREFIX = ".upload-"
+
+
+def page_floor(offset):
+    """Round an offset down to the start of its page."""
+    return offset - offset % mmap.PAGESIZE
+
+
+def advise(memory_map, option, start, end):
+    """Advise the kernel about the use of the bytes [start, end) of a memory
+    map, if the platform supports the given advice."""
+    option = getattr(mmap, option, None)
+    start = page_floor(start)
+    if memory_map is None or option is None or end <= start:
+        return
+    memory_map.madvise(option, start, end - start)
+
+
+def file_digest(path):
+    """Return the SHA-256 of the contents of a file, which is its media ID."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(UPLOAD_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHandler(IceFlix.FileHandler):  # pylint:disable=too-many-instance-attributes
+    """Servant for the IceFlix.FileHandler interface, serving a file from a
+    memory map.
+
+    Chunks are sliced from the map, which costs a single copy from the page
+    cache and no read call. Slices are returned as bytes rather than
+    memoryviews, since Ice only marshals byte sequences in bulk from bytes
+    objects. The kernel is asked to prefetch
+    `read_ahead` bytes past the position of the reader, and to release the
+    pages already sent, so each handler keeps about `read_ahead` bytes of
+    the file resident whatever its size."""
+
+    def __init__(self, path, tokens, read_ahead=READ_AHEAD, chunk_limit=CHUNK_LIMIT):
+        self.tokens = tokens
+        self.read_ahead = read_ahead
+        self.chunk_limit = chunk_limit
+        self.position = 0
+        self._prefetched = 0
+        self._released = 0
+        self._lock = threading.Lock()
+        with open(path, "rb") as file:
+            self.size = os.fstat(file.fileno()).st_size
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if self.size else None
+        self._closed = False
+        advise(self._map, "MADV_SEQUENTIAL", 0, self.size)
+
+    @property
+    def closed(self):
+        "Whether the handler was closed."
+        return self._closed
+
+    def _advance(self, start, end):
+        "Release the pages before start and prefetch the ones after end."
+        if (released := page_floor(start)) > self._released:
+            advise(self._map, "MADV_DONTNEED", self._released, released)
+            self._released = released
+        if end + self.read_ahead // 2 > self._prefetched:
+            prefetched = min(end + self.read_ahead, self.size)
+            advise(self._map, "MADV_WILLNEED", max(self._prefetched, start), prefetched)
+            self._prefetched = prefetched
+
+    def receive(self, size, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return the next chunk of the file, empty at its end."
+        self.tokens.check_user(userToken)
+        with self._lock:
+            if self.closed or self._map is None:
+                return b""
+            start = self.position
+            self.position = min(start + max(0, min(size, self.chunk_limit)), self.size)
+            self._advance(start, self.position)
+            return self._map[start:self.position]
+
+    def close(self, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Unmap the file and remove the handler from the adapter."
+        with self._lock:
+            if self.closed:
+                return
+            self._closed = True
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        if current is not None:
+            try:
+                current.adapter.remove(current.id)
+            except Ice.NotRegisteredException:  # pylint:disable=no-member
+                pass
+
+
+class FileService(IceFlix.FileService):  # pylint:disable=too-many-instance-attributes
+    """Servant for the IceFlix.FileService interface.
+
+    Files are stored in the root directory, named after their media ID,
+    which is the SHA-256 of their contents. Uploads are written to a
+    temporary file chunk by chunk and hashed on the way, so the file is
+    never held in memory."""
+
+    handler_class = FileHandler
+
+    def __init__(self, root, tokens, service_id="", upload_chunk=UPLOAD_CHUNK):
+        self.root = root
+        self.tokens = tokens
+        self.service_id = service_id
+        self.upload_chunk = upload_chunk
+        self.handler_options = {}
+        self.availability = None
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """Index the files of the root directory by their media ID."""
+        os.makedirs(self.root, exist_ok=True)
+        files = {}
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith("."):
+                files[file_digest(entry.path)] = entry.path
+        with self._lock:
+            self.files = files
+        logging.info("%d files available in '%s'", len(files), self.root)
+
+    def announce_files(self):
+        """Publish every media ID available here. Each announcement replaces
+        the previous one, so removed files are announced too."""
+        if self.availability is None:
+            return
+        with self._lock:
+            media_ids = list(self.files)
+        self.availability.announceFiles(media_ids, self.service_id)
+
+    def openFile(self, mediaId, userToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return a handler to stream the file with the given media ID."
+        self.tokens.check_user(userToken)
+        with self._lock:
+            path = self.files.get(mediaId)
+        if path is None:
+            raise IceFlix.WrongMediaId(mediaId)
+        try:
+            handler = self.handler_class(path, self.tokens, **self.handler_options)
+        except FileNotFoundError as error:
+            raise IceFlix.WrongMediaId(mediaId) from error
+        return IceFlix.FileHandlerPrx.uncheckedCast(current.adapter.addWithUUID(handler))
+
+    def uploadFile(self, uploader, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Store the file sent by the uploader. Returns its media ID."
+        self.tokens.check_admin(adminToken)
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=UPLOAD_PREFIX,
+                delete=False) as output:
+            try:
+                while chunk := uploader.receive(self.upload_chunk):
+                    digest.update(chunk)
+                    output.write(chunk)
+            except BaseException:
+                os.unlink(output.name)
+                raise
+        media_id = digest.hexdigest()
+        path = os.path.join(self.root, media_id)
+        os.replace(output.name, path)
+        with self._lock:
+            self.files[media_id] = path
+        uploader.close()
+        logging.info("File '%s' uploaded", media_id)
+        self.announce_files()
+        return media_id
+
+    def removeFile(self, mediaId, adminToken, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Remove the file with the given media ID. Open handlers keep working."
+        self.tokens.check_admin(adminToken)
+        with self._lock:
+            path = self.files.pop(mediaId, None)
+        if path is None:
+            raise IceFlix.WrongMediaId(mediaId)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        logging.info("File '%s' removed", mediaId)
+        self.announce_files()
+
+
+class FileServiceApp(Ice.Application):  # pylint:disable=too-many-instance-attributes
+    """Ice.Application for a FileService.
+
+    The Authenticator is found through the Announcements topic, and through
+    Main on misses if `FileService.Main` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.servant = None
+        self.discovery = None
+        self.adapter = None
+        self.announcements_timer = None
+
+    def create_servant(self, properties):
+        """Create the FileService servant from the `FileService.*` properties."""
+        main = IceFlix.MainPrx.uncheckedCast(
+            self.communicator().propertyToProxy("FileService.Main"))
+        self.discovery = DiscoveryClient(main)
+        tokens = TokenCache(self.discovery.get_authenticator, float(
+            properties.getPropertyWithDefault("FileService.TokenTTL", str(TOKEN_TTL))))
+        self.servant = FileService(
+            properties.getPropertyWithDefault("FileService.Root", "resources"), tokens)
+        self.servant.handler_options = {
+            "read_ahead": properties.getPropertyAsIntWithDefault(
+                "FileService.ReadAhead", READ_AHEAD),
+            "chunk_limit": properties.getPropertyAsIntWithDefault(
+                "FileService.ChunkLimit", CHUNK_LIMIT),
+        }
+        self.servant.scan()
+
+    def run(self, args):
+        """Run the application, adding the servant to the adapter."""
+        logging.info("Running FileService application")
+        comm = self.communicator()
+        self.create_servant(comm.getProperties())
+        self.adapter = comm.createObjectAdapter("FileServiceAdapter")
+        self.adapter.activate()
+        proxy = self.adapter.addWithUUID(self.servant)
+        self.servant.service_id = proxy.ice_getIdentity().name
+        logging.info("FileService proxy is '%s'", proxy)
+
+        announcements = get_topic(comm, "Announcements")
+        self.discovery.subscribe(self.adapter, announcements)
+        self.servant.availability = IceFlix.FileAvailabilityAnnouncePrx.uncheckedCast(
+            get_topic(comm, "FileAvailabilityAnnounces").getPublisher())
+        # The files are announced along with the service, so Main and the
+        # catalogs learn them again after a restart or an expiry
+        self.announcements_timer = start_announcements(announcements, proxy,
+            announce_period(comm.getProperties(), "FileService"),
+            callbacks=(self.servant.announce_files,),
+            legacy=announce_legacy(comm.getProperties(), "FileService"))
+
+        self.shutdownOnInterrupt()
+        comm.waitForShutdown()
+
+        self.announcements_timer.cancel()
+        self.discovery.unsubscribe()
+        return 0
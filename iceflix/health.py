@@ -0,0 +1,88 @@
+"""Module containing the background health checks of the services known by the
+Main service."""
+
+import logging
+import threading
+import time
+
+from iceflix.metrics import Metrics
+
+PROBE_INTERVAL = 2.0
+PROBE_TIMEOUT = 1500
+MAX_BACKOFF = 16.0
+MAX_IN_FLIGHT = 32
+RTT_SMOOTHING = 0.3
+
+
+class HealthProber:  # pylint:disable=too-few-public-methods, too-many-instance-attributes
+    """Pings the services stored in a set of registries asynchronously,
+    keeping the health state of each entry up to date so lookups only have to
+    read it.
+
+    At most `max_in_flight` pings are pending at the same time, and services
+    which fail are probed again after an exponentially growing delay. The
+    round-trip time of each ping feeds the latency average of the entry.
+
+    If `owns` is set, only the services for which it returns True are
+    probed, the health of the others being learnt elsewhere."""
+
+    def __init__(self, registries, interval=PROBE_INTERVAL, max_in_flight=MAX_IN_FLIGHT,
+                 metrics=None):
+        self.registries = registries
+        self.interval = interval
+        self.timeout = PROBE_TIMEOUT
+        self.max_backoff = MAX_BACKOFF
+        self.owns = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        metrics = metrics or Metrics()
+        self._probes = {registry.kind: metrics.counter("iceflix_probes_total",
+            "Health-check pings sent by kind.", kind=registry.kind) for registry in registries}
+        self._failures = {registry.kind: metrics.counter("iceflix_probe_failures_total",
+            "Health-check pings failed by kind.", kind=registry.kind) for registry in registries}
+
+    def probe(self):
+        """Send a ping to every service whose next probe is due, as long as
+        there are free slots."""
+        now = time.monotonic()
+        owns = self.owns
+        for registry in self.registries:
+            for entry in registry.snapshot():
+                if entry.probing or entry.next_probe > now:
+                    continue
+                if owns is not None and not owns(entry.service_id):
+                    continue
+                if not self._slots.acquire(blocking=False):  # pylint:disable=consider-using-with
+                    return
+                entry.probing = True
+                sent = time.monotonic()
+                try:
+                    future = entry.proxy.ice_invocationTimeout(self.timeout).ice_pingAsync()
+                except Exception:  # pylint:disable=broad-except
+                    self._on_result(registry, entry, False, sent)
+                    continue
+                future.add_done_callback(
+                    lambda fut, reg=registry, ent=entry, sent=sent:
+                        self._on_result(reg, ent, fut.exception() is None, sent))
+
+    def _on_result(self, registry, entry, healthy, sent):
+        """Store the result of a ping, backing off if the service failed."""
+        self._slots.release()
+        entry.probing = False
+        now = time.monotonic()
+        self._probes[registry.kind].inc()
+        if healthy:
+            rtt = now - sent
+            entry.rtt = rtt if entry.rtt is None else \
+                entry.rtt + RTT_SMOOTHING * (rtt - entry.rtt)
+            entry.failures = 0
+            entry.next_probe = now + self.interval
+            if registry.set_health(entry, True):
+                logging.info("Service '%s' marked as online", entry.service_id)
+            return
+        entry.failures += 1
+        self._failures[registry.kind].inc()
+        backoff = min(self.interval * 2 ** entry.failures, self.max_backoff)
+        entry.next_probe = now + backoff
+        if registry.set_health(entry, False):
+            logging.info("Service '%s' marked as offline: %s", entry.service_id,
+                registry.kind)
@@ -0,0 +1,139 @@
+"""Module containing the logging setup of the services, where the threads
+logging only enqueue their records, and the summaries of frequent messages."""
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+import Ice
+
+LOG_FORMAT = '%(asctime)s - %(levelname)-7s - %(module)s:%(funcName)s:%(lineno)d - %(message)s'
+LOG_LEVEL = "INFO"
+SUMMARY_INTERVAL = 10.0
+SUMMARY_KEYS = 3
+
+
+def parse_level(level):
+    """Return the logging level with the given name or number."""
+    if isinstance(level, int) or level.isdigit():
+        return int(level)
+    if not isinstance(value := logging.getLevelName(level.upper()), int):
+        raise ValueError(f"Unknown logging level '{level}'")
+    return value
+
+
+def log_level(argv, prefix):
+    """Return the logging level set in the `<prefix>.LogLevel` property, in
+    the configuration file given with `--Ice.Config` or on the command line."""
+    arguments = list(argv)
+    properties = Ice.createProperties(arguments)
+    properties.parseCommandLineOptions(prefix, arguments)
+    return properties.getPropertyWithDefault(f"{prefix}.LogLevel", LOG_LEVEL)
+
+
+class ThreadQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler for a listener in the same process, which enqueues the
+    records as they are so they are only formatted by the listener."""
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, handler=None):
+    """Configure the root logger at the given level, so records are put into
+    a queue and written by a background thread through the handler, which
+    writes to the standard error by default. Returns the started listener,
+    which is stopped at exit."""
+    level = parse_level(level)
+    if handler is None:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(ThreadQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class LogSummary:
+    """Frequent message, such as a service being renewed, which is only
+    logged at debug level on every occurrence. At the given level, the
+    occurrences of each key are counted, and a single summary is logged
+    every `interval` seconds, by the thread whose occurrence comes after it."""
+
+    def __init__(self, message, interval=SUMMARY_INTERVAL, level=logging.INFO, logger=None):
+        self.message = message
+        self.interval = interval
+        self.level = level
+        self.logger = logger or logging.getLogger()
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._started = time.monotonic()
+
+    def __call__(self, key):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s: '%s'", self.message, key)
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._counts[key] += 1
+            if now - self._started < self.interval:
+                return
+        self.flush(now)
+
+    def flush(self, now=None):
+        "Log the summary of the occurrences counted since the last one, if any."
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            counts, self._counts = self._counts, collections.Counter()
+            elapsed, self._started = now - self._started, now
+        log_counts(self.logger, self.level, self.message, counts, elapsed)
+
+
+class CounterSummary:  # pylint:disable=too-few-public-methods
+    """Summary of the requests counted by metrics counters, such as the
+    lookups of Main, by key. The threads counting them never log: `flush` is
+    called periodically by another thread, which logs what was counted since
+    the last time."""
+
+    def __init__(self, message, counters, level=logging.INFO, logger=None):
+        self.message = message
+        self.counters = counters
+        self.level = level
+        self.logger = logger or logging.getLogger()
+        self._lock = threading.Lock()
+        self._last = {key: counter.value for key, counter in counters.items()}
+        self._started = time.monotonic()
+
+    def flush(self, now=None):
+        "Log the summary of the requests counted since the last one, if any."
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            values = {key: counter.value for key, counter in self.counters.items()}
+            counts = collections.Counter({key: value - self._last[key]
+                for key, value in values.items() if value > self._last[key]})
+            self._last = values
+            elapsed, self._started = now - self._started, now
+        log_counts(self.logger, self.level, self.message, counts, elapsed)
+
+
+def log_counts(logger, level, message, counts, elapsed):
+    """Log the total of the counts along with the most frequent keys, unless
+    there are none."""
+    if not counts or not logger.isEnabledFor(level):
+        return
+    keys = ", ".join(f"'{key}' {count}" for key, count in counts.most_common(SUMMARY_KEYS))
+    if len(counts) > SUMMARY_KEYS:
+        keys += f" and {len(counts) - SUMMARY_KEYS} more"
+    logger.log(level, "%s: %d times in the last %.0f s (%s)", message,
+        sum(counts.values()), elapsed, keys)
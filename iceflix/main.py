@@ -1,6 +1,11 @@
 """Module containing a template for a main service."""
 
+import collections
 import logging
+import os
+import random
+import threading
+import time
 
 from threading import Timer
 
@@ -9,7 +14,40 @@ import IceStorm
 
 import IceFlix  # pylint:disable=import-error
 
+from iceflix.balancing import RoundRobinPolicy, create_policy
+from iceflix.dispatch import PendingLookups
+from iceflix.health import HealthProber
+from iceflix.logs import SUMMARY_INTERVAL, CounterSummary, LogSummary
+from iceflix.media import MediaIndex
+from iceflix.peers import MainPeers, rendezvous_owner
+from iceflix.metrics import Metrics, MetricsFacet, MetricsServer, RequestMetrics
+from iceflix.registry import ServiceRegistry
+from iceflix.resolver import TYPE_IDS, ServiceResolver
+from iceflix.scheduler import ExpiryScheduler
+from iceflix.snapshot import SNAPSHOT_MAX_AGE, SNAPSHOT_PERIOD, load_snapshot, save_snapshot
+
 RESPONSE_TIME = 10
+ANNOUNCE_PERIOD = 8.0
+FIRST_ANNOUNCE_PERIOD = 1.0
+ANNOUNCE_JITTER = 0.2
+EXPIRY_MARGIN = RESPONSE_TIME - ANNOUNCE_PERIOD
+METRICS_FACET = "IceFlix.Metrics"
+LOOKUPS = ("getAuthenticator", "getCatalog", "getFileService", "getServices",
+           "getCandidates", "getFileServiceFor")
+OPERATIONS = (*LOOKUPS, "announce", "announceBatch")
+SERVICE_KINDS = {
+    IceFlix.ServiceKind.AuthenticatorKind: "Authenticator",
+    IceFlix.ServiceKind.MediaCatalogKind: "MediaCatalog",
+    IceFlix.ServiceKind.FileServiceKind: "FileService",
+}
+KIND_VALUES = {kind: value for value, kind in SERVICE_KINDS.items()}
+SERVICE_GAUGES = (
+    ("healthy", "iceflix_service_healthy", "Whether the service passed its last health check."),
+    ("rtt", "iceflix_service_rtt_seconds", "Smoothed round-trip time of the health checks."),
+    ("selected", "iceflix_service_selections", "Times the service was returned by lookups."),
+)
+DEFERRED_CACHE_SIZE = 1024
+VERDICT_RTT_CHANGE = 0.25
 
 
 class RepeatTimer(Timer):
@@ -19,7 +57,131 @@ class RepeatTimer(Timer):
     def run(self):
         "Execute the function passed to the timer when it is time"
         while not self.finished.wait(self.interval):
-            self.function(*self.args, **self.kwargs)
+            try:
+                self.function(*self.args, **self.kwargs)
+            except Exception:  # pylint:disable=broad-except
+                logging.exception("Repeated task failed, retrying in %.1f s", self.interval)
+
+
+def get_topic(communicator, topic_name):
+    """Return the IceStorm topic with the given name, creating it if needed."""
+    topic_manager = communicator.propertyToProxy('IceStorm.TopicManager')
+    topic_manager = IceStorm.TopicManagerPrx.checkedCast(topic_manager)  # pylint:disable=no-member
+
+    try:
+        return topic_manager.retrieve(topic_name)
+    except IceStorm.NoSuchTopic:  # pylint:disable=no-member
+        return topic_manager.create(topic_name)
+
+
+class Announcer(threading.Thread):
+    """Thread announcing the services of a process in a single batch.
+
+    The first announcements are frequent, so new services are found quickly,
+    and the interval then doubles up to `period`. Each wait is shortened by
+    a random jitter, so services started together do not announce at once.
+    Every batch carries the interval until the next one, which Main uses to
+    expire the services. The callbacks are called after each batch, so the
+    state which has to be announced along with the services, such as the
+    files of a FileService, is refreshed at the same pace.
+
+    Unless `legacy` is False, every service is also announced on its own
+    with `announce` every ANNOUNCE_PERIOD seconds, for the subscribers which
+    do not implement `announceBatch` and expire services after
+    RESPONSE_TIME."""
+
+    def __init__(self, publisher, period=ANNOUNCE_PERIOD, rng=None, legacy=True):
+        super().__init__(name="Announcer", daemon=True)
+        self.publisher = publisher
+        self.period = period
+        self.legacy = legacy
+        self.services = []
+        self.callbacks = []
+        self.finished = threading.Event()
+        self._interval = min(FIRST_ANNOUNCE_PERIOD, period)
+        self._rng = rng or random.Random()
+
+    def add(self, proxy, service_id=None):
+        """Announce a service, with its identity name as service ID by default."""
+        service_id = service_id or proxy.ice_getIdentity().name
+        self.services.append(IceFlix.ServiceAnnouncement(proxy, service_id))
+
+    def announce(self):
+        """Announce every service once. Returns the interval until the next time."""
+        interval = self._interval
+        self._interval = min(interval * 2, self.period)
+        try:
+            self.publisher.announceBatch(self.services, interval)
+            for callback in self.callbacks:
+                callback()
+        except Ice.Exception as exc:
+            logging.warning("Services not announced: %s", exc)
+        return interval
+
+    def announce_each(self):
+        """Announce every service on its own, with the legacy operation."""
+        try:
+            for service in self.services:
+                self.publisher.announce(service.service, service.serviceId)
+        except Ice.Exception as exc:
+            logging.warning("Services not announced one by one: %s", exc)
+
+    def jittered(self, interval):
+        """Return the interval shortened by a random jitter."""
+        return interval * (1.0 - ANNOUNCE_JITTER * self._rng.random())
+
+    def run(self):
+        "Announce the services until cancelled."
+        now = time.monotonic()
+        next_batch = now
+        next_each = now if self.legacy else float("inf")
+        while not self.finished.is_set():
+            if now >= next_batch:
+                next_batch = now + self.jittered(self.announce())
+            if now >= next_each:
+                self.announce_each()
+                next_each = now + self.jittered(ANNOUNCE_PERIOD)
+            self.finished.wait(min(next_batch, next_each) - now)
+            now = time.monotonic()
+
+    def cancel(self):
+        "Stop announcing."
+        self.finished.set()
+
+
+def verdict_changed(last, healthy, rtt):
+    """Return True if the health of a service has to be shared again, since
+    its state or its latency changed since the last (healthy, rtt) shared."""
+    if last is None or last[0] != healthy:
+        return True
+    if last[1] is None or rtt is None:
+        return last[1] is not rtt
+    return abs(rtt - last[1]) > VERDICT_RTT_CHANGE * last[1]
+
+
+def announce_period(properties, prefix):
+    """Return the maximum interval between announcements set in the
+    `<prefix>.AnnouncePeriod` property."""
+    return float(properties.getPropertyWithDefault(f"{prefix}.AnnouncePeriod",
+        str(ANNOUNCE_PERIOD)))
+
+
+def announce_legacy(properties, prefix):
+    """Return True unless the `<prefix>.AnnounceBatchOnly` property is set, in
+    which case services are only announced in batches."""
+    return properties.getPropertyAsIntWithDefault(f"{prefix}.AnnounceBatchOnly", 0) == 0
+
+
+def start_announcements(topic, proxy, period=ANNOUNCE_PERIOD, callbacks=(), legacy=True):
+    """Announce a service on the Announcements topic at most every period
+    seconds, with its identity name as service ID, calling the callbacks
+    after each announcement. Returns the started Announcer."""
+    announcer = Announcer(IceFlix.AnnouncementPrx.uncheckedCast(topic.getPublisher()), period,
+        legacy=legacy)
+    announcer.add(proxy)
+    announcer.callbacks.extend(callbacks)
+    announcer.start()
+    return announcer
 
 
 class Announcement(IceFlix.Announcement):
@@ -30,124 +192,493 @@ class Announcement(IceFlix.Announcement):
 
     def announce(self, proxy, service_id, current=None):  # pylint:disable=invalid-name, unused-argument
         "Announcements handler."
-        logging.info("Service '%s' announced", service_id)
-        if (checked_proxy := IceFlix.AuthenticatorPrx.checkedCast(proxy)) is not None:
-            if service_id in self.main_servant.authenticator_services:
-                self.main_servant.authenticator_services[service_id][1] = RESPONSE_TIME
-                logging.info("Service '%s' time renewed", service_id)
-            else:
-                self.main_servant.authenticator_services[service_id] = [checked_proxy,
-                    RESPONSE_TIME]
-                logging.info("Service '%s' added to cache: Authenticator", service_id)
-        elif (checked_proxy := IceFlix.MediaCatalogPrx.checkedCast(proxy)) is not None:
-            if service_id in self.main_servant.catalog_services:
-                self.main_servant.catalog_services[service_id][1] = RESPONSE_TIME
-                logging.info("Service '%s' time renewed", service_id)
-            else:
-                self.main_servant.catalog_services[service_id] = [checked_proxy, RESPONSE_TIME]
-                logging.info("Service '%s' added to cache: MediaCatalog", service_id)
-        elif (checked_proxy := IceFlix.FileServicePrx.checkedCast(proxy)) is not None:
-            if service_id in self.main_servant.file_services:
-                self.main_servant.file_services[service_id][1] = RESPONSE_TIME
-                logging.info("Service '%s' time renewed", service_id)
+        return self.dispatch("announce", [(proxy, service_id)], RESPONSE_TIME)
+
+    def announceBatch(self, services, period, current=None):  # pylint:disable=invalid-name, unused-argument
+        """Batched announcements handler. The services expire unless they are
+        announced again within the period."""
+        return self.dispatch("announceBatch",
+            [(announced.service, announced.serviceId) for announced in services],
+            max(period, 0.0) + EXPIRY_MARGIN)
+
+    def dispatch(self, operation, services, lifetime):
+        """Store the announced services whose kind is known, and resolve the
+        others. Returns None, or a future completed once every service has
+        been resolved, so the dispatch thread is released meanwhile."""
+        started = time.perf_counter()
+        request_metrics = self.main_servant.request_metrics[operation]
+        resolver = self.main_servant.resolver
+        resolving = []
+        for proxy, service_id in services:
+            if (resolved := resolver.lookup(proxy, service_id)) is not None:
+                self.store(service_id, *resolved, lifetime=lifetime)
+            elif self.main_servant.should_resolve(service_id):
+                resolving.append((service_id, resolver.resolve(proxy, service_id)))
             else:
-                self.main_servant.file_services[service_id] = [checked_proxy, RESPONSE_TIME]
-                logging.info("Service '%s' added to cache: FileService", service_id)
+                self.main_servant.deferrals_log(service_id)
+        if not resolving:
+            request_metrics.record(started)
+            return None
+        dispatched = self.store_resolved(resolving, lifetime)
+        dispatched.add_done_callback(lambda _: request_metrics.record(started))
+        return dispatched
+
+    def store_resolved(self, resolving, lifetime):
+        """Store the services of the (service ID, future) pairs as their kinds
+        are resolved. Returns a future completed once every one is."""
+        dispatched = Ice.Future()
+        pending = [len(resolving)]
+        lock = threading.Lock()
+
+        def on_done(service_id, future):
+            try:
+                self.on_resolved(service_id, future, lifetime)
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = not pending[0]
+                if finished:
+                    dispatched.set_result(None)
+
+        for service_id, future in resolving:
+            future.add_done_callback(lambda fut, service_id=service_id: on_done(service_id, fut))
+        return dispatched
+
+    def on_resolved(self, service_id, future, lifetime):
+        "Store a service once its kind has been resolved."
+        try:
+            kind, proxy = future.result()
+        except Exception as exc:  # pylint:disable=broad-except
+            logging.info("Service '%s' ignored: unreachable (%s)", service_id, exc)
         else:
+            self.store(service_id, kind, proxy, resolved=True, lifetime=lifetime)
+
+    def store(self, service_id, kind, proxy, resolved=False, lifetime=RESPONSE_TIME):  # pylint:disable=too-many-arguments
+        """Store or renew a service in the registry of its kind, until its
+        lifetime is over. Services just resolved are shared with the other
+        Main services."""
+        main_servant = self.main_servant
+        if kind is None or (kind == "Main" and not main_servant.accepts_peer(service_id)):
             logging.info("Service '%s' ignored: is either Main or invalid", service_id)
+            return
+        registry = main_servant.registry_of(kind)
+        if main_servant.register_service(registry, service_id, proxy, lifetime):
+            logging.info("Service '%s' added to cache: %s", service_id, kind)
+            if kind == main_servant.peers.registry.kind:
+                main_servant.share_registry(service_id)
+            elif resolved:
+                main_servant.publish_resolved(kind, service_id, proxy, lifetime)
+        else:
+            main_servant.renewals_log(service_id)
 
 
-class Main(IceFlix.Main):
+class FileAvailability(IceFlix.FileAvailabilityAnnounce):  # pylint:disable=too-few-public-methods
+    """Servant for the IceFlix.FileAvailabilityAnnounce interface, which
+    records the media held by each FileService."""
+
+    def __init__(self, main_servant):
+        self.main_servant = main_servant
+
+    def announceFiles(self, mediaIds, serviceId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "File availability announcements handler."
+        self.main_servant.register_media(serviceId, mediaIds)
+        logging.info("%d files announced by '%s'", len(mediaIds), serviceId)
+
+
+class MainUpdates(IceFlix.MainUpdate):
+    """Servant for the IceFlix.MainUpdate interface, which applies what the
+    other Main services share."""
+
+    def __init__(self, main_servant):
+        self.main_servant = main_servant
+
+    def servicesResolved(self, services, mainId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Store the services resolved by another Main."
+        if mainId != self.main_servant.peers.own_id:
+            for resolved in services:
+                self.main_servant.store_resolved(SERVICE_KINDS[resolved.kind],
+                    resolved.serviceId, resolved.service, resolved.lifetime)
+
+    def healthVerdicts(self, verdicts, mainId, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Apply the health of the services probed by another Main."
+        if mainId != self.main_servant.peers.own_id:
+            self.main_servant.apply_verdicts(verdicts)
+
+
+class Main(IceFlix.Main):  # pylint:disable=too-many-instance-attributes, too-many-public-methods
     """Servant for the IceFlix.Main interface."""
 
     def __init__(self):
-        self.authenticator_services = {}
-        self.catalog_services = {}
-        self.file_services = {}
-        self.service_timer = RepeatTimer(1.0, self.check_timeouts)
-        self.service_timer.start()
-        self.auth_pointer = 0
-        self.catalog_pointer = 0
-        self.file_pointer = 0
+        self.metrics = Metrics()
+        self.authenticator_services = ServiceRegistry("Authenticator")
+        self.catalog_services = ServiceRegistry("MediaCatalog")
+        self.file_services = ServiceRegistry("FileService")
+        self.registries = {registry.kind: registry for registry in (
+            self.authenticator_services, self.catalog_services, self.file_services)}
+        self.media_index = MediaIndex()
+        self.media_policy = RoundRobinPolicy()
+        self.peers = MainPeers()
+        self.updates = None
+        self.shared_health = {}
+        self.deferred = collections.OrderedDict()
+        self.deferred_lock = threading.Lock()
+        self.renewals_log = LogSummary("Services time renewed")
+        self.deferrals_log = LogSummary("Services left to the Main probing them")
+        self.resolver = ServiceResolver(self.metrics)
+        self.expiry_scheduler = ExpiryScheduler(self.expire_service)
+        self.expiry_scheduler.start()
+        self.health_prober = HealthProber(tuple(self.registries.values()),
+            metrics=self.metrics)
+        self.peer_prober = HealthProber((self.peers.registry,), metrics=self.metrics)
+        self.pending_lookups = PendingLookups(0.0)
+        for registry in self.registries.values():
+            registry.on_available = self.pending_lookups.wake
+        self.request_metrics = {operation: RequestMetrics(self.metrics, operation)
+            for operation in OPERATIONS}
+        self.lookups_log = CounterSummary("Lookups answered", {operation:
+            self.request_metrics[operation].requests for operation in LOOKUPS})
+        self.expiries = {kind: self.metrics.counter("iceflix_expiries_total",
+            "Services removed because their expiry time was reached.", kind=kind)
+            for kind in (*self.registries, self.peers.registry.kind)}
+        self.register_gauges()
+
+    def register_gauges(self):
+        """Create the gauges reporting the state of the registries, the expiry
+        scheduler and the waiting lookups."""
+        for kind, registry in self.registries.items():
+            self.metrics.gauge("iceflix_services", "Services stored by kind.",
+                registry.__len__, kind=kind)
+            self.metrics.gauge("iceflix_online_services", "Online services stored by kind.",
+                lambda reg=registry: sum(entry.healthy for entry in reg.snapshot()), kind=kind)
+            for field, name, description in SERVICE_GAUGES:
+                self.metrics.gauge_set(name, description,
+                    lambda reg=registry, field=field: [({"service": stats["service_id"]},
+                        stats[field]) for stats in reg.stats()], kind=kind)
+        scheduler = self.expiry_scheduler
+        self.metrics.gauge("iceflix_timer_lag_seconds",
+            "Delay of the last expiry with respect to its deadline.", lambda: scheduler.lag)
+        self.metrics.gauge("iceflix_timer_max_lag_seconds",
+            "Maximum delay of an expiry with respect to its deadline.",
+            lambda: scheduler.max_lag)
+        self.metrics.gauge("iceflix_timer_queue_size",
+            "Entries in the expiry heap, including outdated ones.",
+            lambda: scheduler.queue_size)
+        self.metrics.gauge("iceflix_pending_lookups",
+            "Lookups waiting for a service to become online.", self.pending_lookups.__len__)
+        self.metrics.gauge("iceflix_media",
+            "Media held by at least one FileService.", self.media_index.__len__)
+        self.metrics.gauge("iceflix_peers",
+            "Other Main services sharing their registries.", self.peers.__len__)
+
+    def configure(self, properties):
+        """Apply the settings of the `Main.*` properties."""
+        policy = properties.getPropertyWithDefault("Main.Balancing", RoundRobinPolicy.name)
+        for registry in self.registries.values():
+            registry.policy = create_policy(policy)
+        self.media_policy = create_policy(policy)
+        logging.info("Balancing policy: %s", policy)
+        self.health_prober.interval = float(properties.getPropertyWithDefault(
+            "Main.ProbeInterval", str(self.health_prober.interval)))
+        self.peer_prober.interval = self.health_prober.interval
+        self.pending_lookups.wait = float(properties.getPropertyWithDefault(
+            "Main.LookupWait", str(self.pending_lookups.wait)))
+
+    def shutdown(self):
+        """Stop the background threads of the servant."""
+        self.expiry_scheduler.stop()
+        self.pending_lookups.cancel_all()
+        for summary in (self.lookups_log, self.renewals_log, self.deferrals_log):
+            summary.flush()
+
+    def service_stats(self):
+        """Return the state of every service stored, by kind."""
+        return {kind: registry.stats() for kind, registry in self.registries.items()}
+
+    def get_service(self, registry, operation):
+        """Return the online service from the registry chosen by its balancing
+        policy, as seen by the last health checks.
+
+        If there is none, and lookups are allowed to wait, a future is returned
+        instead, which is completed as soon as a service becomes online."""
+        started = time.perf_counter()
+        request_metrics = self.request_metrics[operation]
+        if (entry := registry.next()) is None:
+            if self.pending_lookups.wait > 0:
+                future = self.pending_lookups.park(registry, operation)
+                future.add_done_callback(lambda fut: request_metrics.record(started,
+                    fut.exception() is not None))
+                return future
+            request_metrics.record(started, unavailable=True)
+            raise IceFlix.TemporaryUnavailable()
+        logging.debug("%s: service '%s' returned", operation, entry.service_id)
+        request_metrics.record(started)
+        return entry.proxy
 
     def getAuthenticator(self, current=None):  # pylint:disable=invalid-name, unused-argument
         "Return the stored Authenticator proxy."
-        if self.authenticator_services:
-            while True:
-                if self.auth_pointer >= len(self.authenticator_services):
-                    self.auth_pointer = 0
-                service_id, proxy = list(self.authenticator_services.items())[self.auth_pointer]
-                self.auth_pointer += 1
-                try:
-                    proxy[0].ice_ping()
-                    logging.info("getAuthenticator: service '%s' returned", service_id)
-                    return proxy[0]
-                except Exception as exc:
-                    self.authenticator_services.pop(service_id)
-                    logging.info("Service '%s' deleted from cache: offline", service_id)
-                    if not self.authenticator_services:
-                        raise IceFlix.TemporaryUnavailable() from exc
-        raise IceFlix.TemporaryUnavailable()
+        return self.get_service(self.authenticator_services, "getAuthenticator")
 
     def getCatalog(self, current=None):  # pylint:disable=invalid-name, unused-argument
         "Return the stored MediaCatalog proxy."
-        if self.catalog_services:
-            while True:
-                if self.catalog_pointer >= len(self.catalog_services):
-                    self.catalog_pointer = 0
-                service_id, proxy = list(self.catalog_services.items())[0]
-                self.catalog_pointer += 1
-                try:
-                    proxy[0].ice_ping()
-                    logging.info("getCatalog: service '%s' returned", service_id)
-                    return proxy[0]
-                except Exception as exc:
-                    self.catalog_services.pop(service_id)
-                    logging.info("Service '%s' deleted from cache: offline", service_id)
-                    if not self.catalog_services:
-                        raise IceFlix.TemporaryUnavailable() from exc
-        raise IceFlix.TemporaryUnavailable()
+        return self.get_service(self.catalog_services, "getCatalog")
 
     def getFileService(self, current=None):  # pylint:disable=invalid-name, unused-argument
         "Return the stored FileService proxy."
-        if self.file_services:
-            while True:
-                if self.file_pointer >= len(self.file_services):
-                    self.file_pointer = 0
-                service_id, proxy = list(self.file_services.items())[0]
-                self.file_pointer += 1
-                try:
-                    proxy[0].ice_ping()
-                    logging.info("getFileService: service '%s' returned", service_id)
-                    return proxy[0]
-                except Exception as exc:
-                    self.file_services.pop(service_id)
-                    logging.info("Service '%s' deleted from cache: offline", service_id)
-                    if not self.file_services:
-                        raise IceFlix.TemporaryUnavailable() from exc
-        raise IceFlix.TemporaryUnavailable()
-
-    def check_timeouts(self):
-        """Decrements the wait times of services stored and removes them if it
-        reaches 0."""
-        for service_id, proxy_and_time in self.authenticator_services.copy().items():
-            proxy_and_time[1] -= 1
-            if proxy_and_time[1] == 0:
-                self.authenticator_services.pop(service_id)
-                logging.info("Service '%s' deleted from cache: time expired", service_id)
-        for service_id, proxy_and_time in self.catalog_services.copy().items():
-            proxy_and_time[1] -= 1
-            if proxy_and_time[1] == 0:
-                self.catalog_services.pop(service_id)
-                logging.info("Service '%s' deleted from cache: time expired", service_id)
-        for service_id, proxy_and_time in self.file_services.copy().items():
-            proxy_and_time[1] -= 1
-            if proxy_and_time[1] == 0:
-                self.file_services.pop(service_id)
-                logging.info("Service '%s' deleted from cache: time expired", service_id)
-
-
-class MainApp(Ice.Application):
+        return self.get_service(self.file_services, "getFileService")
+
+    def getServices(self, current=None):  # pylint:disable=invalid-name, unused-argument
+        "Return a stored proxy of each kind, or null for the unavailable kinds."
+        started = time.perf_counter()
+        proxies = [entry.proxy if (entry := registry.next()) is not None else None
+            for registry in (self.authenticator_services, self.catalog_services,
+                             self.file_services)]
+        if not any(proxies):
+            self.request_metrics["getServices"].record(started, unavailable=True)
+            raise IceFlix.TemporaryUnavailable()
+        logging.debug("getServices: services returned")
+        self.request_metrics["getServices"].record(started)
+        return IceFlix.ServiceBundle(*proxies)
+
+    def getCandidates(self, kind, max_count, known_version, current=None):  # pylint:disable=invalid-name, unused-argument
+        """Return up to `max_count` online proxies of the given kind, unless
+        the registry version known by the client is the current one."""
+        started = time.perf_counter()
+        request_metrics = self.request_metrics["getCandidates"]
+        registry = self.registries[SERVICE_KINDS[kind]]
+        version = registry.version
+        if known_version == version and registry:
+            request_metrics.record(started)
+            return IceFlix.ServiceCandidates(version, [])
+        if not (candidates := registry.candidates(max_count)):
+            request_metrics.record(started, unavailable=True)
+            raise IceFlix.TemporaryUnavailable()
+        logging.debug("getCandidates: %d services returned", len(candidates))
+        request_metrics.record(started)
+        return IceFlix.ServiceCandidates(version, [entry.proxy for entry in candidates])
+
+    def getFileServiceFor(self, mediaId, current=None):  # pylint:disable=invalid-name, unused-argument
+        """Return an online FileService holding the media, chosen by the
+        balancing policy among those holding it."""
+        started = time.perf_counter()
+        request_metrics = self.request_metrics["getFileServiceFor"]
+        if (holders := self.media_index.holders(mediaId)) is None:
+            request_metrics.record(started, unavailable=True)
+            raise IceFlix.WrongMediaId(mediaId)
+        entries = [entry for service_id in holders
+            if (entry := self.file_services.get(service_id)) is not None]
+        if (entry := self.media_policy.choose(entries)) is None:
+            request_metrics.record(started, unavailable=True)
+            raise IceFlix.TemporaryUnavailable()
+        entry.selected += 1
+        logging.debug("getFileServiceFor: service '%s' returned", entry.service_id)
+        request_metrics.record(started)
+        return entry.proxy
+
+    def register_media(self, service_id, media_ids):
+        """Record the media held by a FileService, replacing the ones it
+        announced before. They are forgotten when the service expires, or
+        after the response time if it has not been announced yet."""
+        self.media_index.replace(service_id, media_ids)
+        if service_id not in self.file_services:
+            self.expiry_scheduler.schedule((self.file_services, service_id),
+                time.monotonic() + RESPONSE_TIME)
+
+    def registry_of(self, kind):
+        """Return the registry of the services of a kind, Main ones included."""
+        if kind == self.peers.registry.kind:
+            return self.peers.registry
+        return self.registries[kind]
+
+    def accepts_peer(self, service_id):
+        """Return True if an announced Main is another replica of this one."""
+        return self.updates is not None and service_id != self.peers.own_id
+
+    def should_resolve(self, service_id):
+        """Return True if an announced service whose kind is unknown has to be
+        resolved by this Main.
+
+        When replicated, only the Main probing the service resolves it and
+        shares its kind, unless the service is announced again before."""
+        if self.updates is None or self.peers.owns(service_id):
+            return True
+        with self.deferred_lock:
+            if self.deferred.pop(service_id, None) is not None:
+                return True
+            self.deferred[service_id] = True
+            if len(self.deferred) > DEFERRED_CACHE_SIZE:
+                self.deferred.popitem(last=False)
+        return False
+
+    def publish_resolved(self, kind, service_id, proxy, lifetime=RESPONSE_TIME):
+        """Share with the other Main services a service whose kind has just
+        been resolved."""
+        if self.updates is not None and kind in KIND_VALUES:
+            self.publish_update("servicesResolved", [IceFlix.ResolvedService(
+                KIND_VALUES[kind], proxy, service_id, lifetime)])
+
+    def publish_update(self, operation, *args):
+        """Publish an update on the MainUpdates topic. Failures are only
+        logged, so they never abort an announcement or the health checks."""
+        try:
+            getattr(self.updates, operation)(*args, self.peers.own_id)
+            return True
+        except Ice.Exception as exc:
+            logging.warning("Update '%s' not published: %s", operation, exc)
+            return False
+
+    def share_registry(self, joined):
+        """Share with a Main which has just joined the services probed by this
+        one until then, so it knows every service right away, and their
+        health on the next round of health checks."""
+        if self.updates is None:
+            return
+        own_id = self.peers.own_id
+        members = [member for member in self.peers.members() if member != joined]
+        now = time.monotonic()
+        services = [IceFlix.ResolvedService(KIND_VALUES[kind], entry.proxy, entry.service_id,
+                entry.deadline - now)
+            for kind, registry in self.registries.items() for entry in registry.snapshot()
+            if entry.verified and rendezvous_owner(entry.service_id, members) == own_id]
+        self.shared_health = {}
+        if services and self.publish_update("servicesResolved", services):
+            logging.info("%d services shared with '%s'", len(services), joined)
+
+    def store_resolved(self, kind, service_id, proxy, lifetime=RESPONSE_TIME):
+        """Store a service resolved by another Main, without resolving it again,
+        for the lifetime it has left there."""
+        with self.deferred_lock:
+            self.deferred.pop(service_id, None)
+        if lifetime <= 0:
+            return
+        _, proxy = self.resolver.store(proxy, service_id, kind)
+        if self.register_service(self.registries[kind], service_id, proxy, lifetime):
+            logging.info("Service '%s' added to cache by a replica: %s", service_id, kind)
+
+    def probe(self):
+        """Check the health of the services probed by this Main and of the
+        other Main services, and share the health which changed since it was
+        last shared."""
+        self.health_prober.probe()
+        if self.updates is None:
+            return
+        self.peer_prober.probe()
+        owns = self.peers.owns
+        previous, shared, verdicts = self.shared_health, {}, []
+        for kind, registry in self.registries.items():
+            for entry in registry.snapshot():
+                if entry.next_probe <= 0 or not owns(entry.service_id):
+                    continue
+                last = previous.get(entry.service_id)
+                if not verdict_changed(last, entry.healthy, entry.rtt):
+                    shared[entry.service_id] = last
+                    continue
+                shared[entry.service_id] = (entry.healthy, entry.rtt)
+                verdicts.append(IceFlix.ServiceHealth(KIND_VALUES[kind], entry.service_id,
+                    entry.healthy, -1.0 if entry.rtt is None else entry.rtt))
+        self.shared_health = shared
+        if verdicts and len(self.peers.members()) > 1:
+            self.publish_update("healthVerdicts", verdicts)
+
+    def apply_verdicts(self, verdicts):
+        """Apply the health of services probed by another Main, unless they are
+        probed by this one."""
+        for verdict in verdicts:
+            registry = self.registries[SERVICE_KINDS[verdict.kind]]
+            entry = registry.get(verdict.serviceId)
+            if entry is None or self.peers.owns(entry.service_id):
+                continue
+            if verdict.rtt >= 0:
+                entry.rtt = verdict.rtt
+            if registry.set_health(entry, verdict.healthy):
+                logging.info("Service '%s' marked as %s by a replica", entry.service_id,
+                    "online" if verdict.healthy else "offline")
+
+    def register_service(self, registry, service_id, proxy, lifetime=RESPONSE_TIME):
+        """Store a service in the registry, or renew its expiry time if it was
+        already stored. Returns True if the service was not stored."""
+        now = time.monotonic()
+        deadline = now + lifetime
+        added = registry.add(service_id, proxy, deadline, seen=now)
+        self.expiry_scheduler.schedule((registry, service_id), deadline)
+        return added
+
+    def snapshot_services(self):
+        """Return the (kind, service ID, proxy, last seen, lifetime) tuples of
+        the verified services, with last seen times as Unix timestamps."""
+        offset = time.time() - time.monotonic()
+        return [(kind, entry.service_id, str(entry.proxy), entry.seen + offset, entry.lifetime)
+            for kind, registry in self.registries.items()
+            for entry in registry.snapshot() if entry.verified and entry.seen is not None]
+
+    def restore_services(self, services, communicator):
+        """Store the services of a snapshot as unverified, so they can be
+        returned right away, and confirm their kind in the background. Each one
+        is kept for the rest of the lifetime of its last announcement, and at
+        least for the response time. Returns the number of services restored."""
+        now = time.monotonic()
+        offset = time.time() - now
+        restored = 0
+        for kind, service_id, proxy, last_seen, *lifetime in services:
+            if (registry := self.registries.get(kind)) is None:
+                continue
+            try:
+                proxy = communicator.stringToProxy(proxy)
+            except Ice.LocalException as exc:
+                logging.info("Service '%s' not restored: %s", service_id, exc)
+                continue
+            _, proxy = self.resolver.store(proxy, service_id, kind)
+            seen = last_seen - offset
+            deadline = max(seen + (lifetime[0] if lifetime else RESPONSE_TIME),
+                now + RESPONSE_TIME)
+            if registry.add(service_id, proxy, deadline, verified=False, seen=seen):
+                self.expiry_scheduler.schedule((registry, service_id), deadline)
+                self.confirm_service(registry, registry[service_id])
+                restored += 1
+        return restored
+
+    def confirm_service(self, registry, entry):
+        """Check asynchronously that a restored service still implements the
+        interface of its kind, removing it otherwise."""
+        def on_result(future):
+            try:
+                confirmed = future.result()
+            except Exception as exc:  # pylint:disable=broad-except
+                confirmed = exc
+            if confirmed is True or entry.verified:
+                entry.verified = True
+                return
+            if registry.get(entry.service_id) is entry:
+                registry.remove(entry.service_id)
+                self.resolver.forget(entry.service_id)
+                self.expiry_scheduler.cancel((registry, entry.service_id))
+            logging.info("Restored service '%s' deleted from cache: %s", entry.service_id,
+                confirmed or "wrong kind")
+
+        proxy = entry.proxy.ice_invocationTimeout(self.health_prober.timeout)
+        try:
+            future = proxy.ice_isAAsync(TYPE_IDS[registry.kind])
+        except Exception:  # pylint:disable=broad-except
+            future = Ice.Future()
+            future.set_result(False)
+        future.add_done_callback(on_result)
+
+    def expire_service(self, key):
+        """Remove a service from its registry once its expiry time has been
+        reached, unless it was renewed in the meantime. The media held by an
+        expired FileService are forgotten too."""
+        registry, service_id = key
+        if (entry := registry.get(service_id)) is not None:
+            if entry.deadline > time.monotonic():
+                return
+            registry.remove(service_id)
+            self.resolver.forget(service_id)
+            self.expiries[registry.kind].inc()
+            logging.info("Service '%s' deleted from cache: time expired", service_id)
+        if registry is self.file_services and self.media_index.remove_service(service_id):
+            logging.info("Media of service '%s' deleted from cache", service_id)
+
+
+class MainApp(Ice.Application):  # pylint:disable=too-many-instance-attributes
     """Ice.Application for a Main service."""
 
     def __init__(self):
@@ -155,36 +686,116 @@ class MainApp(Ice.Application):
         self.servant = Main()
         self.main_proxy = None
         self.announcement_proxy = None
+        self.availability_proxy = None
+        self.availability_topic = None
+        self.updates_proxy = None
+        self.updates_topic = None
         self.adapter = None
         self.topic = None
+        self.snapshot_file = None
+        self.snapshot_timer = None
         self.announcements_timer = None
+        self.probe_timer = None
+        self.summary_timer = None
+        self.metrics_server = None
+
+    @staticmethod
+    def initialization_data(args):
+        """Return the initialization data of the communicator, sizing its thread
+        pools from the `Main.Threads` property unless they are set explicitly.
+
+        Since lookups and announcements are dispatched asynchronously, a few
+        threads are enough to serve many concurrent requests."""
+        init_data = Ice.InitializationData()
+        init_data.properties = Ice.createProperties(list(args))
+        properties = init_data.properties
+        properties.parseCommandLineOptions("Main", list(args))
+        threads = properties.getPropertyAsIntWithDefault("Main.Threads", os.cpu_count() or 1)
+        for pool in ("Ice.ThreadPool.Server", "Ice.ThreadPool.Client"):
+            if not properties.getProperty(pool + ".Size"):
+                properties.setProperty(pool + ".Size", str(threads))
+            if not properties.getProperty(pool + ".SizeMax"):
+                properties.setProperty(pool + ".SizeMax", str(threads))
+        return init_data
 
     def get_topic(self, topic_name):
         """Returns proxy for the TopicManager from IceStorm."""
-        topic_manager = self.communicator().propertyToProxy('IceStorm.TopicManager')
-        topic_manager = IceStorm.TopicManagerPrx.checkedCast(topic_manager)  # pylint:disable=no-member
+        return get_topic(self.communicator(), topic_name)
 
+    def store_snapshot(self):
+        """Save the verified services to the snapshot file."""
         try:
-            return topic_manager.retrieve(topic_name)
-        except IceStorm.NoSuchTopic:  # pylint:disable=no-member
-            return topic_manager.create(topic_name)
+            save_snapshot(self.snapshot_file, self.servant.snapshot_services())
+        except OSError as exc:
+            logging.warning("Snapshot '%s' not saved: %s", self.snapshot_file, exc)
+
+    def restore_snapshot(self, properties):
+        """Restore the services of the snapshot file, if set, and save them
+        periodically."""
+        if not (snapshot_file := properties.getProperty("Main.SnapshotFile")):
+            return
+        self.snapshot_file = snapshot_file
+        max_age = float(properties.getPropertyWithDefault("Main.SnapshotMaxAge",
+            str(SNAPSHOT_MAX_AGE)))
+        restored = self.servant.restore_services(load_snapshot(snapshot_file, max_age),
+            self.communicator())
+        logging.info("%d services restored from '%s'", restored, snapshot_file)
+        period = float(properties.getPropertyWithDefault("Main.SnapshotPeriod",
+            str(SNAPSHOT_PERIOD)))
+        self.snapshot_timer = RepeatTimer(period, self.store_snapshot)
+        self.snapshot_timer.start()
+
+    def join_replicas(self):
+        """Subscribe to the MainUpdates topic, so the services resolved and the
+        health checks are shared with the other Main services, which are
+        found through the Announcements topic."""
+        peers = self.servant.peers
+        peers.own_id = self.main_proxy.ice_getIdentity().name
+        self.servant.health_prober.owns = peers.owns
+        self.updates_topic = self.get_topic("MainUpdates")
+        self.updates_proxy = self.adapter.addWithUUID(MainUpdates(self.servant))
+        self.updates_topic.subscribeAndGetPublisher({}, self.updates_proxy)
+        self.servant.updates = IceFlix.MainUpdatePrx.uncheckedCast(
+            self.updates_topic.getPublisher().ice_oneway())
+        logging.info("Sharing the registry with other Main services as '%s'", peers.own_id)
 
     def run(self, args):
         """Run the application, adding the needed objects to the adapter."""
 
         logging.info("Running Main application")
         comm = self.communicator()
+        self.servant.configure(comm.getProperties())
+        self.restore_snapshot(comm.getProperties())
         self.adapter = comm.createObjectAdapter("MainAdapter")
         self.adapter.activate()
         self.main_proxy = self.adapter.addWithUUID(self.servant)
         logging.info("Main proxy is '%s'", self.main_proxy)
 
+        # Share the registry with the other Main services, subscribing before
+        # the first announcement, on which they share their services
+        if comm.getProperties().getPropertyAsIntWithDefault("Main.Replicated", 0) > 0:
+            self.join_replicas()
+
         # Publish announcements
         self.topic = self.get_topic("Announcements")
-        announcement_publisher = IceFlix.AnnouncementPrx.uncheckedCast(self.topic.getPublisher())
-        self.announcements_timer = RepeatTimer(8.0, announcement_publisher.announce, \
-            [self.main_proxy, self.main_proxy.ice_getIdentity().name])
-        self.announcements_timer.start()
+        self.announcements_timer = start_announcements(self.topic, self.main_proxy,
+            announce_period(comm.getProperties(), "Main"),
+            legacy=announce_legacy(comm.getProperties(), "Main"))
+
+        # Expose the metrics as an admin facet, and optionally through HTTP
+        comm.addAdminFacet(MetricsFacet(self.servant.metrics), METRICS_FACET)
+        if endpoint := comm.getProperties().getProperty("Main.MetricsEndpoint"):
+            host, port = endpoint.rsplit(":", 1)
+            self.metrics_server = MetricsServer(self.servant.metrics, host, int(port))
+            self.metrics_server.start()
+
+        # Check the health of the stored services in the background
+        self.probe_timer = RepeatTimer(self.servant.health_prober.interval, self.servant.probe)
+        self.probe_timer.start()
+
+        # Summarize the lookups counted by the dispatch threads
+        self.summary_timer = RepeatTimer(SUMMARY_INTERVAL, self.servant.lookups_log.flush)
+        self.summary_timer.start()
 
         # Subscribe and receive announcements
         announcement_subscriber = Announcement(self.servant)
@@ -194,11 +805,27 @@ class MainApp(Ice.Application):
         self.topic.subscribeAndGetPublisher(qos, self.announcement_proxy)
         logging.info("Topic '%s': waiting events... '%s'", self.topic, self.announcement_proxy)
 
+        # Subscribe and receive the media held by the FileServices
+        self.availability_topic = self.get_topic("FileAvailabilityAnnounces")
+        self.availability_proxy = self.adapter.addWithUUID(FileAvailability(self.servant))
+        self.availability_topic.subscribeAndGetPublisher(qos, self.availability_proxy)
+
         self.shutdownOnInterrupt()
         comm.waitForShutdown()
 
         self.topic.unsubscribe(self.announcement_proxy)
-        self.servant.service_timer.cancel()
+        self.availability_topic.unsubscribe(self.availability_proxy)
+        if self.updates_topic is not None:
+            self.updates_topic.unsubscribe(self.updates_proxy)
+        self.servant.shutdown()
         self.announcements_timer.cancel()
+        self.probe_timer.cancel()
+        self.summary_timer.cancel()
+        if self.snapshot_timer is not None:
+            self.snapshot_timer.cancel()
+            self.snapshot_timer.join()
+            self.store_snapshot()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
 
         return 0
@@ -0,0 +1,106 @@
+"""Module containing the index of the FileServices holding each media."""
+
+import threading
+
+
+def slots_of(mask):
+    """Yield the positions of the bits set in a mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class MediaIndex:
+    """Thread-safe index of the FileServices holding each media.
+
+    Each service gets a slot, and each media the bitmask of the slots of
+    the services holding it, so a media costs a single small integer besides
+    its ID. An announcement replaces the media of its service, only touching
+    the media added or removed since the last one, and removing a service
+    only touches its own media, whose IDs are kept per slot. Slots are
+    reused once their service is removed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._media = {}
+        self._slots = {}
+        self._services = []
+        self._held = []
+        self._free = []
+
+    def __len__(self):
+        return len(self._media)
+
+    def __contains__(self, media_id):
+        return media_id in self._media
+
+    @property
+    def services(self):
+        "Number of services with media in the index."
+        return len(self._slots)
+
+    def _slot(self, service_id):
+        "Return the slot of a service, assigning a new one if needed."
+        if (slot := self._slots.get(service_id)) is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            self._services[slot] = service_id
+        else:
+            slot = len(self._services)
+            self._services.append(service_id)
+            self._held.append(None)
+        self._held[slot] = set()
+        self._slots[service_id] = slot
+        return slot
+
+    def _unset(self, slot, media_ids):
+        "Clear the bit of a slot from the given media, dropping those left unheld."
+        keep = ~(1 << slot)
+        media = self._media
+        for media_id in media_ids:
+            if mask := media[media_id] & keep:
+                media[media_id] = mask
+            else:
+                del media[media_id]
+
+    def replace(self, service_id, media_ids):
+        """Record that a service holds the given media and no others, since
+        each announcement carries every media of the service. Returns the
+        number of media added and removed."""
+        media_ids = set(media_ids)
+        if not media_ids:
+            return 0, self.remove_service(service_id)
+        with self._lock:
+            slot = self._slot(service_id)
+            held = self._held[slot]
+            added, removed = media_ids - held, held - media_ids
+            bit = 1 << slot
+            media = self._media
+            for media_id in added:
+                media[media_id] = media.get(media_id, 0) | bit
+            self._unset(slot, removed)
+            self._held[slot] = media_ids
+            return len(added), len(removed)
+
+    def remove_service(self, service_id):
+        """Forget every media held by a service. Returns how many there were."""
+        with self._lock:
+            if (slot := self._slots.pop(service_id, None)) is None:
+                return 0
+            held = self._held[slot]
+            self._unset(slot, held)
+            self._services[slot] = None
+            self._held[slot] = None
+            self._free.append(slot)
+            return len(held)
+
+    def holders(self, media_id):
+        """Return the IDs of the services holding a media, or None if no
+        service holds it."""
+        mask = self._media.get(media_id)
+        if mask is None:
+            return None
+        services = self._services
+        return [services[slot] for slot in slots_of(mask)]
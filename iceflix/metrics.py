@@ -0,0 +1,293 @@
+"""Module containing the metrics of the Main service and their exposition."""
+
+import bisect
+import logging
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import IceFlix  # pylint:disable=import-error
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Shards:
+    """Per-thread lists of values, summed up when read.
+
+    Each thread only writes to its own list, so recording a value takes no
+    lock and allocates nothing once the list of the thread exists."""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def local(self):
+        """Return the list of values of the calling thread."""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0] * self._size
+            with self._lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def totals(self):
+        """Return the sum of the values of every thread."""
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*shards)] if shards else [0] * self._size
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._shards = Shards(1)
+
+    def inc(self, amount=1):
+        """Add the amount to the counter."""
+        self._shards.local()[0] += amount
+
+    @property
+    def value(self):
+        "Current value of the counter."
+        return self._shards.totals()[0]
+
+    def samples(self, name, labels):
+        """Return the (name, labels, value) samples of the counter."""
+        return [(name, labels, self.value)]
+
+
+class Gauge:
+    """Value read from a function when the metrics are collected."""
+
+    kind = "gauge"
+
+    def __init__(self, function):
+        self._function = function
+
+    @property
+    def value(self):
+        "Current value of the gauge."
+        return self._function()
+
+    def samples(self, name, labels):
+        """Return the (name, labels, value) samples of the gauge."""
+        return [(name, labels, self.value)]
+
+
+class GaugeSet:
+    """Values of a set of gauges read from a function when the metrics are
+    collected, each with its own labels, for sets which change over time."""
+
+    kind = "gauge"
+
+    def __init__(self, function):
+        self._function = function
+
+    def samples(self, name, labels):
+        """Return the (name, labels, value) samples of the gauges which have a
+        value."""
+        return [(name, labels + tuple(sorted(extra.items())), value)
+            for extra, value in self._function() if value is not None]
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One slot per bucket, plus the overflow bucket, the sum and the count
+        self._shards = Shards(len(self.buckets) + 3)
+
+    def observe(self, value):
+        """Record an observed value."""
+        values = self._shards.local()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @property
+    def count(self):
+        "Number of observed values."
+        return self._shards.totals()[-1]
+
+    def quantile(self, quantile):
+        """Estimate a quantile of the observed values, as the upper bound of
+        the bucket where it falls."""
+        totals = self._shards.totals()
+        rank = quantile * totals[-1]
+        seen = 0
+        for bound, observed in zip(self.buckets, totals):
+            seen += observed
+            if seen >= rank and seen > 0:
+                return bound
+        return float("inf") if totals[-1] else 0.0
+
+    def samples(self, name, labels):
+        """Return the (name, labels, value) samples of the histogram, with
+        cumulative buckets."""
+        totals = self._shards.totals()
+        samples = []
+        cumulative = 0
+        for bound, observed in zip(self.buckets + (float("inf"),), totals):
+            cumulative += observed
+            samples.append((name + "_bucket", labels + (("le", format_value(bound)),),
+                cumulative))
+        samples.append((name + "_sum", labels, totals[-2]))
+        samples.append((name + "_count", labels, totals[-1]))
+        return samples
+
+
+def format_value(value):
+    """Format a value in the text exposition format."""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_labels(labels):
+    """Format a tuple of (name, value) labels in the text exposition format."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """Set of named metrics, each of them with an optional set of labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def _register(self, name, description, metric, labels):
+        "Store a metric under its name and labels."
+        with self._lock:
+            family = self._families.setdefault(name, (metric.kind, description, {}))
+            family[2][tuple(sorted(labels.items()))] = metric
+        return metric
+
+    def counter(self, name, description, **labels):
+        """Create a counter."""
+        return self._register(name, description, Counter(), labels)
+
+    def gauge(self, name, description, function, **labels):
+        """Create a gauge whose value is returned by the function."""
+        return self._register(name, description, Gauge(function), labels)
+
+    def gauge_set(self, name, description, function, **labels):
+        """Create a set of gauges whose (labels, value) pairs are returned by
+        the function."""
+        return self._register(name, description, GaugeSet(function), labels)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS, **labels):
+        """Create a histogram."""
+        return self._register(name, description, Histogram(buckets), labels)
+
+    def get(self, name, **labels):
+        """Return the metric with the given name and labels."""
+        return self._families[name][2][tuple(sorted(labels.items()))]
+
+    def expose(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            families = [(name, kind, description, list(metrics.items()))
+                for name, (kind, description, metrics) in sorted(self._families.items())]
+        lines = []
+        for name, kind, description, metrics in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    lines.append(f"{sample}{format_labels(sample_labels)} "
+                        f"{format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:  # pylint:disable=too-few-public-methods
+    """Number of requests, unavailable answers and latency of an operation."""
+
+    def __init__(self, metrics, operation):
+        self.requests = metrics.counter("iceflix_requests_total",
+            "Requests received by operation.", operation=operation)
+        self.unavailable = metrics.counter("iceflix_unavailable_total",
+            "Requests answered with TemporaryUnavailable by operation.", operation=operation)
+        self.latency = metrics.histogram("iceflix_request_seconds",
+            "Time taken to answer the requests by operation.", operation=operation)
+
+    def record(self, started, unavailable=False):
+        """Record a request which started at the given `time.perf_counter()`."""
+        self.latency.observe(time.perf_counter() - started)
+        self.requests.inc()
+        if unavailable:
+            self.unavailable.inc()
+
+
+class MetricsFacet(IceFlix.MainMetrics):  # pylint:disable=too-few-public-methods
+    """Servant for the IceFlix.MainMetrics interface, added as an admin facet
+    of the communicator."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def expose(self, current=None):  # pylint:disable=unused-argument
+        "Return the metrics in the text exposition format."
+        return self.metrics.expose()
+
+
+class MetricsServer:
+    """HTTP server exposing the metrics as text on `/metrics`."""
+
+    def __init__(self, metrics, host, port):
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            "Handler of the requests to the metrics endpoint."
+
+            def do_GET(self):  # pylint:disable=invalid-name
+                "Answer with the metrics."
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_ref.expose().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+                "Requests are not logged."
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever,
+            name="MetricsServer", daemon=True)
+
+    @property
+    def address(self):
+        "Host and port where the server is listening."
+        return self.server.server_address[:2]
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        self._thread.start()
+        logging.info("Metrics available at http://%s:%d/metrics", *self.address)
+
+    def stop(self):
+        """Stop serving requests."""
+        self.server.shutdown()
+        self.server.server_close()
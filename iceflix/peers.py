@@ -0,0 +1,50 @@
+"""Module containing the replicas of the Main service known by each other."""
+
+import zlib
+
+from iceflix.registry import ServiceRegistry
+
+
+def rendezvous_owner(service_id, members):
+    """Return the member with the highest hash of its ID along with the
+    service ID. The hash is the same in every process."""
+    return max(members, key=lambda member: zlib.crc32(f"{member}/{service_id}".encode()))
+
+
+class MainPeers:
+    """Other Main services known through the Announcements topic.
+
+    The services are split among every known Main by rendezvous hashing of
+    their IDs, so each service is probed by a single Main, and only the
+    services of a Main move to the others when it joins or leaves. The Main
+    owning a service in the complete view also owns it in any partial view
+    including itself, so no service is left unprobed while views differ.
+
+    The Main services which fail their health checks are left out until
+    they answer again, so the others take their services over."""
+
+    def __init__(self, own_id=""):
+        self.own_id = own_id
+        self.registry = ServiceRegistry("Main")
+        self._members = (None, None, ())
+
+    def __len__(self):
+        return len(self.registry)
+
+    def members(self):
+        "Return the IDs of every online Main, this one included."
+        version = self.registry.version
+        cached_version, cached_id, members = self._members
+        if cached_version != version or cached_id != self.own_id:
+            members = (self.own_id, *(entry.service_id for entry in self.registry.snapshot()
+                if entry.healthy))
+            self._members = (version, self.own_id, members)
+        return members
+
+    def owner(self, service_id):
+        "Return the ID of the Main which probes the service."
+        return rendezvous_owner(service_id, self.members())
+
+    def owns(self, service_id):
+        "Return True if the service is probed by this Main."
+        return self.owner(service_id) == self.own_id
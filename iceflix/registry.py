@@ -0,0 +1,171 @@
+"""Module containing the registry of services known by the Main service."""
+
+import itertools
+import random
+import threading
+
+from iceflix.balancing import RoundRobinPolicy
+
+
+class ServiceEntry:  # pylint:disable=too-few-public-methods, too-many-instance-attributes
+    """Service stored in a registry, along with its proxy, expiry deadline,
+    cached health state and latency. The time it was last announced and the
+    lifetime it was given then are kept too, if known.
+
+    Services restored from a snapshot are not verified until they are
+    announced again or their kind is confirmed."""
+
+    __slots__ = ('service_id', 'proxy', 'deadline', 'seen', 'lifetime', 'position', 'healthy',
+                 'verified', 'failures', 'next_probe', 'probing', 'rtt', 'selected')
+
+    def __init__(self, service_id, proxy, deadline, verified=True, seen=None):
+        self.service_id = service_id
+        self.proxy = proxy
+        self.deadline = deadline
+        self.seen = seen
+        self.lifetime = None if seen is None else deadline - seen
+        self.position = -1
+        self.healthy = True
+        self.verified = verified
+        self.failures = 0
+        self.next_probe = 0.0
+        self.probing = False
+        self.rtt = None
+        self.selected = 0
+
+    def stats(self):
+        """Return a dictionary with the state of the service."""
+        return {
+            "service_id": self.service_id,
+            "healthy": self.healthy,
+            "verified": self.verified,
+            "failures": self.failures,
+            "rtt": self.rtt,
+            "selected": self.selected,
+        }
+
+
+class ServiceRegistry:  # pylint:disable=too-many-instance-attributes
+    """Thread-safe registry of the services of a given kind.
+
+    Writers (announcements, expiries) serialize on a lock, while readers work
+    on an immutable snapshot that is only rebuilt after the set of services
+    has changed, so lookups never take the lock in the common case.
+
+    The version of the registry changes every time a service is added,
+    removed, or changes its health state. The `on_available` callback is
+    called whenever a service becomes online."""
+
+    def __init__(self, kind, policy=None):
+        self.kind = kind
+        self.policy = policy or RoundRobinPolicy()
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._order = []
+        self._snapshot = ()
+        self._versions = itertools.count(1)
+        self.version = 0
+        self.on_available = None
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __bool__(self):
+        return bool(self.snapshot())
+
+    def __contains__(self, service_id):
+        return service_id in self._entries
+
+    def __getitem__(self, service_id):
+        return self._entries[service_id]
+
+    def get(self, service_id):
+        """Return the entry stored for the service, or None if unknown."""
+        return self._entries.get(service_id)
+
+    def add(self, service_id, proxy, deadline, verified=True, seen=None):  # pylint:disable=too-many-arguments
+        """Store a new service, or replace the proxy and deadline of an already
+        known one. If given, `seen` is the time the service was announced,
+        from which its deadline was set. Returns True if the service was not
+        known."""
+        with self._lock:
+            entry = self._entries.get(service_id)
+            if entry is not None:
+                entry.proxy = proxy
+                entry.deadline = deadline
+                if seen is not None:
+                    entry.seen, entry.lifetime = seen, deadline - seen
+                entry.verified = entry.verified or verified
+                if not entry.healthy:
+                    entry.next_probe = 0.0
+                return False
+            entry = ServiceEntry(service_id, proxy, deadline, verified, seen)
+            entry.position = len(self._order)
+            self._order.append(entry)
+            self._entries[service_id] = entry
+            self._snapshot = None
+            self.version = next(self._versions)
+        self._notify_available()
+        return True
+
+    def remove(self, service_id):
+        """Remove a service in constant time, swapping the last entry into its
+        position. Returns the removed entry, or None if it was not stored."""
+        with self._lock:
+            entry = self._entries.pop(service_id, None)
+            if entry is None:
+                return None
+            last = self._order.pop()
+            if last is not entry:
+                last.position = entry.position
+                self._order[entry.position] = last
+            entry.position = -1
+            self._snapshot = None
+            self.version = next(self._versions)
+            return entry
+
+    def set_health(self, entry, healthy):
+        """Change the health state of an entry. Returns True if it changed."""
+        if entry.healthy == healthy:
+            return False
+        entry.healthy = healthy
+        self.version = next(self._versions)
+        if healthy:
+            self._notify_available()
+        return True
+
+    def _notify_available(self):
+        "Call the `on_available` callback, if any, with the registry."
+        if self.on_available is not None:
+            self.on_available(self)
+
+    def snapshot(self):
+        """Return an immutable tuple with the entries currently stored."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = tuple(self._order)
+                snapshot = self._snapshot
+        return snapshot
+
+    def next(self):
+        """Return the healthy entry chosen by the balancing policy, or None if
+        there is none."""
+        entry = self.policy.choose(self.snapshot())
+        if entry is not None:
+            entry.selected += 1
+        return entry
+
+    def candidates(self, count):
+        """Return up to `count` random healthy entries, or all of them if
+        `count` is not positive."""
+        healthy = [entry for entry in self.snapshot() if entry.healthy]
+        if 0 < count < len(healthy):
+            return random.sample(healthy, count)
+        return healthy
+
+    def stats(self):
+        """Return the state of every service stored, as seen by the balancing
+        policy."""
+        return [entry.stats() for entry in self.snapshot()]
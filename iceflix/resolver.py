@@ -0,0 +1,99 @@
+"""Module containing the resolution of the type of announced services."""
+
+import collections
+import threading
+
+import Ice
+
+import IceFlix  # pylint:disable=import-error
+
+from iceflix.metrics import Metrics
+
+SERVICE_KINDS = {
+    "::IceFlix::Authenticator": "Authenticator",
+    "::IceFlix::MediaCatalog": "MediaCatalog",
+    "::IceFlix::FileService": "FileService",
+    "::IceFlix::Main": "Main",
+}
+TYPE_IDS = {kind: type_id for type_id, kind in SERVICE_KINDS.items()}
+IGNORED_CACHE_SIZE = 1024
+
+
+class ServiceResolver:
+    """Resolves which kind of service a proxy belongs to.
+
+    The type IDs of a new service are fetched with a single asynchronous
+    `ice_ids` call, and the result is cached per service ID, so further
+    announcements of the same proxy do not make any remote call. Services of
+    unknown kinds are cached in a bounded LRU."""
+
+    def __init__(self, metrics=None):
+        self._lock = threading.Lock()
+        self._known = {}
+        self._ignored = collections.OrderedDict()
+        self._evictions = (metrics or Metrics()).counter("iceflix_resolver_evictions_total",
+            "Ignored services evicted from the cache of resolved types.")
+
+    @staticmethod
+    def kind_of(type_ids):
+        """Return the kind of service matching the given type IDs, or None."""
+        for type_id in type_ids:
+            if (kind := SERVICE_KINDS.get(type_id)) is not None:
+                return kind
+        return None
+
+    @staticmethod
+    def cast(kind, proxy):
+        """Return the proxy casted to the interface of the given kind."""
+        return getattr(IceFlix, kind + "Prx").uncheckedCast(proxy)
+
+    def lookup(self, proxy, service_id):
+        """Return the cached (kind, proxy) pair of a service if it was resolved
+        with the same proxy, or None if it has to be resolved. Ignored
+        services and null proxies are returned as (None, None)."""
+        if proxy is None:
+            return None, None
+        with self._lock:
+            cached = self._known.get(service_id)
+            if cached is not None and cached[0] == proxy:
+                return cached[1], cached[2]
+            if service_id in self._ignored and self._ignored[service_id] == proxy:
+                self._ignored.move_to_end(service_id)
+                return None, None
+        return None
+
+    def resolve(self, proxy, service_id):
+        """Fetch the type IDs of the service and cache its kind. Returns a
+        future with the (kind, proxy) pair of the service."""
+        future = Ice.Future()
+
+        def on_ids(ids_future):
+            try:
+                kind = self.kind_of(ids_future.result())
+            except Exception as exc:  # pylint:disable=broad-except
+                future.set_exception(exc)
+                return
+            future.set_result(self.store(proxy, service_id, kind))
+
+        proxy.ice_idsAsync().add_done_callback(on_ids)
+        return future
+
+    def store(self, proxy, service_id, kind):
+        """Cache the kind of a service. Returns its (kind, proxy) pair."""
+        with self._lock:
+            if kind is None:
+                self._ignored[service_id] = proxy
+                self._ignored.move_to_end(service_id)
+                if len(self._ignored) > IGNORED_CACHE_SIZE:
+                    self._ignored.popitem(last=False)
+                    self._evictions.inc()
+                return None, None
+            casted = self.cast(kind, proxy)
+            self._known[service_id] = (proxy, kind, casted)
+            return kind, casted
+
+    def forget(self, service_id):
+        """Drop the cached kind of a service."""
+        with self._lock:
+            self._known.pop(service_id, None)
+            self._ignored.pop(service_id, None)
@@ -0,0 +1,106 @@
+"""Module containing the deadline-based expiry of keys, such as the services
+known by the Main service or the tokens of the Authenticator."""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class ExpiryScheduler:  # pylint:disable=too-many-instance-attributes
+    """Calls `on_expire(key)` once the deadline of a key is reached.
+
+    Deadlines are kept in a min-heap of monotonic timestamps, so the
+    scheduler thread only wakes up when a key is actually due. Pushing a
+    deadline later than the queued one only updates a dictionary, and the
+    heap entry is moved when it is popped, which makes renewals O(1)."""
+
+    def __init__(self, on_expire, clock=time.monotonic):
+        self.on_expire = on_expire
+        self.clock = clock
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._heap = []
+        self._deadlines = {}
+        self._queued = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    @property
+    def queue_size(self):
+        "Number of entries in the heap, including the outdated ones."
+        return len(self._heap)
+
+    def schedule(self, key, deadline):
+        """Set the deadline of a key, adding it if it was not scheduled."""
+        with self._condition:
+            self._deadlines[key] = deadline
+            queued = self._queued.get(key)
+            if queued is not None and queued <= deadline:
+                return
+            self._queued[key] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+            if self._heap[0][2] is key:
+                self._condition.notify()
+
+    def cancel(self, key):
+        """Stop tracking a key. Its heap entry is discarded when popped."""
+        with self._condition:
+            self._deadlines.pop(key, None)
+            self._queued.pop(key, None)
+
+    def run_pending(self):
+        """Expire every key whose deadline has been reached. Returns the
+        number of keys expired."""
+        expired = []
+        with self._condition:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                queued, _, key = heapq.heappop(self._heap)
+                if self._queued.get(key) != queued:
+                    continue
+                deadline = self._deadlines[key]
+                if deadline > queued:
+                    self._queued[key] = deadline
+                    heapq.heappush(self._heap, (deadline, next(self._counter), key))
+                    continue
+                del self._deadlines[key]
+                del self._queued[key]
+                self.lag = now - deadline
+                self.max_lag = max(self.max_lag, self.lag)
+                expired.append(key)
+        for key in expired:
+            self.on_expire(key)
+        return len(expired)
+
+    def start(self):
+        """Start expiring keys in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="ExpiryScheduler",
+            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        "Wait until the earliest deadline and expire the keys due."
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    timeout = self._heap[0][0] - self.clock() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+            self.run_pending()
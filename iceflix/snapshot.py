@@ -0,0 +1,54 @@
+"""Module containing the snapshot file of the services known by the Main
+service, so a restarted Main can answer lookups before the services announce
+themselves again."""
+
+import json
+import logging
+import os
+import time
+
+SNAPSHOT_PERIOD = 5.0
+SNAPSHOT_MAX_AGE = 60.0
+
+
+def save_snapshot(path, services):
+    """Store the (kind, service ID, proxy, last seen, lifetime) tuples of the
+    services in a JSON file, replacing it at once. Last seen times are Unix
+    timestamps, and lifetimes the seconds each service was kept for then."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as snapshot_file:
+        json.dump(services, snapshot_file, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def valid_entry(service):
+    """Tell whether a snapshot entry is a (kind, service ID, proxy, last seen)
+    list, with an optional lifetime."""
+    if not isinstance(service, list) or len(service) not in (4, 5):
+        return False
+    return all(isinstance(field, str) for field in service[:3]) and \
+        all(isinstance(field, (int, float)) and not isinstance(field, bool)
+            for field in service[3:])
+
+
+def load_snapshot(path, max_age=SNAPSHOT_MAX_AGE, now=None):
+    """Return the services stored in a snapshot file which were seen less
+    than `max_age` seconds ago. A missing or damaged file has no services,
+    and malformed entries are skipped."""
+    now = time.time() if now is None else now
+    try:
+        with open(path, encoding="utf-8") as snapshot_file:
+            services = json.load(snapshot_file)
+    except FileNotFoundError:
+        return []
+    except ValueError as exc:
+        logging.warning("Snapshot '%s' ignored: %s", path, exc)
+        return []
+    if not isinstance(services, list):
+        logging.warning("Snapshot '%s' ignored: not a list of services", path)
+        return []
+    valid = [service for service in services if valid_entry(service)]
+    if len(valid) < len(services):
+        logging.warning("Snapshot '%s': %d malformed entries skipped", path,
+            len(services) - len(valid))
+    return [tuple(service) for service in valid if now - service[3] < max_age]
@@ -0,0 +1,74 @@
+"""Module containing a cache of the answers of the Authenticator."""
+
+import threading
+import time
+
+import IceFlix  # pylint:disable=import-error
+
+TOKEN_TTL = 5.0
+TOKEN_CACHE_SIZE = 4096
+
+
+class TokenCache:
+    """Caches the positive answers of the Authenticator about tokens.
+
+    A valid token is not checked again for `ttl` seconds, so streaming a file
+    costs one remote call per `ttl` instead of one per chunk. Invalid tokens
+    are never cached. `authenticator` is a callable returning the proxy to
+    ask, so a new one may be chosen on each miss."""
+
+    def __init__(self, authenticator, ttl=TOKEN_TTL, clock=time.monotonic):
+        self.authenticator = authenticator
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    def _ask(self, question, token, ask):
+        """Return the cached answer to a question about the token, or ask the
+        Authenticator on misses. Raise Unauthorized if the answer is false."""
+        key = (question, token)
+        now = self.clock()
+        deadline, answer = self._answers.get(key, (0.0, None))
+        if deadline > now:
+            self.hits += 1
+            return answer
+        self.misses += 1
+        answer = ask(self.authenticator())
+        with self._lock:
+            if not answer:
+                self._answers.pop(key, None)
+                raise IceFlix.Unauthorized()
+            if len(self._answers) >= TOKEN_CACHE_SIZE:
+                self._purge(now)
+            self._answers[key] = (now + self.ttl, answer)
+        return answer
+
+    def _purge(self, now):
+        "Drop the expired answers, or every answer if none expired."
+        expired = [key for key, (deadline, _) in self._answers.items() if deadline <= now]
+        for key in expired:
+            del self._answers[key]
+        if not expired:
+            self._answers.clear()
+
+    def check_user(self, token):
+        """Raise Unauthorized unless the token belongs to a user."""
+        self._ask("user", token, lambda authenticator: authenticator.isAuthorized(token))
+
+    def check_admin(self, token):
+        """Raise Unauthorized unless the token is the admin token."""
+        self._ask("admin", token, lambda authenticator: authenticator.isAdmin(token))
+
+    def whois(self, token):
+        """Return the user a token belongs to. Raise Unauthorized if it is
+        not valid."""
+        return self._ask("whois", token, lambda authenticator: authenticator.whois(token))
+
+    def revoke(self, token):
+        """Forget a token, so it is checked again on its next use."""
+        with self._lock:
+            for question in ("user", "admin", "whois"):
+                self._answers.pop((question, token), None)
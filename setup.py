@@ -0,0 +1,29 @@
+"""Build script, which generates the Python bindings of the Slice definitions
+along with the package, so they are not compiled at runtime."""
+
+import importlib.util
+import os
+
+from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+def load_bindings_module():
+    """Return the iceflix.bindings module, without importing the package."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "iceflix", "bindings.py")
+    spec = importlib.util.spec_from_file_location("iceflix_bindings", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class BuildWithBindings(build_py):
+    """Build the package along with the IceFlix bindings."""
+
+    def run(self):
+        super().run()
+        if not self.dry_run:
+            load_bindings_module().generate(self.build_lib)
+
+
+setup(cmdclass={"build_py": BuildWithBindings})
@@ -1,13 +1,16 @@
 """Module containing tests for Announcement service class."""
 
+import time
 import unittest
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
-from iceflix.main import Main, Announcement
+import Ice
+from iceflix.main import EXPIRY_MARGIN, Announcement, Announcer, Main
+import IceFlix  # pylint:disable=import-error,wrong-import-order
 import tests.mock_functions
 
 SERVICE_ID = "test_id"
 RESPONSE_TIME = 10
-NOT_FULL_RESPONSE_TIME = 5
 
 
 class AnnouncementTesting(unittest.TestCase):
@@ -18,79 +21,156 @@ class AnnouncementTesting(unittest.TestCase):
         self.announcement = Announcement(self.main)
 
     def tearDown(self):
-        self.main.service_timer.cancel()
+        self.main.shutdown()
+
+    def check_announce(self, service, registry, mock_proxy):
+        """Announces a service which is not saved in cache, and then again
+        once it is, checking it is stored with a renewed expiry time."""
+        # New proxy
+        self.assertFalse(registry)
+        dispatched = self.announcement.announce(service, SERVICE_ID)
+        self.assertIsNone(dispatched.result(1))
+        self.assertEqual(registry[SERVICE_ID].proxy, mock_proxy.uncheckedCast())
+        self.assertGreater(registry[SERVICE_ID].deadline,
+            time.monotonic() + RESPONSE_TIME - 1)
+        # Saved proxy
+        registry[SERVICE_ID].deadline = time.monotonic()
+        self.assertIsNone(self.announcement.announce(service, SERVICE_ID))
+        self.assertEqual(registry[SERVICE_ID].proxy, mock_proxy.uncheckedCast())
+        self.assertGreater(registry[SERVICE_ID].deadline,
+            time.monotonic() + RESPONSE_TIME - 1)
+        # Type resolved with a single remote call
+        service.ice_idsAsync.assert_called_once()
 
     @patch('IceFlix.AuthenticatorPrx')
     def test_auth_proxy(self, mock_proxy):
         """Tests announce() method with an Authenticator proxy which is not
         saved in cache, and another which is, as input."""
-        # New proxy
-        self.assertFalse(self.main.authenticator_services)
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.authenticator_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-        # Saved proxy
-        self.main.authenticator_services[SERVICE_ID][1] = NOT_FULL_RESPONSE_TIME
-        self.assertEqual(self.main.authenticator_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), NOT_FULL_RESPONSE_TIME])
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.authenticator_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-
-    @patch('IceFlix.AuthenticatorPrx.checkedCast',
-        new=tests.mock_functions.mock_auth_checked_cast)
+        self.check_announce(tests.mock_functions.mock_auth_service(),
+            self.main.authenticator_services, mock_proxy)
+
     @patch('IceFlix.MediaCatalogPrx')
     def test_catalog_proxy(self, mock_proxy):
         """Tests announce() method with a MediaCatalog proxy which is not
         saved in cache, and another which is, as input."""
-        # New proxy
-        self.assertFalse(self.main.catalog_services)
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.catalog_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-        # Saved proxy
-        self.main.catalog_services[SERVICE_ID][1] = NOT_FULL_RESPONSE_TIME
-        self.assertEqual(self.main.catalog_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), NOT_FULL_RESPONSE_TIME])
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.catalog_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-
-    @patch('IceFlix.AuthenticatorPrx.checkedCast',
-        new=tests.mock_functions.mock_auth_checked_cast)
-    @patch('IceFlix.MediaCatalogPrx.checkedCast',
-        new=tests.mock_functions.mock_catalog_checked_cast)
+        self.check_announce(tests.mock_functions.mock_catalog_service(),
+            self.main.catalog_services, mock_proxy)
+
     @patch('IceFlix.FileServicePrx')
     def test_file_proxy(self, mock_proxy):
         """Tests announce() method with a FileService proxy which is not, and
         another which is, saved in cache as input."""
-        # New proxy
-        self.assertFalse(self.main.file_services)
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.file_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-        # Saved proxy
-        self.main.file_services[SERVICE_ID][1] = NOT_FULL_RESPONSE_TIME
-        self.assertEqual(self.main.file_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), NOT_FULL_RESPONSE_TIME])
-        self.announcement.announce(mock_proxy, SERVICE_ID)
-        self.assertEqual(self.main.file_services[SERVICE_ID],
-            [mock_proxy.checkedCast(), RESPONSE_TIME])
-
-    @patch('IceFlix.AuthenticatorPrx.checkedCast',
-        new=tests.mock_functions.mock_auth_checked_cast)
-    @patch('IceFlix.MediaCatalogPrx.checkedCast',
-        new=tests.mock_functions.mock_catalog_checked_cast)
-    @patch('IceFlix.FileServicePrx.checkedCast',
-        new=tests.mock_functions.mock_file_checked_cast)
-    def test_invalid_proxy(self):
-        """Tests announce() method with a non-proxy object as input."""
-        obj = MagicMock()
-        obj.name = 'object'
+        self.check_announce(tests.mock_functions.mock_file_service(),
+            self.main.file_services, mock_proxy)
+
+    @patch('IceFlix.MainPrx')
+    def test_invalid_proxy(self, _):
+        """Tests announce() method with a non-service proxy as input."""
+        obj = tests.mock_functions.mock_service("::IceFlix::Main")
         self.assertFalse(self.main.authenticator_services)
         self.assertFalse(self.main.catalog_services)
         self.assertFalse(self.main.file_services)
         self.announcement.announce(obj, SERVICE_ID)
+        self.announcement.announce(obj, SERVICE_ID)
         self.assertFalse(self.main.authenticator_services)
         self.assertFalse(self.main.catalog_services)
         self.assertFalse(self.main.file_services)
+        obj.ice_idsAsync.assert_called_once()
+
+    def test_null_proxy(self):
+        """Tests announce() method ignores a null proxy."""
+        self.assertIsNone(self.announcement.announce(None, SERVICE_ID))
+        self.assertFalse(self.main.authenticator_services)
+        self.assertFalse(self.main.catalog_services)
+        self.assertFalse(self.main.file_services)
+
+    def test_unreachable_proxy(self):
+        """Tests announce() method with a proxy whose type cannot be resolved."""
+        obj = tests.mock_functions.mock_service("::IceFlix::Authenticator")
+        obj.ice_idsAsync.return_value = tests.mock_functions.mock_failed_future(Exception())
+        self.announcement.announce(obj, SERVICE_ID)
+        self.assertFalse(self.main.authenticator_services)
+
+    @patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy)
+    def test_batch(self):
+        """Tests announceBatch() method stores every service until the end of
+        the announced period, once all of them have been resolved."""
+        pending = Future()
+        slow = tests.mock_functions.mock_file_service()
+        slow.ice_idsAsync.return_value = pending
+        services = [IceFlix.ServiceAnnouncement(tests.mock_functions.mock_file_service(),
+            f"service{number}") for number in range(3)]
+        services.append(IceFlix.ServiceAnnouncement(slow, "slow"))
+        dispatched = self.announcement.announceBatch(services, 60.0)
+        self.assertEqual(len(self.main.file_services), 3)
+        self.assertFalse(dispatched.done())
+        pending.set_result(["::IceFlix::FileService"])
+        self.assertIsNone(dispatched.result(1))
+        self.assertEqual(len(self.main.file_services), 4)
+        self.assertGreater(self.main.file_services["slow"].deadline,
+            time.monotonic() + 60.0 + EXPIRY_MARGIN - 1)
+        self.assertIsNone(self.announcement.announceBatch(services, 60.0))
+
+    @patch('IceFlix.MainPrx.uncheckedCast', new=lambda proxy: proxy)
+    @patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy)
+    def test_batch_unpublished(self):
+        """Tests announceBatch() method stores every service even if they
+        cannot be shared with the other Main services."""
+        self.main.peers.own_id = "own"
+        self.main.updates = MagicMock()
+        self.main.updates.servicesResolved.side_effect = Ice.ConnectionRefusedException()  # pylint:disable=no-member
+        services = [IceFlix.ServiceAnnouncement(
+            tests.mock_functions.mock_service("::IceFlix::Main"), "joined")]
+        services.extend(IceFlix.ServiceAnnouncement(tests.mock_functions.mock_file_service(),
+            f"service{number}") for number in range(3))
+        self.assertIsNone(self.announcement.announceBatch(services, 60.0).result(1))
+        self.assertIn("joined", self.main.peers.registry)
+        self.assertEqual(len(self.main.file_services), 3)
+        self.main.updates.servicesResolved.assert_called()
+
+
+class AnnouncerTesting(unittest.TestCase):
+    """Tests methods from Announcer class."""
+
+    def test_intervals(self):
+        """Tests the services are announced together, more often at first."""
+        publisher = MagicMock()
+        announcer = Announcer(publisher, period=5.0)
+        proxy = MagicMock()
+        announcer.add(proxy, SERVICE_ID)
+        self.assertEqual([announcer.announce() for _ in range(5)], [1.0, 2.0, 4.0, 5.0, 5.0])
+        publisher.announceBatch.assert_called_with(
+            [IceFlix.ServiceAnnouncement(proxy, SERVICE_ID)], 5.0)
+
+    def test_callbacks(self):
+        """Tests the callbacks are called after each announcement."""
+        announcer = Announcer(MagicMock())
+        callback = MagicMock()
+        announcer.callbacks.append(callback)
+        announcer.announce()
+        announcer.announce()
+        self.assertEqual(callback.call_count, 2)
+
+    def test_cancel(self):
+        """Tests the thread announces right away and stops once cancelled."""
+        publisher = MagicMock()
+        announcer = Announcer(publisher)
+        announcer.start()
+        announcer.cancel()
+        announcer.join(1)
+        self.assertFalse(announcer.is_alive())
+        publisher.announceBatch.assert_called()
+
+    def test_legacy(self):
+        """Tests each service is also announced on its own unless disabled."""
+        for legacy in (True, False):
+            publisher = MagicMock()
+            announcer = Announcer(publisher, legacy=legacy)
+            proxy = MagicMock()
+            announcer.add(proxy, SERVICE_ID)
+            announcer.start()
+            announcer.cancel()
+            announcer.join(1)
+            publisher.announceBatch.assert_called_once()
+            self.assertEqual(publisher.announce.call_args_list,
+                [((proxy, SERVICE_ID),)] if legacy else [])
@@ -0,0 +1,157 @@
+"""Module containing tests for Authenticator, ChangeLog and UserUpdates classes."""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+import Ice
+from iceflix.authenticator import Authenticator, ChangeLog, UserUpdates, load_users
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+
+def peer_proxy(authenticator, name="peer"):
+    """Returns a mock proxy which forwards getChanges to an Authenticator."""
+    proxy = MagicMock()
+    proxy.ice_getIdentity.return_value = Ice.Identity(name, "")  # pylint:disable=no-member
+    proxy.getChanges.side_effect = authenticator.getChanges
+    return proxy
+
+
+class ChangeLogTesting(unittest.TestCase):
+    """Tests methods from ChangeLog class."""
+
+    def setUp(self):
+        self.log = ChangeLog("initial", compact_every=4)
+
+    def append(self, count):
+        """Appends the given number of changes, compacting when due."""
+        for _ in range(count):
+            self.log.append(IceFlix.UserChangeKind.NewUserChange, "user", "hash")
+            if self.log.due:
+                self.log.compact(f"state {self.log.version}")
+
+    def test_deltas(self):
+        """Tests a replica with a recent version only gets the changes after it."""
+        self.append(3)
+        changes = self.log.changes_since(1)
+        self.assertIsNone(changes.snapshot)
+        self.assertEqual([change.version for change in changes.changes], [2, 3])
+        self.assertEqual(changes.version, 3)
+
+    def test_snapshot(self):
+        """Tests a replica missing compacted changes gets the snapshot and the
+        changes after it."""
+        self.append(10)
+        self.assertEqual(len(self.log), 8)
+        changes = self.log.changes_since(1)
+        self.assertEqual((changes.snapshot, changes.snapshotVersion), ("state 8", 8))
+        self.assertEqual([change.version for change in changes.changes], [9, 10])
+        self.assertEqual(self.log.changes_since(-1).snapshotVersion, 8)
+
+    def test_reset(self):
+        """Tests every replica gets the snapshot after a reset."""
+        self.append(2)
+        self.log.reset("loaded")
+        changes = self.log.changes_since(2)
+        self.assertEqual((changes.snapshot, changes.changes), ("loaded", []))
+
+
+class AuthenticatorTesting(unittest.TestCase):
+    """Tests methods from Authenticator class."""
+
+    def setUp(self):
+        self.auth = Authenticator("admin", {"user": "hash"}, lifetime=60.0)
+        self.auth.updates = MagicMock()
+
+    def tearDown(self):
+        self.auth.shutdown()
+
+    def test_refresh_authorization(self):
+        """Tests a new token replaces the previous one and is published."""
+        first = self.auth.refreshAuthorization("user", "hash")
+        second = self.auth.refreshAuthorization("user", "hash")
+        self.assertFalse(self.auth.isAuthorized(first))
+        self.assertEqual(self.auth.whois(second), "user")
+        self.auth.updates.newToken.assert_called_with("user", second, "")
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.auth.refreshAuthorization("user", "wrong")
+
+    def test_whois_unknown(self):
+        """Tests whois raises Unauthorized for an unknown token."""
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.auth.whois("unknown")
+
+    def test_expiry(self):
+        """Tests a token expires at its deadline."""
+        self.auth.lifetime = 0.05
+        token = self.auth.refreshAuthorization("user", "hash")
+        self.assertTrue(self.auth.isAuthorized(token))
+        time.sleep(0.2)
+        self.assertFalse(self.auth.isAuthorized(token))
+        self.assertNotIn(token, self.auth.tokens)
+        self.assertEqual(self.auth.log.changes_since(1).changes[-1].kind,
+            IceFlix.UserChangeKind.RevokeTokenChange)
+
+    def test_admin(self):
+        """Tests users are only managed with the admin token."""
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.auth.addUser("other", "hash", "wrong")
+        self.auth.addUser("other", "hash", "admin")
+        token = self.auth.refreshAuthorization("other", "hash")
+        self.auth.removeUser("other", "admin")
+        self.assertFalse(self.auth.isAuthorized(token))
+        self.assertNotIn("other", self.auth.bulkUpdate().currentUsers)
+        self.auth.updates.removeUser.assert_called_once_with("other", "")
+
+    def test_empty_admin_token(self):
+        """Tests nobody is admin without an admin token."""
+        self.auth.admin_token = ""
+        self.assertFalse(self.auth.isAdmin(""))
+
+    def test_catch_up(self):
+        """Tests a new replica catches up from a snapshot, and then from deltas."""
+        token = self.auth.refreshAuthorization("user", "hash")
+        replica = Authenticator("admin")
+        peer = peer_proxy(self.auth)
+        try:
+            replica.catch_up(peer)
+            self.assertEqual(replica.whois(token), "user")
+            self.assertEqual(peer.getChanges.call_args[0][0], -1)
+            self.auth.addUser("other", "other hash", "admin")
+            self.assertEqual(replica.catch_up(peer), 1)
+            self.assertEqual(replica.users, {"user": "hash", "other": "other hash"})
+        finally:
+            replica.shutdown()
+
+    def test_users_file(self):
+        """Tests the users are stored in the users file on every change."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.auth.users_file = os.path.join(directory, "users.json")
+            self.auth.addUser("other", "other hash", "admin")
+            self.assertEqual(load_users(self.auth.users_file),
+                {"user": "hash", "other": "other hash"})
+
+
+class UserUpdatesTesting(unittest.TestCase):
+    """Tests methods from UserUpdates class."""
+
+    def setUp(self):
+        self.auth = Authenticator("admin")
+        self.auth.service_id = "own"
+        self.updates = UserUpdates(self.auth)
+
+    def tearDown(self):
+        self.auth.shutdown()
+
+    def test_updates(self):
+        """Tests changes of other replicas are applied, and own ones ignored."""
+        self.updates.newUser("user", "hash", "other")
+        self.updates.newToken("user", "token", "other")
+        self.updates.newToken("user", "own token", "own")
+        self.assertEqual(self.auth.whois("token"), "user")
+        self.assertFalse(self.auth.isAuthorized("own token"))
+        self.updates.revokeToken("token", "other")
+        self.assertFalse(self.auth.isAuthorized("token"))
+        self.updates.removeUser("user", "other")
+        self.assertEqual(self.auth.users, {})
@@ -0,0 +1,64 @@
+"""Module containing tests for the balancing policies."""
+
+import random
+import unittest
+from unittest.mock import MagicMock
+from iceflix.balancing import (PowerOfTwoPolicy, RandomPolicy, RoundRobinPolicy,
+    WeightedPolicy, create_policy)
+from iceflix.registry import ServiceEntry
+
+DEADLINE = 10.0
+
+
+def make_entries(rtts):
+    """Returns a tuple of healthy entries with the given latencies."""
+    entries = []
+    for position, rtt in enumerate(rtts):
+        entry = ServiceEntry(f"service{position}", MagicMock(), DEADLINE)
+        entry.rtt = rtt
+        entries.append(entry)
+    return tuple(entries)
+
+
+class BalancingTesting(unittest.TestCase):
+    """Tests the choices made by the balancing policies."""
+
+    def test_no_healthy_services(self):
+        """Tests every policy returns None without healthy services."""
+        entries = make_entries([0.01, 0.01])
+        for entry in entries:
+            entry.healthy = False
+        for policy in (RoundRobinPolicy(), RandomPolicy(), PowerOfTwoPolicy(),
+                       WeightedPolicy()):
+            self.assertIsNone(policy.choose(()))
+            self.assertIsNone(policy.choose(entries))
+
+    def test_skip_unhealthy(self):
+        """Tests every policy only returns healthy services."""
+        entries = make_entries([0.01, 0.01, 0.01])
+        entries[1].healthy = False
+        for policy in (RoundRobinPolicy(), RandomPolicy(random.Random(0)),
+                       PowerOfTwoPolicy(random.Random(0)), WeightedPolicy(random.Random(0))):
+            for _ in range(50):
+                self.assertIsNot(policy.choose(entries), entries[1])
+
+    def test_power_of_two(self):
+        """Tests PowerOfTwoPolicy sends less traffic to the slow service."""
+        entries = make_entries([0.001, 0.1])
+        policy = PowerOfTwoPolicy(random.Random(0))
+        chosen = [policy.choose(entries) for _ in range(1000)]
+        self.assertGreater(chosen.count(entries[0]), 3 * chosen.count(entries[1]))
+
+    def test_weighted(self):
+        """Tests WeightedPolicy shares traffic inversely to latency."""
+        entries = make_entries([0.01, 0.04])
+        policy = WeightedPolicy(random.Random(0))
+        chosen = [policy.choose(entries) for _ in range(2000)]
+        ratio = chosen.count(entries[0]) / chosen.count(entries[1])
+        self.assertAlmostEqual(ratio, 4, delta=1)
+
+    def test_create_policy(self):
+        """Tests create_policy() function with valid and invalid names."""
+        self.assertIsInstance(create_policy("p2c"), PowerOfTwoPolicy)
+        with self.assertRaises(ValueError):
+            create_policy("fastest")
@@ -0,0 +1,52 @@
+"""Module containing tests for the generation and loading of the Slice bindings."""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from iceflix import bindings
+
+
+class BindingsTesting(unittest.TestCase):
+    """Tests the functions generating and caching the Slice bindings."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint:disable=consider-using-with
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_generate(self):
+        """Tests the generated bindings are tagged with the digest of the Slice."""
+        bindings.generate(self.directory.name)
+        with open(os.path.join(self.directory.name, "IceFlix", "__init__.py"),
+                encoding="utf-8") as package:
+            self.assertEqual(package.readline(),
+                f"{bindings.DIGEST_PREFIX}{bindings.slice_digest()}\n")
+        self.assertTrue(os.path.isfile(os.path.join(self.directory.name, "iceflix_ice.py")))
+
+    def test_cache(self):
+        """Tests the bindings are only generated once per digest."""
+        with patch("iceflix.bindings.generate", wraps=bindings.generate) as generate:
+            first = bindings.cached_bindings(self.directory.name, "digest")
+            second = bindings.cached_bindings(self.directory.name, "digest")
+        self.assertEqual(first, second)
+        generate.assert_called_once()
+        self.assertEqual(os.listdir(self.directory.name), ["digest"])
+
+    def test_cache_directory(self):
+        """Tests the cache directory can be set or disabled."""
+        with patch.dict(os.environ, {bindings.CACHE_VARIABLE: self.directory.name}):
+            self.assertEqual(bindings.cache_directory(), self.directory.name)
+        with patch.dict(os.environ, {bindings.CACHE_VARIABLE: "off"}):
+            self.assertIsNone(bindings.cache_directory())
+
+    def test_installed_digest(self):
+        """Tests the digest of installed bindings is read without importing them."""
+        with patch("sys.path", [self.directory.name]):
+            self.assertIsNone(bindings.generated_digest("StaleFlix"))
+            os.mkdir(os.path.join(self.directory.name, "StaleFlix"))
+            with open(os.path.join(self.directory.name, "StaleFlix", "__init__.py"), "w",
+                    encoding="utf-8") as package:
+                package.write(f"{bindings.DIGEST_PREFIX}other\n")
+            self.assertEqual(bindings.generated_digest("StaleFlix"), "other")
@@ -0,0 +1,121 @@
+"""Module containing tests for NameIndex, TagIndex and CatalogIndex classes."""
+
+import unittest
+from iceflix.catalog_index import CatalogIndex, NameIndex, TagIndex
+
+
+class NameIndexTesting(unittest.TestCase):
+    """Tests methods from NameIndex class."""
+
+    def setUp(self):
+        self.index = NameIndex()
+        self.index.add("a", "The Matrix")
+        self.index.add("b", "Matrix Reloaded")
+        self.index.add("c", "Up")
+
+    def test_exact(self):
+        """Tests exact search only matches the whole name, in the same case."""
+        self.assertEqual(self.index.exact("The Matrix"), {"a"})
+        self.assertEqual(self.index.exact("the matrix"), set())
+        self.assertEqual(self.index.exact("Matrix"), set())
+
+    def test_search(self):
+        """Tests substring search ignores case."""
+        self.assertEqual(self.index.search("MATRIX"), {"a", "b"})
+        self.assertEqual(self.index.search("x rel"), {"b"})
+        self.assertEqual(self.index.search("matrices"), set())
+        self.assertEqual(self.index.search("TRI"), {"a", "b"})
+        self.assertEqual(self.index.search("xyz"), set())
+
+    def test_short_search(self):
+        """Tests queries shorter than a trigram, including short names."""
+        self.assertEqual(self.index.search("up"), {"c"})
+        self.assertEqual(self.index.search("x"), {"a", "b"})
+        self.assertEqual(self.index.search("e"), {"a", "b"})
+
+    def test_rename(self):
+        """Tests a renamed media is only found by its new name."""
+        self.index.add("a", "Inception")
+        self.assertEqual(self.index.search("matrix"), {"b"})
+        self.assertEqual(self.index.search("cept"), {"a"})
+        self.index.remove("a")
+        self.assertEqual(self.index.search("cept"), set())
+        self.assertEqual(len(self.index), 2)
+
+
+class TagIndexTesting(unittest.TestCase):
+    """Tests methods from TagIndex class."""
+
+    def setUp(self):
+        self.index = TagIndex()
+        self.index.add("user", "a", ["action", "scifi"])
+        self.index.add("user", "b", ["scifi"])
+        self.index.add("other", "c", ["action"])
+
+    def test_any_tag(self):
+        """Tests any-tag queries join the media of the user."""
+        self.assertEqual(self.index.search("user", ["action", "scifi"], False), {"a", "b"})
+        self.assertEqual(self.index.search("other", ["scifi"], False), set())
+
+    def test_all_tags(self):
+        """Tests all-tags queries intersect the media of the user."""
+        self.assertEqual(self.index.search("user", ["action", "scifi"], True), {"a"})
+        self.assertEqual(self.index.search("user", ["action", "drama"], True), set())
+        self.assertEqual(self.index.search("user", [], True), set())
+
+    def test_remove(self):
+        """Tests removed tags are not found, and empty entries are dropped."""
+        self.index.remove("user", "a", ["scifi", "unknown"])
+        self.assertEqual(self.index.search("user", ["scifi"], False), {"b"})
+        self.assertEqual(self.index.tags_of("user", "a"), ["action"])
+        self.index.remove("other", "c", ["action"])
+        self.assertEqual(self.index.items(), [("user", "a", ["action"]),
+            ("user", "b", ["scifi"])])
+
+
+class CatalogIndexTesting(unittest.TestCase):
+    """Tests methods from CatalogIndex class."""
+
+    def setUp(self):
+        self.index = CatalogIndex()
+        self.index.add_media("a", "service")
+
+    def test_default_name(self):
+        """Tests a new media is named after its ID."""
+        self.assertEqual(self.index.get("a"), ("a", "service"))
+        self.assertEqual(self.index.by_name("a", True), ["a"])
+        self.assertEqual(self.index.by_name("A", True), [])
+
+    def test_rename(self):
+        """Tests a rename updates the name index."""
+        self.index.rename("a", "Alien")
+        self.assertEqual(self.index.by_name("lie", False), ["a"])
+        self.assertEqual(self.index.by_name("a", True), [])
+
+    def test_rename_unknown(self):
+        """Tests an unknown media keeps its name when announced later."""
+        self.index.rename("b", "Brazil")
+        self.assertEqual(self.index.get("b"), ("Brazil", None))
+        self.index.add_media("b", "service")
+        self.assertEqual(self.index.get("b"), ("Brazil", "service"))
+
+    def test_set_provided(self):
+        """Tests the media no longer announced by a provider are taken over
+        by another one holding them, or left without provider."""
+        self.index.set_provided("first", ["a", "b"])
+        self.index.set_provided("second", ["b"])
+        self.index.set_provided("first", ["a"])
+        self.assertEqual(self.index.get("b"), ("b", "second"))
+        self.index.set_provided("second", ["c"])
+        self.assertEqual(self.index.get("b"), ("b", None))
+        self.index.set_provided("first", [])
+        self.assertEqual(self.index.get("a"), ("a", None))
+        self.assertEqual(self.index.get("c"), ("c", "second"))
+
+    def test_tags(self):
+        """Tests tags are indexed per user."""
+        self.index.add_tags("user", "a", ["horror"])
+        self.assertEqual(self.index.by_tags("user", ["horror"], True), ["a"])
+        self.assertEqual(self.index.tags_of("user", "a"), ["horror"])
+        self.index.remove_tags("user", "a", ["horror"])
+        self.assertEqual(self.index.by_tags("user", ["horror"], False), [])
@@ -0,0 +1,85 @@
+"""Module containing tests for MediaCatalog, CatalogUpdates and FileAvailability classes."""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+from iceflix.catalog import CatalogUpdates, FileAvailability, MediaCatalog
+from iceflix.catalog_index import CatalogIndex
+from iceflix.registry import ServiceRegistry
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+
+class MediaCatalogTesting(unittest.TestCase):
+    """Tests methods from MediaCatalog class."""
+
+    def setUp(self):
+        self.tokens = MagicMock()
+        self.tokens.whois.return_value = "user"
+        self.providers = MagicMock()
+        self.providers.registries = {"FileService": ServiceRegistry("FileService")}
+        self.catalog = MediaCatalog(CatalogIndex(), self.tokens, self.providers, "catalog")
+        self.catalog.updates = MagicMock()
+        FileAvailability(self.catalog).announceFiles(["a", "b"], "files")
+
+    def test_get_tile(self):
+        """Tests a tile has the provider proxy and the tags of the user."""
+        provider = MagicMock()
+        self.providers.registries["FileService"].add("files", provider, time.monotonic() + 10)
+        self.catalog.addTags("a", ["tag"], "token")
+        media = self.catalog.getTile("a", "token")
+        self.assertEqual((media.mediaId, media.provider), ("a", provider))
+        self.assertEqual((media.info.name, media.info.tags), ("a", ["tag"]))
+
+    def test_provider_offline(self):
+        """Tests TemporaryUnavailable is raised while the provider is offline."""
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.catalog.getTile("a", "token")
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.catalog.getTile("unknown", "token")
+
+    def test_rename(self):
+        """Tests a rename is indexed and published."""
+        self.catalog.renameTile("a", "Alien", "admin")
+        self.tokens.check_admin.assert_called_once_with("admin")
+        self.assertEqual(self.catalog.getTilesByName("Alien", True), ["a"])
+        self.catalog.updates.renameTile.assert_called_once_with("a", "Alien", "catalog")
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.catalog.renameTile("unknown", "Alien", "admin")
+
+    def test_tags(self):
+        """Tests tags are indexed for the user of the token and published."""
+        self.catalog.addTags("a", ["x", "y"], "token")
+        self.catalog.addTags("b", ["x"], "token")
+        self.assertEqual(sorted(self.catalog.getTilesByTags(["x"], True, "token")), ["a", "b"])
+        self.catalog.removeTags("a", ["x"], "token")
+        self.assertEqual(self.catalog.getTilesByTags(["x", "y"], True, "token"), [])
+        self.catalog.updates.addTags.assert_called_with("b", "user", ["x"], "catalog")
+        self.catalog.updates.removeTags.assert_called_once_with("a", "user", ["x"], "catalog")
+
+    def test_unauthorized(self):
+        """Tests tags are not changed with an invalid token."""
+        self.tokens.whois.side_effect = IceFlix.Unauthorized()
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.catalog.addTags("a", ["x"], "token")
+        self.catalog.updates.addTags.assert_not_called()
+
+    def test_get_all_deltas(self):
+        """Tests the whole catalog is published as changes."""
+        self.catalog.renameTile("a", "Alien", "admin")
+        self.catalog.addTags("b", ["x"], "token")
+        self.catalog.updates.reset_mock()
+        self.catalog.getAllDeltas()
+        self.catalog.updates.renameTile.assert_called_once_with("a", "Alien", "catalog")
+        self.catalog.updates.addTags.assert_called_once_with("b", "user", ["x"], "catalog")
+
+    def test_catalog_updates(self):
+        """Tests changes of other catalogs are applied, and own ones ignored."""
+        updates = CatalogUpdates(self.catalog)
+        updates.renameTile("a", "Alien", "other")
+        updates.renameTile("b", "Brazil", "catalog")
+        updates.addTags("b", "user", ["x"], "other")
+        self.assertEqual(self.catalog.getTilesByName("alien", False), ["a"])
+        self.assertEqual(self.catalog.getTilesByName("brazil", False), [])
+        self.assertEqual(self.catalog.getTilesByTags(["x"], False, "token"), ["b"])
+        updates.removeTags("b", "user", ["x"], "other")
+        self.assertEqual(self.catalog.getTilesByTags(["x"], False, "token"), [])
@@ -0,0 +1,109 @@
+"""Module containing tests for DiscoveryClient class."""
+
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import Ice
+from iceflix.client import DiscoveryAnnouncement, DiscoveryClient
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+import tests.mock_functions
+
+
+def mock_proxy(name):
+    """Returns a mock proxy with the given identity name."""
+    proxy = MagicMock()
+    proxy.ice_getIdentity.return_value = Ice.Identity(name, "")  # pylint:disable=no-member
+    return proxy
+
+
+@patch('IceFlix.AuthenticatorPrx.uncheckedCast', new=lambda proxy: proxy)
+class DiscoveryClientTesting(unittest.TestCase):
+    """Tests methods from DiscoveryClient class."""
+
+    def setUp(self):
+        self.main = MagicMock()
+        self.client = DiscoveryClient(self.main, ttl=10.0)
+
+    def test_cache_hit(self):
+        """Tests lookups are answered from the cache while it is fresh."""
+        proxies = [mock_proxy("a"), mock_proxy("b")]
+        self.main.getCandidates.return_value = IceFlix.ServiceCandidates(1, proxies)
+        returned = {self.client.get_authenticator() for _ in range(4)}
+        self.assertEqual(returned, set(proxies))
+        self.main.getCandidates.assert_called_once()
+        self.assertEqual(self.client.hits, 4)
+
+    def test_unchanged_version(self):
+        """Tests an unchanged registry in Main renews the cached proxies."""
+        proxy = mock_proxy("a")
+        self.main.getCandidates.return_value = IceFlix.ServiceCandidates(1, [proxy])
+        self.client.get_authenticator()
+        self.client.registries["Authenticator"]["a"].deadline = time.monotonic()
+        self.client._fresh_until["Authenticator"] = 0.0  # pylint:disable=protected-access
+        self.main.getCandidates.return_value = IceFlix.ServiceCandidates(1, [])
+        self.assertEqual(self.client.get_authenticator(), proxy)
+        self.assertEqual(self.main.getCandidates.call_args[0][2], 1)
+
+    def test_main_unavailable(self):
+        """Tests cached proxies are used while Main does not answer, and
+        TemporaryUnavailable is raised when there are none."""
+        self.main.getCandidates.side_effect = IceFlix.TemporaryUnavailable()
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.client.get_authenticator()
+        proxy = mock_proxy("a")
+        self.client.store("Authenticator", proxy)
+        self.assertEqual(self.client.get_authenticator(), proxy)
+
+    def test_invalidate(self):
+        """Tests a failed proxy is not returned again."""
+        proxies = [mock_proxy("a"), mock_proxy("b")]
+        self.main.getCandidates.return_value = IceFlix.ServiceCandidates(1, proxies)
+        self.client.get_authenticator()
+        self.client.invalidate(proxies[0])
+        for _ in range(3):
+            self.assertEqual(self.client.get_authenticator(), proxies[1])
+
+    def test_announcements(self):
+        """Tests announced services are cached without asking Main."""
+        self.client._subscription = MagicMock()  # pylint:disable=protected-access
+        service = tests.mock_functions.mock_auth_service()
+        service.ice_getIdentity.return_value = Ice.Identity("a", "")  # pylint:disable=no-member
+        DiscoveryAnnouncement(self.client).announce(service, "a")
+        self.assertEqual(self.client.get_authenticator(), service)
+        self.main.getCandidates.assert_not_called()
+
+    def test_announced_batch(self):
+        """Tests services announced in a batch are cached until the next
+        batch is due, rather than for the default time."""
+        self.client._subscription = MagicMock()  # pylint:disable=protected-access
+        service = tests.mock_functions.mock_auth_service()
+        service.ice_getIdentity.return_value = Ice.Identity("a", "")  # pylint:disable=no-member
+        DiscoveryAnnouncement(self.client).announceBatch(
+            [IceFlix.ServiceAnnouncement(service, "a")], 60.0)
+        self.assertGreater(self.client.registries["Authenticator"]["a"].deadline,
+            time.monotonic() + 60.0)
+        with patch("time.monotonic", return_value=time.monotonic() + 30.0):
+            self.assertEqual(self.client.get_authenticator(), service)
+        self.main.getCandidates.assert_not_called()
+
+    @patch('IceFlix.MainPrx')
+    def test_announced_main(self, _):
+        """Tests announced Main services are not cached."""
+        service = tests.mock_functions.mock_service("::IceFlix::Main")
+        for _ in range(2):
+            DiscoveryAnnouncement(self.client).announce(service, "main")
+        self.assertFalse(any(self.client.registries.values()))
+
+    def test_null_proxy(self):
+        """Tests announced null proxies are ignored."""
+        DiscoveryAnnouncement(self.client).announce(None, "a")
+        self.assertFalse(any(self.client.registries.values()))
+
+    def test_without_main(self):
+        """Tests a cache without Main only knows the announced services."""
+        client = DiscoveryClient(None)
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            client.get_authenticator()
+        proxy = mock_proxy("a")
+        client.store("Authenticator", proxy)
+        self.assertEqual(client.get_authenticator(), proxy)
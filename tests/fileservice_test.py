@@ -0,0 +1,152 @@
+"""Module containing tests for FileService and FileHandler classes."""
+
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from iceflix.fileservice import FileHandler, FileService
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+
+def mock_uploader(data, chunk_size):
+    """Returns a mock FileUploader which sends the data in chunks."""
+    uploader = MagicMock()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    uploader.receive.side_effect = chunks + [b""]
+    return uploader
+
+
+class FileHandlerTesting(unittest.TestCase):
+    """Tests methods from FileHandler class."""
+
+    def setUp(self):
+        self.tokens = MagicMock()
+        self.data = os.urandom(100000)
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(self.data)
+        self.path = file.name
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def read_all(self, handler, size):
+        """Returns the whole file received in chunks of the given size."""
+        chunks = []
+        while chunk := handler.receive(size, "token"):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def test_receive(self):
+        """Tests the file is received whole and in order."""
+        handler = FileHandler(self.path, self.tokens, read_ahead=16384)
+        self.assertEqual(self.read_all(handler, 7000), self.data)
+        self.tokens.check_user.assert_called_with("token")
+        handler.close("token")
+
+    def test_chunk_limit(self):
+        """Tests chunks are not larger than the limit."""
+        handler = FileHandler(self.path, self.tokens, chunk_limit=4096)
+        self.assertEqual(len(handler.receive(50000, "token")), 4096)
+        handler.close("token")
+
+    def test_unauthorized(self):
+        """Tests chunks are not sent with an invalid token."""
+        self.tokens.check_user.side_effect = IceFlix.Unauthorized()
+        handler = FileHandler(self.path, self.tokens)
+        with self.assertRaises(IceFlix.Unauthorized):
+            handler.receive(100, "token")
+        self.assertEqual(handler.position, 0)
+        handler.close("token")
+
+    def test_close(self):
+        """Tests a closed handler sends nothing and leaves the adapter."""
+        handler = FileHandler(self.path, self.tokens)
+        chunk = handler.receive(100, "token")
+        current = MagicMock()
+        handler.close("token", current)
+        current.adapter.remove.assert_called_once_with(current.id)
+        self.assertEqual(chunk, self.data[:100])
+        self.assertEqual(handler.receive(100, "token"), b"")
+
+    def test_empty_file(self):
+        """Tests an empty file is received as a single empty chunk."""
+        with open(self.path, "wb"):
+            pass
+        handler = FileHandler(self.path, self.tokens)
+        self.assertEqual(handler.receive(100, "token"), b"")
+        handler.close("token")
+
+
+@patch('IceFlix.FileHandlerPrx.uncheckedCast', new=lambda proxy: proxy)
+class FileServiceTesting(unittest.TestCase):
+    """Tests methods from FileService class."""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()  # pylint:disable=consider-using-with
+        self.tokens = MagicMock()
+        self.service = FileService(self.root.name, self.tokens, "service", upload_chunk=1000)
+        self.service.availability = MagicMock()
+        self.current = MagicMock()
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_upload(self):
+        """Tests an uploaded file is stored under its hash and announced."""
+        data = os.urandom(5500)
+        uploader = mock_uploader(data, 1000)
+        media_id = self.service.uploadFile(uploader, "admin")
+        self.assertEqual(media_id, hashlib.sha256(data).hexdigest())
+        uploader.close.assert_called_once()
+        self.tokens.check_admin.assert_called_once_with("admin")
+        self.service.availability.announceFiles.assert_called_once_with([media_id], "service")
+        with open(os.path.join(self.root.name, media_id), "rb") as file:
+            self.assertEqual(file.read(), data)
+
+    def test_failed_upload(self):
+        """Tests a failed upload leaves no file behind."""
+        uploader = MagicMock()
+        uploader.receive.side_effect = [b"data", RuntimeError()]
+        with self.assertRaises(RuntimeError):
+            self.service.uploadFile(uploader, "admin")
+        self.assertEqual(os.listdir(self.root.name), [])
+
+    def test_scan(self):
+        """Tests the stored files are indexed by hash, without temporary uploads."""
+        for name, data in (("video", b"video"), (".upload-x", b"partial")):
+            with open(os.path.join(self.root.name, name), "wb") as file:
+                file.write(data)
+        self.service.scan()
+        self.assertEqual(list(self.service.files), [hashlib.sha256(b"video").hexdigest()])
+
+    def test_open_file(self):
+        """Tests a handler is added to the adapter for a known file."""
+        media_id = self.service.uploadFile(mock_uploader(b"video", 1000), "admin")
+        self.service.openFile(media_id, "token", self.current)
+        handler = self.current.adapter.addWithUUID.call_args[0][0]
+        self.assertEqual(handler.receive(100, "token"), b"video")
+        handler.close("token")
+
+    def test_wrong_media_id(self):
+        """Tests opening or removing an unknown file raises WrongMediaId."""
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.service.openFile("unknown", "token", self.current)
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.service.removeFile("unknown", "admin")
+
+    def test_remove_file(self):
+        """Tests a removed file is deleted, cannot be opened, and is no longer
+        announced."""
+        media_id = self.service.uploadFile(mock_uploader(b"video", 1000), "admin")
+        self.service.removeFile(media_id, "admin")
+        self.assertEqual(os.listdir(self.root.name), [])
+        self.service.availability.announceFiles.assert_called_with([], "service")
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.service.openFile(media_id, "token", self.current)
+
+    def test_unauthorized(self):
+        """Tests files are not opened with an invalid token."""
+        self.tokens.check_user.side_effect = IceFlix.Unauthorized()
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.service.openFile("unknown", "token", self.current)
@@ -0,0 +1,84 @@
+"""Module containing tests for HealthProber class."""
+
+import unittest
+from concurrent.futures import Future
+from unittest.mock import MagicMock
+from iceflix.health import HealthProber
+from iceflix.registry import ServiceRegistry
+
+SERVICE_ID = "test_id"
+DEADLINE = 10.0
+
+
+def mock_proxy(future):
+    """Returns a mock proxy whose asynchronous pings return the given future."""
+    proxy = MagicMock()
+    proxy.ice_invocationTimeout.return_value.ice_pingAsync.return_value = future
+    return proxy
+
+
+class HealthProberTesting(unittest.TestCase):
+    """Tests methods from HealthProber class."""
+
+    def setUp(self):
+        self.registry = ServiceRegistry("Authenticator")
+        self.prober = HealthProber((self.registry,), interval=1.0, max_in_flight=1)
+
+    def test_online_service(self):
+        """Tests probe() method keeps an answering service online."""
+        future = Future()
+        self.registry.add(SERVICE_ID, mock_proxy(future), DEADLINE)
+        self.prober.probe()
+        self.assertTrue(self.registry[SERVICE_ID].probing)
+        future.set_result(None)
+        entry = self.registry[SERVICE_ID]
+        self.assertFalse(entry.probing)
+        self.assertTrue(entry.healthy)
+        self.assertEqual(entry.failures, 0)
+        self.assertIsNotNone(entry.rtt)
+
+    def test_offline_service(self):
+        """Tests probe() method marks a failing service as offline, backs off,
+        and brings it back once it answers again."""
+        future = Future()
+        self.registry.add(SERVICE_ID, mock_proxy(future), DEADLINE)
+        self.prober.probe()
+        future.set_exception(Exception())
+        entry = self.registry[SERVICE_ID]
+        self.assertFalse(entry.healthy)
+        self.assertEqual(entry.failures, 1)
+        self.assertIsNone(self.registry.next())
+        # Not due yet
+        self.prober.probe()
+        self.assertFalse(entry.probing)
+        # Renewed by an announcement
+        future = Future()
+        self.registry.add(SERVICE_ID, mock_proxy(future), DEADLINE)
+        self.prober.probe()
+        future.set_result(None)
+        self.assertTrue(entry.healthy)
+        self.assertIs(self.registry.next(), entry)
+
+    def test_bounded_concurrency(self):
+        """Tests probe() method does not exceed the pings allowed in flight."""
+        futures = [Future(), Future()]
+        self.registry.add("a", mock_proxy(futures[0]), DEADLINE)
+        self.registry.add("b", mock_proxy(futures[1]), DEADLINE)
+        self.prober.probe()
+        self.assertEqual([entry.probing for entry in self.registry.snapshot()],
+            [True, False])
+        futures[0].set_result(None)
+        self.prober.probe()
+        self.assertEqual([entry.probing for entry in self.registry.snapshot()],
+            [False, True])
+
+    def test_owned_services(self):
+        """Tests probe() method only pings the services it owns, if set."""
+        future = Future()
+        self.registry.add(SERVICE_ID, mock_proxy(future), DEADLINE)
+        self.prober.owns = lambda service_id: service_id != SERVICE_ID
+        self.prober.probe()
+        self.assertFalse(self.registry[SERVICE_ID].probing)
+        self.prober.owns = None
+        self.prober.probe()
+        self.assertTrue(self.registry[SERVICE_ID].probing)
@@ -0,0 +1,94 @@
+"""Module containing tests for the logging setup and the summaries."""
+
+import atexit
+import logging
+import logging.handlers
+import unittest
+from unittest.mock import patch
+
+from iceflix.logs import CounterSummary, LogSummary, log_level, parse_level, setup_logging
+from iceflix.metrics import Counter
+
+
+class LogsTesting(unittest.TestCase):
+    """Tests the logging setup and the summaries of frequent messages."""
+
+    def setUp(self):
+        self.logger = logging.getLogger("iceflix.tests")
+        self.logger.propagate = False
+        self.records = logging.handlers.BufferingHandler(100)
+        self.logger.addHandler(self.records)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.records)
+
+    def test_parse_level(self):
+        """Tests levels are read from their names or numbers."""
+        self.assertEqual(parse_level("debug"), logging.DEBUG)
+        self.assertEqual(parse_level("30"), logging.WARNING)
+        self.assertEqual(parse_level(logging.ERROR), logging.ERROR)
+        with self.assertRaises(ValueError):
+            parse_level("loud")
+
+    def test_log_level(self):
+        """Tests the level given on the command line is used."""
+        self.assertEqual(log_level(["main", "--Main.LogLevel=DEBUG"], "Main"), "DEBUG")
+        self.assertEqual(log_level(["main", "--Catalog.LogLevel=DEBUG"], "Main"), "INFO")
+
+    def test_setup_logging(self):
+        """Tests records are written by the background listener."""
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        written = logging.handlers.BufferingHandler(10)
+        try:
+            listener = setup_logging("WARNING", written)
+            self.assertIsInstance(root.handlers[0], logging.handlers.QueueHandler)
+            logging.info("Not written")
+            logging.warning("Written")
+            listener.stop()
+            atexit.unregister(listener.stop)
+        finally:
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            for handler in handlers:
+                root.addHandler(handler)
+            root.setLevel(level)
+        self.assertEqual([record.getMessage() for record in written.buffer], ["Written"])
+
+    def test_summary(self):
+        """Tests occurrences are logged as a single summary per interval."""
+        summary = LogSummary("Renewed", interval=10.0, logger=self.logger)
+        with patch("time.monotonic", return_value=summary._started + 1.0):  # pylint:disable=protected-access
+            for key in ("a", "b", "a"):
+                summary(key)
+        self.assertEqual(self.records.buffer, [])
+        with patch("time.monotonic", return_value=summary._started + 11.0):  # pylint:disable=protected-access
+            summary("c")
+        self.assertEqual([record.getMessage() for record in self.records.buffer],
+            ["Renewed: 4 times in the last 11 s ('a' 2, 'b' 1, 'c' 1)"])
+        summary.flush()
+        self.assertEqual(len(self.records.buffer), 1)
+
+    def test_summary_debug(self):
+        """Tests every occurrence is logged at debug level."""
+        self.logger.setLevel(logging.DEBUG)
+        summary = LogSummary("Renewed", logger=self.logger)
+        summary("a")
+        summary("b")
+        self.assertEqual([record.getMessage() for record in self.records.buffer],
+            ["Renewed: 'a'", "Renewed: 'b'"])
+        summary.flush()
+        self.assertIn("2 times", self.records.buffer[-1].getMessage())
+
+    def test_counter_summary(self):
+        """Tests the requests counted since the last summary are logged."""
+        counters = {"getAuthenticator": Counter(), "getCatalog": Counter()}
+        counters["getCatalog"].inc(5)
+        summary = CounterSummary("Lookups", counters, logger=self.logger)
+        counters["getAuthenticator"].inc(3)
+        counters["getCatalog"].inc()
+        summary.flush(now=summary._started + 10.0)  # pylint:disable=protected-access
+        summary.flush()
+        self.assertEqual([record.getMessage() for record in self.records.buffer],
+            ["Lookups: 4 times in the last 10 s ('getAuthenticator' 3, 'getCatalog' 1)"])
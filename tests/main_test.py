@@ -1,19 +1,14 @@
 """Module containing tests for Main service class."""
 
+import time
 import unittest
 from unittest.mock import patch, MagicMock
-from iceflix.main import Main
-try:
-    import IceFlix
-
-except ImportError:
-    import os
-    import Ice
-
-    Ice.loadSlice(os.path.join(os.path.dirname(__file__), "../iceflix/iceflix.ice"))
+import Ice
+from iceflix.balancing import RandomPolicy
+from iceflix.main import RESPONSE_TIME, Main, MainUpdates
+import IceFlix  # pylint:disable=import-error,wrong-import-order
 
 SERVICE_ID = "test_id"
-RESPONSE_TIME = 10
 
 
 class MainTesting(unittest.TestCase):
@@ -23,111 +18,375 @@ class MainTesting(unittest.TestCase):
         self.main = Main()
 
     def tearDown(self):
-        self.main.service_timer.cancel()
+        self.main.shutdown()
 
     @patch('IceFlix.AuthenticatorPrx')
     def test_get_authenticator(self, mock_proxy):
-        """Test getAuthenticator() method with only an offline Authenticator proxy,
-        an online Authenticator proxy and no services saved in cache."""
+        """Test getAuthenticator() method with an online Authenticator proxy, an offline
+        Authenticator proxy and no services saved in cache."""
         # No proxies saved
         self.assertFalse(self.main.authenticator_services)
         with self.assertRaises(IceFlix.TemporaryUnavailable):
             self.main.getAuthenticator()
         # Saved proxy
-        self.main.authenticator_services[SERVICE_ID] = [mock_proxy, RESPONSE_TIME]
-        self.assertEqual(self.main.authenticator_services[SERVICE_ID],
-            [mock_proxy, RESPONSE_TIME])
-        online_flag = True
-        for _ in range(2):
-            with patch('IceFlix.AuthenticatorPrx.ice_ping') as mock_ice_ping:
-                # Online service
-                if online_flag:
-                    mock_ice_ping.return_value = None
-                    self.assertEqual(self.main.getAuthenticator(), mock_proxy)
-                    online_flag = False
-                # Offline service
-                else:
-                    mock_ice_ping.side_effect = Exception
-                    with self.assertRaises(IceFlix.TemporaryUnavailable):
-                        self.main.getAuthenticator()
-                    self.assertFalse(self.main.catalog_services)
+        self.assertTrue(self.main.register_service(self.main.authenticator_services, SERVICE_ID,
+            mock_proxy))
+        self.assertEqual(self.main.authenticator_services[SERVICE_ID].proxy, mock_proxy)
+        # Online service
+        self.assertEqual(self.main.getAuthenticator(), mock_proxy)
+        mock_proxy.ice_ping.assert_not_called()
+        # Offline service
+        self.main.authenticator_services[SERVICE_ID].healthy = False
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getAuthenticator()
+        self.assertIn(SERVICE_ID, self.main.authenticator_services)
 
     @patch('IceFlix.MediaCatalogPrx')
     def test_get_catalog(self, mock_proxy):
-        """Test getCatalog() method with an offline MediaCatalog proxy, an
-        online MediaCatalog proxy and no services saved in cache."""
+        """Test getCatalog() method with an online MediaCatalog proxy, an offline
+        MediaCatalog proxy and no services saved in cache."""
         # No proxies saved
         self.assertFalse(self.main.catalog_services)
         with self.assertRaises(IceFlix.TemporaryUnavailable):
             self.main.getCatalog()
         # Saved proxy
-        self.main.catalog_services[SERVICE_ID] = [mock_proxy, RESPONSE_TIME]
-        self.assertEqual(self.main.catalog_services[SERVICE_ID],
-            [mock_proxy, RESPONSE_TIME])
-        online_flag = True
-        for _ in range(2):
-            with patch('IceFlix.MediaCatalogPrx.ice_ping') as mock_ice_ping:
-                # Online
-                if online_flag:
-                    mock_ice_ping.return_value = None
-                    self.assertEqual(self.main.getCatalog(), mock_proxy)
-                    online_flag = False
-                # Offline
-                else:
-                    mock_ice_ping.return_value = None
-                    mock_ice_ping.side_effect = Exception
-                    with self.assertRaises(IceFlix.TemporaryUnavailable):
-                        self.main.getCatalog()
-                    self.assertFalse(self.main.catalog_services)
+        self.assertTrue(self.main.register_service(self.main.catalog_services, SERVICE_ID,
+            mock_proxy))
+        self.assertEqual(self.main.catalog_services[SERVICE_ID].proxy, mock_proxy)
+        # Online service
+        self.assertEqual(self.main.getCatalog(), mock_proxy)
+        mock_proxy.ice_ping.assert_not_called()
+        # Offline service
+        self.main.catalog_services[SERVICE_ID].healthy = False
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getCatalog()
+        self.assertIn(SERVICE_ID, self.main.catalog_services)
 
     @patch('IceFlix.FileServicePrx')
     def test_get_file_service(self, mock_proxy):
-        """Test getFileService() method with an offline FileService proxy, an
-        online FileService proxy and no services saved in cache."""
+        """Test getFileService() method with an online FileService proxy, an offline
+        FileService proxy and no services saved in cache."""
         # No proxies saved
         self.assertFalse(self.main.file_services)
         with self.assertRaises(IceFlix.TemporaryUnavailable):
             self.main.getFileService()
         # Saved proxy
-        self.main.file_services[SERVICE_ID] = [mock_proxy, RESPONSE_TIME]
-        self.assertEqual(self.main.file_services[SERVICE_ID],
-            [mock_proxy, RESPONSE_TIME])
-        online_flag = True
-        for _ in range(2):
-            with patch('IceFlix.FileServicePrx.ice_ping') as mock_ice_ping:
-                # Online
-                if online_flag:
-                    mock_ice_ping.return_value = None
-                    self.assertEqual(self.main.getFileService(), mock_proxy)
-                    online_flag = False
-                # Offline
-                else:
-                    mock_ice_ping.side_effect = Exception
-                    with self.assertRaises(IceFlix.TemporaryUnavailable):
-                        self.main.getFileService()
-                    self.assertFalse(self.main.file_services)
-
-    def test_check_timeouts(self):
-        """Tests check_timeouts() method with both unexpired proxys and proxys
-        which will be expired in one second saved in cache."""
+        self.assertTrue(self.main.register_service(self.main.file_services, SERVICE_ID,
+            mock_proxy))
+        self.assertEqual(self.main.file_services[SERVICE_ID].proxy, mock_proxy)
+        # Online service
+        self.assertEqual(self.main.getFileService(), mock_proxy)
+        mock_proxy.ice_ping.assert_not_called()
+        # Offline service
+        self.main.file_services[SERVICE_ID].healthy = False
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getFileService()
+        self.assertIn(SERVICE_ID, self.main.file_services)
+
+    def test_waiting_lookup(self):
+        """Test getCatalog() method waits for a service to become online when
+        lookups are allowed to wait, and fails once the time is over."""
+        self.main.pending_lookups.wait = 5.0
+        future = self.main.getCatalog()
+        self.assertFalse(future.done())
+        mock_proxy = MagicMock()
+        self.main.register_service(self.main.catalog_services, SERVICE_ID, mock_proxy)
+        self.assertEqual(future.result(1), mock_proxy)
+        self.assertEqual(len(self.main.pending_lookups), 0)
+        # Offline service
+        self.main.catalog_services.set_health(self.main.catalog_services[SERVICE_ID], False)
+        self.main.pending_lookups.wait = 0.01
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getCatalog().result(5)
+
+    def test_get_services(self):
+        """Test getServices() method with no services and with only some kinds
+        of services saved in cache."""
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getServices()
+        auth_proxy, file_proxy = MagicMock(), MagicMock()
+        self.main.register_service(self.main.authenticator_services, "auth", auth_proxy)
+        self.main.register_service(self.main.file_services, "file", file_proxy)
+        bundle = self.main.getServices()
+        self.assertEqual(bundle.authenticator, auth_proxy)
+        self.assertIsNone(bundle.catalog)
+        self.assertEqual(bundle.fileService, file_proxy)
+
+    def test_get_candidates(self):
+        """Test getCandidates() method returns up to the requested number of
+        online services, and nothing while the version does not change."""
+        kind = IceFlix.ServiceKind.MediaCatalogKind
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getCandidates(kind, 2, 0)
+        for service_id in ("a", "b", "c"):
+            self.main.register_service(self.main.catalog_services, service_id, MagicMock())
+        candidates = self.main.getCandidates(kind, 2, 0)
+        self.assertEqual(len(candidates.services), 2)
+        self.assertEqual(len(self.main.getCandidates(kind, 0, 0).services), 3)
+        # Unchanged registry
+        unchanged = self.main.getCandidates(kind, 2, candidates.version)
+        self.assertEqual(unchanged.version, candidates.version)
+        self.assertFalse(unchanged.services)
+        # Changed registry
+        self.main.catalog_services.set_health(self.main.catalog_services["a"], False)
+        changed = self.main.getCandidates(kind, 0, candidates.version)
+        self.assertNotEqual(changed.version, candidates.version)
+        self.assertEqual(len(changed.services), 2)
+
+    def test_configure(self):
+        """Tests configure() method sets the balancing policy of every registry,
+        and service_stats() reports the choices made."""
+        properties = MagicMock()
+        properties.getPropertyWithDefault.side_effect = lambda key, default: \
+            "random" if key == "Main.Balancing" else default
+        self.main.configure(properties)
+        for registry in self.main.registries.values():
+            self.assertIsInstance(registry.policy, RandomPolicy)
+        self.main.register_service(self.main.catalog_services, SERVICE_ID, MagicMock())
+        self.main.getCatalog()
+        stats = self.main.service_stats()
+        self.assertEqual(stats["MediaCatalog"][0]["service_id"], SERVICE_ID)
+        self.assertEqual(stats["MediaCatalog"][0]["selected"], 1)
+        self.assertFalse(stats["Authenticator"])
+        text = self.main.metrics.expose()
+        self.assertIn(f'iceflix_service_selections{{kind="MediaCatalog",service="{SERVICE_ID}"}} 1',
+            text)
+        self.assertIn(f'iceflix_service_healthy{{kind="MediaCatalog",service="{SERVICE_ID}"}} 1',
+            text)
+
+    def test_metrics(self):
+        """Tests requests, expiries and registry sizes are recorded."""
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getCatalog()
+        self.main.register_service(self.main.catalog_services, SERVICE_ID, MagicMock())
+        self.main.getCatalog()
+        metrics = self.main.metrics
+        self.assertEqual(metrics.get("iceflix_requests_total", operation="getCatalog").value, 2)
+        self.assertEqual(
+            metrics.get("iceflix_unavailable_total", operation="getCatalog").value, 1)
+        self.assertEqual(metrics.get("iceflix_services", kind="MediaCatalog").value, 1)
+        self.main.catalog_services[SERVICE_ID].deadline = time.monotonic()
+        self.main.expire_service((self.main.catalog_services, SERVICE_ID))
+        self.assertEqual(metrics.get("iceflix_expiries_total", kind="MediaCatalog").value, 1)
+        self.assertIn('iceflix_services{kind="MediaCatalog"} 0', metrics.expose())
+
+    def test_expire_service(self):
+        """Tests expire_service() method with both unexpired proxies and proxies
+        whose expiry time has been reached saved in cache."""
         obj = MagicMock()
         obj.name = 'object'
-        test_times = [RESPONSE_TIME, 1]
-        for test_time in test_times:
-            self.main.authenticator_services[SERVICE_ID] = [obj, test_time]
-            self.main.catalog_services[SERVICE_ID] = [obj, test_time]
-            self.main.file_services[SERVICE_ID] = [obj, test_time]
-            self.main.check_timeouts()
-            # Unexpired proxies
-            if test_time == RESPONSE_TIME:
-                self.assertEqual(self.main.authenticator_services[SERVICE_ID][1],
-                    test_time - 1)
-                self.assertEqual(self.main.catalog_services[SERVICE_ID][1],
-                    test_time - 1)
-                self.assertEqual(self.main.file_services[SERVICE_ID][1],
-                    test_time - 1)
-            # To-be-expired proxies
-            else:
-                self.assertFalse(self.main.authenticator_services)
-                self.assertFalse(self.main.catalog_services)
-                self.assertFalse(self.main.file_services)
+        registries = [self.main.authenticator_services, self.main.catalog_services,
+            self.main.file_services]
+        for registry in registries:
+            self.main.register_service(registry, SERVICE_ID, obj)
+            self.main.expire_service((registry, SERVICE_ID))
+        # Unexpired proxies
+        for registry in registries:
+            self.assertIn(SERVICE_ID, registry)
+        for registry in registries:
+            registry[SERVICE_ID].deadline = time.monotonic()
+            self.main.expire_service((registry, SERVICE_ID))
+        # Expired proxies
+        self.assertFalse(self.main.authenticator_services)
+        self.assertFalse(self.main.catalog_services)
+        self.assertFalse(self.main.file_services)
+
+    def test_get_file_service_for(self):
+        """Tests getFileServiceFor() only returns online FileServices holding the
+        media, and forgets the media of expired ones."""
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.main.getFileServiceFor("media")
+        self.main.register_media("first", ["media", "other"])
+        self.main.register_media("second", ["media"])
+        with self.assertRaises(IceFlix.TemporaryUnavailable):
+            self.main.getFileServiceFor("media")
+        first, second = MagicMock(), MagicMock()
+        self.main.register_service(self.main.file_services, "first", first)
+        self.main.register_service(self.main.file_services, "second", second)
+        self.assertEqual(self.main.getFileServiceFor("other"), first)
+        self.assertEqual({self.main.getFileServiceFor("media") for _ in range(4)},
+            {first, second})
+        self.main.file_services.set_health(self.main.file_services["first"], False)
+        self.assertEqual(self.main.getFileServiceFor("media"), second)
+        self.main.file_services["second"].deadline = time.monotonic()
+        self.main.expire_service((self.main.file_services, "second"))
+        self.assertEqual(self.main.media_index.holders("media"), ["first"])
+        self.main.register_media("first", ["other"])
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.main.getFileServiceFor("media")
+
+    def test_unknown_media_holder(self):
+        """Tests the media of a FileService which is never announced expire."""
+        self.main.register_media("unknown", ["media"])
+        self.main.expire_service((self.main.file_services, "unknown"))
+        with self.assertRaises(IceFlix.WrongMediaId):
+            self.main.getFileServiceFor("media")
+
+    @patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy)
+    def test_restore_services(self):
+        """Tests restored services are returned before being confirmed, and
+        removed if they do not implement the interface of their kind."""
+        futures = {"alive": Ice.Future(), "gone": Ice.Future()}
+        communicator = MagicMock()
+        communicator.stringToProxy.side_effect = lambda proxy: MagicMock(**{
+            "ice_invocationTimeout.return_value.ice_isAAsync.return_value": futures[proxy]})
+        restored = self.main.restore_services([("FileService", "alive", "alive", 0.0),
+            ("FileService", "gone", "gone", 0.0), ("Unknown", "other", "other", 0.0)],
+            communicator)
+        self.assertEqual(restored, 2)
+        self.assertIsNotNone(self.main.getFileService())
+        self.assertEqual(self.main.snapshot_services(), [])
+        futures["alive"].set_result(True)
+        futures["gone"].set_exception(Ice.ConnectionRefusedException())  # pylint:disable=no-member
+        self.assertEqual([service[:2] for service in self.main.snapshot_services()],
+            [("FileService", "alive")])
+        self.assertNotIn("gone", self.main.file_services)
+
+    @patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy)
+    def test_snapshot_lifetimes(self):
+        """Tests services are saved with the time they were last announced and
+        their lifetime, and restored for the rest of it."""
+        self.main.register_service(self.main.file_services, "batched", MagicMock(), 62.0)
+        [(_, _, _, last_seen, lifetime)] = self.main.snapshot_services()
+        self.assertAlmostEqual(last_seen, time.time(), delta=1.0)
+        self.assertAlmostEqual(lifetime, 62.0, delta=0.01)
+        restored = Main()
+        try:
+            restored.restore_services([
+                ("FileService", "recent", "recent", time.time() - 30.0, 62.0),
+                ("FileService", "overdue", "overdue", time.time() - 70.0, 62.0)],
+                MagicMock())
+            now = time.monotonic()
+            self.assertAlmostEqual(restored.file_services["recent"].deadline, now + 32.0,
+                delta=1.0)
+            self.assertAlmostEqual(restored.file_services["overdue"].deadline,
+                now + RESPONSE_TIME, delta=1.0)
+        finally:
+            restored.shutdown()
+
+    def test_announced_while_restoring(self):
+        """Tests a restored service announced before its confirmation is kept."""
+        future = Ice.Future()
+        proxy = MagicMock(**{
+            "ice_invocationTimeout.return_value.ice_isAAsync.return_value": future})
+        communicator = MagicMock(**{"stringToProxy.return_value": proxy})
+        with patch('IceFlix.MediaCatalogPrx.uncheckedCast', new=lambda proxy: proxy):
+            self.main.restore_services([("MediaCatalog", SERVICE_ID, "proxy", 0.0)],
+                communicator)
+        self.main.register_service(self.main.catalog_services, SERVICE_ID, proxy)
+        future.set_result(False)
+        self.assertTrue(self.main.catalog_services[SERVICE_ID].verified)
+
+
+class ReplicatedMainTesting(unittest.TestCase):
+    """Tests the methods of Main class sharing its registry with other Main
+    services."""
+
+    def setUp(self):
+        self.main = Main()
+        self.main.peers.own_id = "own"
+        self.main.updates = MagicMock()
+        self.main.register_service(self.main.peers.registry, "other", MagicMock())
+        self.owned, self.foreign = (next(service_id for number in range(100)
+            if self.main.peers.owns(service_id := f"service{number}") == owned)
+            for owned in (True, False))
+
+    def tearDown(self):
+        self.main.shutdown()
+
+    def test_announced_peer(self):
+        """Tests only other Main services are stored as peers."""
+        self.assertTrue(self.main.accepts_peer("third"))
+        self.assertFalse(self.main.accepts_peer("own"))
+        self.main.updates = None
+        self.assertFalse(self.main.accepts_peer("third"))
+
+    def test_resolution(self):
+        """Tests a service probed by another Main is left to it, unless
+        announced twice, and is stored when the other Main shares it."""
+        self.assertTrue(self.main.should_resolve(self.owned))
+        self.assertFalse(self.main.should_resolve(self.foreign))
+        self.assertTrue(self.main.should_resolve(self.foreign))
+        self.assertFalse(self.main.should_resolve(self.foreign))
+        proxy = MagicMock()
+        with patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy):
+            self.main.store_resolved("FileService", self.foreign, proxy)
+        self.assertEqual(self.main.getFileService(), proxy)
+        self.assertNotIn(self.foreign, self.main.deferred)
+        self.main.publish_resolved("FileService", self.owned, proxy, 62.0)
+        self.main.updates.servicesResolved.assert_called_once_with([IceFlix.ResolvedService(
+            IceFlix.ServiceKind.FileServiceKind, proxy, self.owned, 62.0)], "own")
+
+    def test_resolved_lifetime(self):
+        """Tests a service shared by another Main is kept for the lifetime it
+        has left there, and expired ones are not stored."""
+        with patch('IceFlix.FileServicePrx.uncheckedCast', new=lambda proxy: proxy):
+            MainUpdates(self.main).servicesResolved([
+                IceFlix.ResolvedService(IceFlix.ServiceKind.FileServiceKind, MagicMock(),
+                    self.foreign, 50.0),
+                IceFlix.ResolvedService(IceFlix.ServiceKind.FileServiceKind, MagicMock(),
+                    "expired", -1.0)], "other")
+        self.assertGreater(self.main.file_services[self.foreign].deadline,
+            time.monotonic() + 49.0)
+        self.assertNotIn("expired", self.main.file_services)
+
+    def test_share_registry(self):
+        """Tests a Main joining gets the services probed until then."""
+        registry = self.main.catalog_services
+        for number in range(40):
+            self.main.register_service(registry, f"service{number}", MagicMock(), 30.0)
+        owned = {entry.service_id for entry in registry.snapshot()
+            if self.main.peers.owns(entry.service_id)}
+        self.main.register_service(self.main.peers.registry, "joined", MagicMock())
+        self.main.share_registry("joined")
+        [services, own_id] = self.main.updates.servicesResolved.call_args[0]
+        self.assertEqual(own_id, "own")
+        self.assertEqual({service.serviceId for service in services}, owned)
+        self.assertTrue(all(29.0 < service.lifetime <= 30.0 for service in services))
+
+    def test_failed_peer(self):
+        """Tests the services of a Main which fails its health checks are
+        taken over by the others."""
+        self.assertFalse(self.main.peers.owns(self.foreign))
+        peers = self.main.peers.registry
+        peers.set_health(peers["other"], False)
+        self.assertTrue(self.main.peers.owns(self.foreign))
+
+    def test_verdicts(self):
+        """Tests the health of the probed services is shared when it changes,
+        and the health of the others taken from the verdicts of other Main
+        services."""
+        registry = self.main.catalog_services
+        for service_id in (self.owned, self.foreign):
+            self.main.register_service(registry, service_id, MagicMock())
+        registry[self.owned].next_probe = time.monotonic() + 10
+        registry[self.owned].rtt = 0.5
+        with patch.object(self.main.health_prober, "probe"), \
+                patch.object(self.main.peer_prober, "probe"):
+            self.main.probe()
+            self.main.probe()
+            registry[self.owned].rtt = 0.55
+            self.main.probe()
+            self.main.updates.healthVerdicts.assert_called_once_with([IceFlix.ServiceHealth(
+                IceFlix.ServiceKind.MediaCatalogKind, self.owned, True, 0.5)], "own")
+            registry.set_health(registry[self.owned], False)
+            self.main.probe()
+            self.main.updates.healthVerdicts.assert_called_with([IceFlix.ServiceHealth(
+                IceFlix.ServiceKind.MediaCatalogKind, self.owned, False, 0.55)], "own")
+        self.main.apply_verdicts([IceFlix.ServiceHealth(IceFlix.ServiceKind.MediaCatalogKind,
+            service_id, service_id == self.owned, 0.25)
+            for service_id in (self.owned, self.foreign)])
+        self.assertFalse(registry[self.owned].healthy)
+        self.assertFalse(registry[self.foreign].healthy)
+        self.assertEqual(registry[self.foreign].rtt, 0.25)
+
+    def test_unpublished_verdicts(self):
+        """Tests the health checks go on when the verdicts cannot be shared."""
+        self.main.updates.healthVerdicts.side_effect = Ice.ConnectionRefusedException()  # pylint:disable=no-member
+        registry = self.main.catalog_services
+        self.main.register_service(registry, self.owned, MagicMock())
+        registry[self.owned].next_probe = time.monotonic() + 10
+        with patch.object(self.main.health_prober, "probe"), \
+                patch.object(self.main.peer_prober, "probe"):
+            self.main.probe()
+        self.main.updates.healthVerdicts.assert_called_once()
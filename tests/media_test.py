@@ -0,0 +1,51 @@
+"""Module containing tests for MediaIndex class."""
+
+import unittest
+from iceflix.media import MediaIndex
+
+
+class MediaIndexTesting(unittest.TestCase):
+    """Tests methods from MediaIndex class."""
+
+    def setUp(self):
+        self.index = MediaIndex()
+
+    def test_holders(self):
+        """Tests the holders of a media are every service announcing it."""
+        self.index.replace("first", ["shared", "own"])
+        self.index.replace("second", ["shared"])
+        self.index.replace("second", ["shared"])
+        self.assertEqual(sorted(self.index.holders("shared")), ["first", "second"])
+        self.assertEqual(self.index.holders("own"), ["first"])
+        self.assertIsNone(self.index.holders("unknown"))
+        self.assertEqual(len(self.index), 2)
+
+    def test_remove_service(self):
+        """Tests removing a service only forgets the media no other service holds."""
+        self.index.replace("first", ["shared", "own"])
+        self.index.replace("second", ["shared"])
+        self.assertEqual(self.index.remove_service("first"), 2)
+        self.assertEqual(self.index.holders("shared"), ["second"])
+        self.assertNotIn("own", self.index)
+        self.assertEqual(self.index.remove_service("first"), 0)
+
+    def test_replace(self):
+        """Tests an announcement replaces the media held by its service."""
+        self.index.replace("first", ["shared", "own"])
+        self.index.replace("second", ["shared"])
+        self.assertEqual(self.index.replace("first", ["shared", "new"]), (1, 1))
+        self.assertNotIn("own", self.index)
+        self.assertEqual(self.index.holders("new"), ["first"])
+        self.assertEqual(self.index.replace("second", []), (0, 1))
+        self.assertEqual(self.index.holders("shared"), ["first"])
+        self.assertEqual(self.index.services, 1)
+
+    def test_slot_reuse(self):
+        """Tests the slot of a removed service is reused by a new one."""
+        self.index.replace("first", ["media"])
+        self.index.replace("second", ["media"])
+        self.index.remove_service("first")
+        self.index.replace("third", ["other"])
+        self.assertEqual(self.index.services, 2)
+        self.assertEqual(self.index.holders("other"), ["third"])
+        self.assertEqual(self.index.holders("media"), ["second"])
@@ -0,0 +1,73 @@
+"""Module containing tests for the metrics of the Main service."""
+
+import threading
+import unittest
+import urllib.request
+from iceflix.metrics import Histogram, Metrics, MetricsServer
+
+
+class MetricsTesting(unittest.TestCase):
+    """Tests the recording and exposition of metrics."""
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counter_threads(self):
+        """Tests a counter adds up the increments made by several threads."""
+        counter = self.metrics.counter("test_total", "Test counter.")
+
+        def increment():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value, 4000)
+
+    def test_histogram(self):
+        """Tests a histogram counts the values in their buckets."""
+        histogram = Histogram((1, 2, 4))
+        for value in (0.5, 1, 3, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.quantile(0.5), 4)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+        self.assertEqual(histogram.samples("h", ())[:4], [
+            ("h_bucket", (("le", "1"),), 2),
+            ("h_bucket", (("le", "2"),), 2),
+            ("h_bucket", (("le", "4"),), 4),
+            ("h_bucket", (("le", "+Inf"),), 5),
+        ])
+
+    def test_expose(self):
+        """Tests the text exposition of labelled metrics."""
+        self.metrics.counter("requests_total", "Requests.", operation="a").inc(2)
+        self.metrics.gauge("services", "Services.", lambda: 3, kind="b")
+        text = self.metrics.expose()
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{operation="a"} 2\n', text)
+        self.assertIn('services{kind="b"} 3\n', text)
+
+    def test_gauge_set(self):
+        """Tests a set of gauges exposes the values it has when collected."""
+        values = [({"service": "a"}, 1), ({"service": "b"}, None)]
+        self.metrics.gauge_set("healthy", "Healthy.", lambda: values, kind="c")
+        self.assertIn('healthy{kind="c",service="a"} 1\n', self.metrics.expose())
+        self.assertNotIn('service="b"', self.metrics.expose())
+        values.append(({"service": "d"}, 0.5))
+        self.assertIn('healthy{kind="c",service="d"} 0.5\n', self.metrics.expose())
+
+    def test_server(self):
+        """Tests the HTTP server answers with the text exposition."""
+        self.metrics.counter("requests_total", "Requests.").inc()
+        server = MetricsServer(self.metrics, "127.0.0.1", 0)
+        server.start()
+        try:
+            host, port = server.address
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+                self.assertIn("requests_total 1", response.read().decode())
+        finally:
+            server.stop()
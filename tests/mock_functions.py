@@ -1,22 +1,42 @@
-"""Module containing mock functions which replace checkedCast() in tests."""
-
-def mock_auth_checked_cast(proxy):
-    """Checks if the mock proxy passed as an argument is mocking an
-    Authenticator proxy."""
-    if proxy.name == 'AuthenticatorPrx':
-        return proxy
-    return None
-
-def mock_catalog_checked_cast(proxy):
-    """Checks if the mock proxy passed as an argument is mocking a
-    MediaCatalog proxy."""
-    if proxy.name == 'MediaCatalogPrx':
-        return proxy
-    return None
-
-def mock_file_checked_cast(proxy):
-    """Checks if the mock proxy passed as an argument is mocking a
-    FileService proxy."""
-    if proxy.name == 'FileServicePrx':
-        return proxy
-    return None
+"""Module containing mock functions which replace remote calls in tests."""
+
+from concurrent.futures import Future
+from unittest.mock import MagicMock
+
+
+def mock_ids_future(type_ids):
+    """Returns a completed future with the type IDs passed as an argument,
+    as returned by ice_idsAsync()."""
+    future = Future()
+    future.set_result(type_ids)
+    return future
+
+
+def mock_failed_future(exception):
+    """Returns a future which failed with the exception passed as an argument."""
+    future = Future()
+    future.set_exception(exception)
+    return future
+
+
+def mock_service(type_id):
+    """Returns a mock proxy whose ice_idsAsync() answers with the type ID
+    passed as an argument."""
+    proxy = MagicMock()
+    proxy.ice_idsAsync.return_value = mock_ids_future(["::Ice::Object", type_id])
+    return proxy
+
+
+def mock_auth_service():
+    """Returns a mock proxy of an Authenticator service."""
+    return mock_service("::IceFlix::Authenticator")
+
+
+def mock_catalog_service():
+    """Returns a mock proxy of a MediaCatalog service."""
+    return mock_service("::IceFlix::MediaCatalog")
+
+
+def mock_file_service():
+    """Returns a mock proxy of a FileService service."""
+    return mock_service("::IceFlix::FileService")
@@ -0,0 +1,40 @@
+"""Module containing tests for MainPeers class."""
+
+import unittest
+from iceflix.peers import MainPeers
+
+SERVICES = [f"service{number}" for number in range(300)]
+
+
+class MainPeersTesting(unittest.TestCase):
+    """Tests methods from MainPeers class."""
+
+    def setUp(self):
+        self.peers = MainPeers("own")
+
+    def test_alone(self):
+        """Tests a Main without peers owns every service."""
+        self.assertTrue(all(self.peers.owns(service) for service in SERVICES))
+
+    def test_split(self):
+        """Tests every service is owned by a single Main, and the services are
+        split among them."""
+        others = [MainPeers(name) for name in ("first", "second")]
+        for peers in (self.peers, *others):
+            for name in ("own", "first", "second"):
+                if name != peers.own_id:
+                    peers.registry.add(name, None, 10.0)
+        for service in SERVICES:
+            self.assertEqual(sum(peers.owns(service) for peers in (self.peers, *others)), 1)
+        self.assertGreater(sum(map(self.peers.owns, SERVICES)), len(SERVICES) // 6)
+
+    def test_partial_view(self):
+        """Tests a service keeps its owner when a Main leaves, and the owner in
+        the complete view also owns it in a partial one."""
+        self.peers.registry.add("other", None, 10.0)
+        owned = {service for service in SERVICES if self.peers.owns(service)}
+        self.peers.registry.add("third", None, 10.0)
+        self.assertLessEqual({service for service in SERVICES if self.peers.owns(service)},
+            owned)
+        self.peers.registry.remove("third")
+        self.assertEqual({service for service in SERVICES if self.peers.owns(service)}, owned)
@@ -0,0 +1,76 @@
+"""Module containing tests for ServiceRegistry class."""
+
+import unittest
+from unittest.mock import MagicMock
+from iceflix.registry import ServiceRegistry
+
+DEADLINE = 10.0
+
+
+class ServiceRegistryTesting(unittest.TestCase):
+    """Tests methods from ServiceRegistry class."""
+
+    def setUp(self):
+        self.registry = ServiceRegistry("Authenticator")
+
+    def test_add(self):
+        """Tests add() method with a new service and an already stored one."""
+        proxy = MagicMock()
+        self.assertTrue(self.registry.add("a", proxy, DEADLINE))
+        self.registry["a"].deadline = 1
+        self.assertFalse(self.registry.add("a", proxy, DEADLINE))
+        self.assertEqual(self.registry["a"].deadline, DEADLINE)
+        self.assertEqual(len(self.registry), 1)
+
+    def test_remove(self):
+        """Tests remove() method keeps the remaining services reachable."""
+        for service_id in "abcd":
+            self.registry.add(service_id, MagicMock(), DEADLINE)
+        self.assertEqual(self.registry.remove("b").service_id, "b")
+        self.assertIsNone(self.registry.remove("b"))
+        self.assertNotIn("b", self.registry)
+        self.assertEqual({entry.service_id for entry in self.registry.snapshot()},
+            {"a", "c", "d"})
+        for entry in self.registry.snapshot():
+            self.assertIs(self.registry.snapshot()[entry.position], entry)
+
+    def test_round_robin(self):
+        """Tests next() method rotates over every stored service."""
+        self.assertIsNone(self.registry.next())
+        for service_id in "abc":
+            self.registry.add(service_id, MagicMock(), DEADLINE)
+        returned = [self.registry.next().service_id for _ in range(6)]
+        self.assertEqual(sorted(returned[:3]), ["a", "b", "c"])
+        self.assertEqual(returned[:3], returned[3:])
+
+    def test_snapshot_is_immutable(self):
+        """Tests snapshot() is not affected by later changes."""
+        self.registry.add("a", MagicMock(), DEADLINE)
+        snapshot = self.registry.snapshot()
+        self.registry.add("b", MagicMock(), DEADLINE)
+        self.assertEqual(len(snapshot), 1)
+        self.assertEqual(len(self.registry.snapshot()), 2)
+
+    def test_version(self):
+        """Tests the version changes when services are added, removed or change
+        their health state, but not when they are renewed."""
+        versions = [self.registry.version]
+        self.registry.add("a", MagicMock(), DEADLINE)
+        versions.append(self.registry.version)
+        self.registry.add("a", MagicMock(), DEADLINE)
+        self.assertEqual(self.registry.version, versions[-1])
+        self.assertTrue(self.registry.set_health(self.registry["a"], False))
+        self.assertFalse(self.registry.set_health(self.registry["a"], False))
+        versions.append(self.registry.version)
+        self.registry.remove("a")
+        versions.append(self.registry.version)
+        self.assertEqual(len(set(versions)), 4)
+
+    def test_candidates(self):
+        """Tests candidates() method only returns healthy services."""
+        for service_id in "abc":
+            self.registry.add(service_id, MagicMock(), DEADLINE)
+        self.registry.set_health(self.registry["b"], False)
+        self.assertEqual({entry.service_id for entry in self.registry.candidates(0)},
+            {"a", "c"})
+        self.assertEqual(len(self.registry.candidates(1)), 1)
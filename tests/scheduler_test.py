@@ -0,0 +1,69 @@
+"""Module containing tests for ExpiryScheduler class."""
+
+import threading
+import time
+import unittest
+from iceflix.scheduler import ExpiryScheduler
+
+
+class ExpirySchedulerTesting(unittest.TestCase):
+    """Tests methods from ExpiryScheduler class."""
+
+    def setUp(self):
+        self.now = 0.0
+        self.expired = []
+        self.scheduler = ExpiryScheduler(self.expired.append, clock=lambda: self.now)
+
+    def test_expiry(self):
+        """Tests run_pending() method only expires the keys which are due."""
+        self.scheduler.schedule("a", 1.0)
+        self.scheduler.schedule("b", 2.0)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.now = 1.5
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.expired, ["a"])
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.lag, 0.5)
+
+    def test_renewal(self):
+        """Tests schedule() method with a later deadline for a scheduled key
+        delays its expiry without growing the heap."""
+        self.scheduler.schedule("a", 1.0)
+        self.scheduler.schedule("a", 3.0)
+        self.assertEqual(self.scheduler.queue_size, 1)
+        self.now = 2.0
+        self.scheduler.run_pending()
+        self.assertFalse(self.expired)
+        self.now = 3.0
+        self.scheduler.run_pending()
+        self.assertEqual(self.expired, ["a"])
+        self.assertEqual(self.scheduler.queue_size, 0)
+
+    def test_earlier_deadline(self):
+        """Tests schedule() method with an earlier deadline for a scheduled key."""
+        self.scheduler.schedule("a", 3.0)
+        self.scheduler.schedule("a", 1.0)
+        self.now = 1.0
+        self.scheduler.run_pending()
+        self.assertEqual(self.expired, ["a"])
+        self.now = 3.0
+        self.scheduler.run_pending()
+        self.assertEqual(self.expired, ["a"])
+
+    def test_cancel(self):
+        """Tests cancel() method prevents a key from expiring."""
+        self.scheduler.schedule("a", 1.0)
+        self.scheduler.cancel("a")
+        self.now = 2.0
+        self.scheduler.run_pending()
+        self.assertFalse(self.expired)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_background_thread(self):
+        """Tests start() method expires keys from the background thread."""
+        expired = threading.Event()
+        scheduler = ExpiryScheduler(lambda key: expired.set())
+        scheduler.start()
+        scheduler.schedule("a", time.monotonic() + 0.05)
+        self.assertTrue(expired.wait(5))
+        scheduler.stop()
@@ -0,0 +1,38 @@
+"""Module containing tests for the snapshot file functions."""
+
+import os
+import tempfile
+import unittest
+from iceflix.snapshot import load_snapshot, save_snapshot
+
+SERVICES = [("FileService", "recent", "recent -t:tcp -p 1", 1000.0),
+            ("MediaCatalog", "old", "old -t:tcp -p 2", 900.0)]
+
+
+class SnapshotTesting(unittest.TestCase):
+    """Tests the snapshot file functions."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint:disable=consider-using-with
+        self.path = os.path.join(self.directory.name, "main.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """Tests only the services seen recently enough are loaded."""
+        save_snapshot(self.path, SERVICES)
+        self.assertEqual(load_snapshot(self.path, 200.0, now=1010.0), SERVICES)
+        self.assertEqual(load_snapshot(self.path, 60.0, now=1010.0), SERVICES[:1])
+
+    def test_unreadable(self):
+        """Tests a missing or damaged snapshot has no services, and only the
+        well-formed entries of a snapshot are loaded."""
+        self.assertEqual(load_snapshot(self.path), [])
+        for content in ("[[\"FileService\"", "{\"a\":1}", "[[\"FileService\",\"x\"]]",
+                        "[[\"FileService\",\"x\",\"x -t\",\"now\"]]"):
+            with open(self.path, "w", encoding="utf-8") as snapshot_file:
+                snapshot_file.write(content)
+            self.assertEqual(load_snapshot(self.path), [])
+        save_snapshot(self.path, [*SERVICES, ["FileService", "x"], 3])
+        self.assertEqual(load_snapshot(self.path, 200.0, now=1010.0), SERVICES)
@@ -0,0 +1,59 @@
+"""Module containing tests for TokenCache class."""
+
+import unittest
+from unittest.mock import MagicMock
+from iceflix.tokens import TokenCache
+import IceFlix  # pylint:disable=import-error,wrong-import-order
+
+
+class TokenCacheTesting(unittest.TestCase):
+    """Tests methods from TokenCache class."""
+
+    def setUp(self):
+        self.authenticator = MagicMock()
+        self.now = 0.0
+        self.tokens = TokenCache(lambda: self.authenticator, ttl=5.0, clock=lambda: self.now)
+
+    def test_cached_token(self):
+        """Tests a valid token is only checked once until it expires."""
+        self.authenticator.isAuthorized.return_value = True
+        for _ in range(10):
+            self.tokens.check_user("token")
+        self.authenticator.isAuthorized.assert_called_once_with("token")
+        self.now = 6.0
+        self.tokens.check_user("token")
+        self.assertEqual(self.authenticator.isAuthorized.call_count, 2)
+        self.assertEqual((self.tokens.hits, self.tokens.misses), (9, 2))
+
+    def test_invalid_token(self):
+        """Tests an invalid token is rejected and checked on every use."""
+        self.authenticator.isAuthorized.return_value = False
+        for _ in range(2):
+            with self.assertRaises(IceFlix.Unauthorized):
+                self.tokens.check_user("token")
+        self.assertEqual(self.authenticator.isAuthorized.call_count, 2)
+
+    def test_admin_token(self):
+        """Tests user and admin answers are cached separately."""
+        self.authenticator.isAuthorized.return_value = True
+        self.authenticator.isAdmin.return_value = False
+        self.tokens.check_user("token")
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.tokens.check_admin("token")
+
+    def test_revoke(self):
+        """Tests a revoked token is checked again."""
+        self.authenticator.isAuthorized.return_value = True
+        self.tokens.check_user("token")
+        self.tokens.revoke("token")
+        self.tokens.check_user("token")
+        self.assertEqual(self.authenticator.isAuthorized.call_count, 2)
+
+    def test_whois(self):
+        """Tests the user of a token is cached, and invalid tokens rejected."""
+        self.authenticator.whois.side_effect = ["user", IceFlix.Unauthorized()]
+        self.assertEqual(self.tokens.whois("token"), "user")
+        self.assertEqual(self.tokens.whois("token"), "user")
+        with self.assertRaises(IceFlix.Unauthorized):
+            self.tokens.whois("other")
+        self.assertEqual(self.authenticator.whois.call_count, 2)